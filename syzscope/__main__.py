@@ -1,15 +1,39 @@
 import argparse, os, stat, sys
+import glob
+import hashlib
+import queue
 from queue import Empty
 import json
 import multiprocessing, threading
 import gc
+import sqlite3
+import time
 
 sys.path.append(os.getcwd())
-from syzscope.modules import Crawler, Deployer
+from syzscope.modules import Crawler, Deployer, SyzbotMirror, MirrorServer
+from syzscope.modules.workerPool import PoolWorker, preload_for
 from subprocess import call
-from syzscope.interface.utilities import urlsOfCases, urlsOfCases, FOLDER, CASE
+from syzscope.interface.caseStore import CaseStore
+from syzscope.interface.caseQuery import CaseQuery, CaseIndex, parse_time
+from syzscope.interface.artifactPrefetcher import ArtifactPrefetcher
+from syzscope.interface.resourceScheduler import ResourceScheduler, stage_profiles
+from syzscope.interface.cgroupSlices import CgroupSlices
+from syzscope.interface.autoscaler import Autoscaler
+from syzscope.interface.stageTimes import StageTimes, CostModel, CaseQueue, features_of
+from syzscope.interface.workQueue import WorkQueue, default_node_name
+from syzscope.interface.runJournal import RunJournal
+from syzscope.interface.batchPlan import BatchPlan
+from syzscope.interface.kernelTrees import kernel_state, tree_state
+from syzscope.modules.deploy.case import max_qemu_for_one_case
+from syzscope.modules.deploy.deploy import pipeline_stages, enabled_stages
+from syzscope.interface.utilities import urlsOfCases, urlsOfCases, FOLDER, CASE, enable_http_cache, get_transport, request_get
 
-def args_parse():
+# -m when it is not given, every case
+max_default = '9999'
+# Set up by requirements.sh, see check_environment()
+toolchain_stamps = ['ENV_SETUP', 'BUILD_IMAGE', 'BUILD_GCC_CLANG', 'BUILD_LLVM', 'BUILD_STATIC_ANALYSIS', 'SETUP_PWNDBG', 'SETUP_GOLANG', 'SETUP_SYZKALLER']
+
+def args_parse(argv=None):
     parser = argparse.ArgumentParser(formatter_class=argparse.RawTextHelpFormatter,
                                      description='Analyze crash cases from syzbot\n'
                                                  'eg. python syzscope -i 7fd1cbe3e1d2b3f0366d5026854ee5754d451405\n'
@@ -21,7 +45,7 @@ def args_parse():
                         help='Indicate an URL for automatically crawling and running.\n'
                              '(default value is \'https://syzkaller.appspot.com/upstream/fixed\')')
     parser.add_argument('-m', '--max', nargs='?', action='store',
-                        default='9999',
+                        default=max_default,
                         help='The maximum of cases for retrieving\n'
                              '(By default all the cases will be retrieved)')
     parser.add_argument('-k', '--key', action='append',
@@ -35,6 +59,15 @@ def args_parse():
     parser.add_argument('-pm', '--parallel-max', nargs='?', action='store',
                         default='1', help='The maximum of parallel processes\n'
                                         '(default valus is 1)')
+    parser.add_argument('--autoscale', action='store_true',
+                        help='Adapt how many cases are in flight to the load of the host, between --parallel-min and --parallel-max.\n'
+                            'Every sample and decision is logged to work/autoscale.jsonl')
+    parser.add_argument('--parallel-min', nargs='?', action='store',
+                        default='1', help='The minimum of cases in flight with --autoscale\n'
+                                        '(default value is 1)')
+    parser.add_argument('--autoscale-interval', nargs='?',
+                        default='60', help='Seconds between two decisions of --autoscale\n'
+                                        '(default value is 60)')
     parser.add_argument('--force', action='store_true',
                         help='Force to run all cases even it has finished\n')
     parser.add_argument('--linux', nargs='?', action='store',
@@ -45,7 +78,7 @@ def args_parse():
                         help='Replay crashes of each case in one directory')
     parser.add_argument('--ssh', nargs='?',
                         default='33777',
-                        help='The default port of ssh using by QEMU\n'
+                        help='The default port of ssh using by QEMU, a free port after it is used if it is taken\n'
                         '(default value is 33777)')
     parser.add_argument('--ignore', nargs='?', action='store',
                         help='A file contains cases hashs which are ignored. One line for each hash.')
@@ -74,7 +107,12 @@ def args_parse():
                         help='Enable path guided symbolic execution')
     parser.add_argument('--use-cache',
                         action='store_true',
-                        help='Read cases from cache, this will overwrite the --input feild')
+                        help='Read cases from cache, this will overwrite the --input feild\n'
+                            'The cases of the last crawl run unless cached cases are picked by the arguments --query takes')
+    parser.add_argument('--incremental',
+                        action='store_true',
+                        help='Only retrieve cases that are new or changed since the last crawl in work/cases\n'
+                            'Unchanged cases are reused from the cache')
     parser.add_argument('--gdb', nargs='?',
                         default='1235',
                         help='Default gdb port for attaching')
@@ -118,8 +156,108 @@ def args_parse():
                         help='Include high risk bugs for analysis')
     parser.add_argument('--install-requirements', action='store_true',
                         help='Install required packages and compile essential tools')
+    parser.add_argument('--crawl-concurrency', nargs='?',
+                        default='1',
+                        help='The number of bug pages and reports fetched concurrently when crawling syzbot\n'
+                            '(default value is 1)')
+    parser.add_argument('--crawl-rate', nargs='?',
+                        default='10',
+                        help='The maximum of requests per second sent to each host when crawling\n'
+                            'Set it to 0 to disable rate limiting\n'
+                            '(default value is 10)')
+    parser.add_argument('--http-cache-size', nargs='?',
+                        default='2048',
+                        help='The maximum size(by MB) of the syzbot response cache in work/.http-cache\n'
+                            'Set it to 0 to disable the cache\n'
+                            '(default value is 2048)')
+    parser.add_argument('--bug-class', action='append',
+                        help='Only pick cached cases of a bug class, eg. uaf, uaf-write, oob, oob-write, double-free, warning\n'
+                            'This argument could be multiple values')
+    parser.add_argument('--manager', action='append',
+                        help='Only pick cached cases crashed on a syzbot manager, matched as a substring\n'
+                            'This argument could be multiple values')
+    parser.add_argument('--arch', choices=['amd64', 'i386'],
+                        help='Only pick cached cases of an architecture')
+    parser.add_argument('--since', nargs='?', action='store',
+                        help='Only pick cached cases whose crash happened after a date, eg. 2020-01-01')
+    parser.add_argument('--until', nargs='?', action='store',
+                        help='Only pick cached cases whose crash happened before a date, eg. 2021-06-30')
+    parser.add_argument('--query', action='store_true',
+                        help='Print the cached cases picked by -k, -m, -de, --bug-class, --manager, --arch, --since, --until,\n'
+                            '--filter-by-reported, --include-high-risk, --ignore and --ignore-batch, then exit')
+    parser.add_argument('--plan', action='store_true',
+                        help='Retrieve the cases of a batch, estimate its wall time, CPU, memory and disk under the\n'
+                            'parallelism arguments from the stage times in work/stage-times.jsonl, then exit without running it.\n'
+                            'Kernels, syzkallers, bitcode and stages that are already done are left out')
+    parser.add_argument('--worker-pool', action='store_true',
+                        help='Run cases in long-lived worker processes instead of a new process per case')
+    parser.add_argument('--worker-max-cases', nargs='?',
+                        default='20',
+                        help='Restart a pool worker after it ran this many cases\n'
+                            '(default value is 20)')
+    parser.add_argument('--worker-max-rss', nargs='?',
+                        default='4096',
+                        help='Restart a pool worker once its memory(by MB) grows past this, 0 means no limit\n'
+                            '(default value is 4096)')
+    parser.add_argument('--pipeline', action='store_true',
+                        help='Run the stages of different cases at the same time, eg. build one case while fuzzing another.\n'
+                            'Up to --parallel-max cases are in flight, each keeps its own kernel tree')
+    parser.add_argument('--stage-workers', nargs='?',
+                        help='How many cases each stage of --pipeline works on at once\n'
+                            'eg. --stage-workers build=2,fuzz=6,static=2,symbolic=4\n'
+                            '(By default --parallel-max for every stage)')
+    parser.add_argument('--schedule', nargs='?', choices=['fifo', 'sjf', 'lpt'],
+                        default='fifo',
+                        help='The order queued cases are picked up in\n'
+                            'fifo: the order they are retrieved\n'
+                            'sjf: shortest estimated case first, for early results\n'
+                            'lpt: longest estimated case first, for a short batch\n'
+                            'Estimates come from the stage times of earlier cases in work/stage-times.jsonl\n'
+                            '(default value is fifo)')
+    parser.add_argument('--coordinator', nargs='?', action='store',
+                        help='Crawl or pick cases as usual, but queue them in this SQLite database for --worker nodes\n'
+                            'instead of running them here. Exits once every case is done')
+    parser.add_argument('--worker', nargs='?', action='store',
+                        help='Run cases leased from the SQLite database of a --coordinator, eg. on a shared filesystem')
+    parser.add_argument('--node', nargs='?', action='store',
+                        help='Name of this node in --worker mode\n'
+                            '(By default hostname-pid)')
+    parser.add_argument('--lease-timeout', nargs='?',
+                        default='600',
+                        help='Seconds a leased case stays with a node that stopped sending heartbeats\n'
+                            '(default value is 600)')
+    parser.add_argument('--max-cores', nargs='?',
+                        help='CPU cores shared by kernel builds, static analysis and the rest of the stages of all cases, 0 means no limit\n'
+                            '(By default all cores of this host)')
+    parser.add_argument('--max-mem', nargs='?',
+                        help='Memory(by MB) shared by VMs, angr and the rest of the stages of all cases, 0 means no limit\n'
+                            '(By default 90%% of the memory of this host)')
+    parser.add_argument('--max-vcpus', nargs='?',
+                        help='KVM vCPUs shared by the VMs of all cases, 0 means no limit\n'
+                            '(By default one per core of this host)')
+    parser.add_argument('--max-disk', nargs='?',
+                        help='Scratch disk(by MB) shared by builds and fuzzing of all cases, 0 means no limit\n'
+                            '(By default the free space of work/ at startup)')
+    parser.add_argument('--cgroup', nargs='?', action='store', const='',
+                        help='Run every stage of every case in its own cgroup v2 slice under this cgroup, weighted and\n'
+                            'memory limited by its resource tokens. New stages wait while running ones stall on memory or I/O\n'
+                            '(By default the syzscope cgroup at the root of the cgroup v2 hierarchy)')
+    parser.add_argument('--snapshot', nargs='?', action='store',
+                        help='Mirror the list page, bug pages and artifacts of the selected cases into a directory and exit\n'
+                            'Cases are selected by the same arguments as crawling, eg. -k, -m, -u')
+    parser.add_argument('--serve-mirror', nargs='?', action='store',
+                        help='Serve a directory made by --snapshot at the syzbot url layout and exit on Ctrl-C\n'
+                            'Crawl it by -u http://127.0.0.1:PORT/upstream/fixed')
+    parser.add_argument('--mirror-port', nargs='?',
+                        default='8000',
+                        help='The port of the mirror server\n'
+                            '(default value is 8000)')
+    parser.add_argument('--resume', action='store_true',
+                        help='Go on with the batch that was interrupted, with the arguments it was started with.\n'
+                            'The cases it had left are queued again from work/journal.jsonl, cases in the middle\n'
+                            'of a stage go on from that stage on the kernel tree they had')
 
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
     return args
 
 def print_args_info(args):
@@ -148,6 +286,64 @@ def print_args_info(args):
         print("[-] invalid argument value time: {}".format(args.timeout_kernel_fuzzing))
         os._exit(1)
 
+    try:
+        int(args.crawl_concurrency)
+    except:
+        print("[-] invalid argument value crawl-concurrency: {}".format(args.crawl_concurrency))
+        os._exit(1)
+
+    try:
+        float(args.crawl_rate)
+    except:
+        print("[-] invalid argument value crawl-rate: {}".format(args.crawl_rate))
+        os._exit(1)
+
+    try:
+        int(args.http_cache_size)
+    except:
+        print("[-] invalid argument value http-cache-size: {}".format(args.http_cache_size))
+        os._exit(1)
+
+    try:
+        int(args.worker_max_cases)
+        int(args.worker_max_rss)
+    except:
+        print("[-] invalid argument value worker-max-cases/worker-max-rss: {} {}".format(args.worker_max_cases, args.worker_max_rss))
+        os._exit(1)
+
+    try:
+        if int(args.parallel_min) < 1 or int(args.parallel_min) > int(args.parallel_max) or int(args.autoscale_interval) < 1:
+            raise ValueError
+    except:
+        print("[-] invalid argument value parallel-min/autoscale-interval: {} {}".format(args.parallel_min, args.autoscale_interval))
+        os._exit(1)
+
+    try:
+        int(args.lease_timeout)
+    except:
+        print("[-] invalid argument value lease-timeout: {}".format(args.lease_timeout))
+        os._exit(1)
+
+    try:
+        parse_stage_workers(args.stage_workers, 1)
+    except:
+        print("[-] invalid argument value stage-workers: {}".format(args.stage_workers))
+        os._exit(1)
+
+    for name in ['max_cores', 'max_mem', 'max_vcpus', 'max_disk']:
+        try:
+            if getattr(args, name) != None:
+                int(getattr(args, name))
+        except:
+            print("[-] invalid argument value {}: {}".format(name.replace('_', '-'), getattr(args, name)))
+            os._exit(1)
+
+    try:
+        int(args.mirror_port)
+    except:
+        print("[-] invalid argument value mirror-port: {}".format(args.mirror_port))
+        os._exit(1)
+
 def check_kvm():
     proj_path = os.path.join(os.getcwd(), "syzscope")
     check_kvm_path = os.path.join(proj_path, "scripts/check_kvm.sh")
@@ -157,57 +353,493 @@ def check_kvm():
     if r == 1:
         exit(0)
 
-def cache_cases(cases):
-    work_path = os.getcwd()
-    cases_json_path = os.path.join(work_path, "work/cases.json")
-    with open(cases_json_path, 'w') as f:
-        json.dump(cases, f)
-        f.close()
-
-def read_cases_from_cache():
-    cases = {}
-    work_path = os.getcwd()
-    cases_json_path = os.path.join(work_path, "work/cases.json")
-    if os.path.exists(cases_json_path):
-        with open(cases_json_path, 'r') as f:
-            cases = json.load(f)
-            f.close()
-    return cases
+def read_lines(path):
+    res = []
+    if path != None:
+        with open(path, "r") as f:
+            text = f.readlines()
+            for line in text:
+                line = line.strip('\n')
+                res.append(line)
+    return res
+
+def query_cases(args, store, ignore, ignore_batch):
+    since = until = None
+    if args.since != None:
+        since = parse_time(args.since)
+        if since == None:
+            print("[-] invalid argument value since: {}".format(args.since))
+            sys.exit(1)
+    if args.until != None:
+        until = parse_time(args.until)
+        if until == None:
+            print("[-] invalid argument value until: {}".format(args.until))
+            sys.exit(1)
+    if int(args.filter_by_closed) != -1:
+        print("[-] cached cases don't record when they were closed, --filter-by-closed only works when crawling")
+        sys.exit(1)
+    limit = None
+    if args.max != max_default:
+        limit = int(args.max)
+    query = CaseQuery(keyword=args.key, bug_class=args.bug_class, manager=args.manager, arch=args.arch,
+        since=since, until=until, reported_within=int(args.filter_by_reported), deduplicate=args.deduplicate, ignore=ignore,
+        ignore_patch_of=ignore_batch, include_high_risk=args.include_high_risk, limit=limit)
+    if not query.narrows():
+        # Like the old work/cases.json, the cache holds the last crawl unless asked for more
+        query.hashes = store.last
+        print("[*] no filter given, picking from the {} cases of the last crawl".format(len(store.last)))
+    return CaseIndex(store.index).select(query)
 
-def deploy_one_case(index, args, hash_val):
-    case = crawler.cases[hash_val]
+def check_sources(args):
+    if args.input != None and args.use_cache:
+        print("Can not use cache when specifying inputs")
+        sys.exit(1)
+    if args.incremental and (args.input != None or args.use_cache or args.replay != None):
+        print("Incremental crawling only works on crawling from --url")
+        sys.exit(1)
+
+def plan_batch(args, state=None):
+    # Retrieves the cases like a batch would, with state the ones an
+    # interrupted batch had left, and estimates them without deploying
+    print_args_info(args)
+    args_dependencies()
+    check_sources(args)
+    if args.dynamic_validation:
+        args.symbolic_execution = True
+        args.static_analysis = True
+    build_work_dir()
+    store = CaseStore()
+    ignore = read_lines(args.ignore)
+    ignore_batch = read_lines(args.ignore_batch)
+    picked = []
+    seen = set(ignore)
+    if state != None:
+        seen.update(state.finished())
+    def pick(hash_val):
+        if hash_val not in seen:
+            seen.add(hash_val)
+            picked.append(hash_val)
+    if state != None:
+        for hash_val in state.remaining():
+            pick(hash_val)
+    if state != None and state.crawled:
+        pass
+    elif args.use_cache:
+        for key in query_cases(args, store, ignore, ignore_batch):
+            pick(key)
+    else:
+        get_transport(rate=float(args.crawl_rate))
+        if int(args.http_cache_size) > 0:
+            enable_http_cache(max_size=int(args.http_cache_size)*1024*1024)
+        crawler = Crawler(url=args.url, keyword=args.key, max_retrieve=int(args.max), deduplicate=args.deduplicate, ignore_batch=ignore_batch,
+            filter_by_reported=int(args.filter_by_reported), filter_by_closed=int(args.filter_by_closed), include_high_risk=args.include_high_risk,
+            concurrency=int(args.crawl_concurrency), index=store.index, debug=args.debug)
+        def store_picked(hash_val):
+            store.put(hash_val, crawler.cases[hash_val])
+            pick(hash_val)
+        crawler.sink = store_picked
+        if args.replay != None:
+            crawler.run_cases(urlsOfCases(args.replay))
+        elif args.input != None:
+            if len(args.input) == 40:
+                crawler.run_one_case(args.input)
+            else:
+                with open(args.input, 'r') as f:
+                    crawler.run_cases([line.strip('\n') for line in f.readlines()])
+        elif args.incremental:
+            crawler.run(previous=store)
+        else:
+            crawler.run()
+        store.save_index()
+    # Nothing runs, so no cgroup to set up
+    args.cgroup = None
+    resources = build_resource_scheduler(args)
+    parallel_max = int(args.parallel_max)
+    stages = enabled_stages(args.kernel_fuzzing, args.reproduce, args.static_analysis, args.symbolic_execution)
+    stage_workers = None
+    if args.pipeline:
+        stage_workers = parse_stage_workers(args.stage_workers, parallel_max)
+    trees = None
+    if args.linux != '-1':
+        trees = [int(args.linux)]
+    planner = BatchPlan(store, stages, build_cost_model(args), StageTimes().load(), resources.profiles, resources.capacity,
+        parallel_max, trees=trees, stage_workers=stage_workers, schedule=args.schedule, kernel_fuzzing=args.kernel_fuzzing, force=args.force)
+    print("[*] plan of {} cases, stages {}, schedule {}".format(len(picked), " ".join(stages), args.schedule))
+    for line in planner.format(planner.plan(picked)):
+        print("[*] {}".format(line))
+    if args.autoscale:
+        print("[*] --autoscale runs at most {} cases in flight, it may take longer".format(parallel_max))
+
+def snapshot_syzbot(args):
+    get_transport(rate=float(args.crawl_rate))
+    crawler = Crawler(url=args.url, keyword=args.key, max_retrieve=int(args.max), deduplicate=args.deduplicate,
+        filter_by_reported=int(args.filter_by_reported), filter_by_closed=int(args.filter_by_closed), include_high_risk=args.include_high_risk,
+        concurrency=int(args.crawl_concurrency), debug=args.debug)
+    if args.input != None:
+        if len(args.input) == 40:
+            crawler.run_one_case(args.input)
+        else:
+            with open(args.input, 'r') as f:
+                crawler.run_cases([line.strip('\n') for line in f.readlines()])
+        # cases are given, there is no list page to mirror
+        crawler.url = None
+    else:
+        crawler.run()
+    mirror = SyzbotMirror(args.snapshot)
+    n, total = mirror.snapshot(crawler)
+    print("[*] mirrored {} cases, {}/{} urls into {}".format(len(crawler.cases), n, total, args.snapshot))
+
+def serve_mirror(args):
+    server = MirrorServer(args.serve_mirror, port=int(args.mirror_port))
+    print("[*] serving {} at {}".format(args.serve_mirror, server.url))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+
+def deploy_case(index, args, hash_val, stages=None):
+    # 'continue', 'done' or 'error', see Deployer.deploy(). Only this
+    # case's record is loaded, not the whole catalog
+    case = store.load(hash_val)
+    if case == None:
+        print("[-] no record of case {} in {}, retrieve it again".format(hash_val, store.records_path))
+        return 'error'
     dp = Deployer(index=index, debug=args.debug, force=args.force, port=int(args.ssh), replay=args.replay, \
                 linux_index=int(args.linux), time=int(args.timeout_kernel_fuzzing), kernel_fuzzing=args.kernel_fuzzing, reproduce= args.reproduce, alert=args.alert, \
                 static_analysis=args.static_analysis, symbolic_execution=args.symbolic_execution, gdb_port=int(args.gdb), \
                 qemu_monitor_port=int(args.qemu_monitor), max_compiling_kernel=int(args.max_compiling_kernel_concurrently), \
                 timeout_dynamic_validation=args.timeout_dynamic_validation, timeout_static_analysis=args.timeout_static_analysis, \
                 timeout_symbolic_execution=args.timeout_symbolic_execution, parallel_max=int(args.parallel_max), \
-                guided=args.guided, be_bully=args.be_bully, se_poc=args.SE_PoC)
-    dp.deploy(hash_val, case)
+                guided=args.guided, be_bully=args.be_bully, se_poc=args.SE_PoC, resources=resources)
+    try:
+        res = dp.deploy(hash_val, case, stages)
+    finally:
+        dp.release_ports()
+    # A pool worker outlives the case, don't keep its log files open
+    for logger in [dp.case_logger, dp.case_info_logger]:
+        if logger == None:
+            continue
+        for handler in logger.handlers[:]:
+            handler.close()
+            logger.removeHandler(handler)
     del dp
+    return res
 
-def prepare_cases(index, args):
+def deploy_one_case(index, args, hash_val):
+    # All stages of the case, tells whether it went through
+    return deploy_case(index, args, hash_val) != 'error'
+
+def deploy_one_case_in_process(index, args, hash_val):
+    if not deploy_one_case(index, args, hash_val):
+        sys.exit(1)
+
+def deploy_stage(args, stage, item):
+    index, hash_val = item
+    return deploy_case(index, args, hash_val, [stage])
+
+# How a stage process exits, an exception exits with 1 as well
+stage_exitcodes = {'continue': 0, 'error': 1, 'done': 2}
+
+def deploy_stage_in_process(args, stage, item):
+    sys.exit(stage_exitcodes[deploy_stage(args, stage, item)])
+
+def stage_result(exitcode):
+    for res in stage_exitcodes:
+        if stage_exitcodes[res] == exitcode:
+            return res
+    return 'error'
+
+def run_stage(stage, n, args):
+    # Lord of one stage, a case keeps its kernel tree slot from building
+    # until its last stage is done
+    name = "{}-{}".format(stage, n)
+    worker = None
+    if args.worker_pool:
+        worker = PoolWorker(name, deploy_stage, args=(args, stage,),
+            max_cases=int(args.worker_max_cases), max_rss=int(args.worker_max_rss)*1024*1024, preload=preload_for([stage]))
+    first = stages[0] == stage
+    last = stages[-1] == stage
     while(1):
-        lock.acquire(blocking=True)
+        if first and autoscaler != None and not autoscaler.admits(parallel_max - free_slots.qsize()):
+            if upstream_done(stage) and g_cases.empty():
+                break
+            time.sleep(3)
+            continue
         try:
-            hash_val = g_cases.get(block=True, timeout=3)
-            if hash_val in ignore:
+            if first:
+                with free_slots.mutex:
+                    slots = list(free_slots.queue)
+                item = g_cases.get_matching(on_trees(slots), block=True, timeout=3)
+            else:
+                item = stage_queues[stage].get(block=True, timeout=3)
+        except Empty:
+            if upstream_done(stage):
+                break
+            continue
+        if first:
+            with lock:
                 rest.value -= 1
-                lock.release()
+                left = rest.value
+            if item in ignore:
+                case_finished(item, True, 'ignored')
+                continue
+            slot = pinned.pop(item, None)
+            if slot == None:
+                slot = take_slot(item)
+            item = (slot, item)
+            print("Thread {}: run case {} on linux-{} [{}/{}] left".format(name, item[1], item[0], left, total.value))
+        else:
+            print("Thread {}: {} case {} on linux-{}".format(name, stage, item[1], item[0]))
+        journal_event('start', hash=item[1], stage=stage, slot=item[0])
+        begin = time.time()
+        if worker != None:
+            res = worker.run(item) or 'error'
+        else:
+            x = multiprocessing.Process(target=deploy_stage_in_process, args=(args, stage, item,), name=name)
+            x.start()
+            x.join()
+            res = stage_result(x.exitcode)
+        gc.collect()
+        ok = res != 'error'
+        if work_queue != None:
+            work_queue.report_stage(item[1], stage, node, ok, time.time() - begin)
+        if res == 'continue' and not last:
+            journal_event('stage', hash=item[1], stage=stage, slot=item[0])
+            stage_queues[stages[stages.index(stage)+1]].put(item)
+        else:
+            remove_using_flag(item[0])
+            free_slots.put(item[0])
+            case_finished(item[1], ok)
+    if worker != None:
+        worker.stop()
+    with lock:
+        stage_lords[stage] -= 1
+        if stage_lords[stage] == 0:
+            stage_done[stage].set()
+    print("Thread {} exit->".format(name))
+
+def upstream_done(stage):
+    i = stages.index(stage)
+    if i == 0:
+        return crawl_done.is_set()
+    return stage_done[stages[i-1]].is_set()
+
+def parse_stage_workers(text, default):
+    res = {stage: default for stage in pipeline_stages}
+    if text == None:
+        return res
+    for each in text.split(','):
+        stage, n = each.split('=')
+        if stage not in res:
+            raise ValueError(stage)
+        res[stage] = int(n)
+        if res[stage] < 1:
+            raise ValueError(n)
+    return res
+
+def prepare_cases(index, args):
+    worker = None
+    if args.worker_pool:
+        worker = PoolWorker("lord-{}".format(index), deploy_one_case, args=(index, args,),
+            max_cases=int(args.worker_max_cases), max_rss=int(args.worker_max_rss)*1024*1024, preload=preload_for(stages))
+    while(1):
+        if len(resumed[index]) > 0:
+            # Interrupted on this lord's kernel tree
+            hash_val = resumed[index].pop(0)
+        elif autoscaler != None and not autoscaler.admits(index):
+            # Paused until the host has room for this lord again
+            if crawl_done.is_set() and g_cases.empty():
+                break
+            time.sleep(3)
+            continue
+        else:
+            try:
+                hash_val = g_cases.get_matching(on_trees([tree_of(index)]), block=True, timeout=3)
+            except Empty:
+                # The crawler may still be producing cases
+                if crawl_done.is_set():
+                    break
                 continue
-            print("Thread {}: run case {} [{}/{}] left".format(index, hash_val, rest.value-1, total))
+        with lock:
             rest.value -= 1
-            lock.release()
-            x = multiprocessing.Process(target=deploy_one_case, args=(index, args, hash_val,), name="lord-{}".format(i))
+            left = rest.value
+        if hash_val in ignore:
+            case_finished(hash_val, True, 'ignored')
+            continue
+        print("Thread {}: run case {} [{}/{}] left".format(index, hash_val, left, total.value))
+        journal_event('start', hash=hash_val, stage='case', slot=index)
+        if worker != None:
+            ok = worker.run(hash_val) == True
+        else:
+            x = multiprocessing.Process(target=deploy_one_case_in_process, args=(index, args, hash_val,), name="lord-{}".format(index))
             x.start()
             x.join()
-            gc.collect()
-            remove_using_flag(index)
-        except Empty:
-            lock.release()
-            break
+            ok = x.exitcode == 0
+        gc.collect()
+        remove_using_flag(index)
+        case_finished(hash_val, ok)
+    if worker != None:
+        worker.stop()
     print("Thread {} exit->".format(index))
 
+def tree_of(index):
+    if args.linux != '-1':
+        return int(args.linux)
+    return index
+
+def on_trees(indexes):
+    # Cases whose kernel one of these trees built last, they skip the
+    # checkout and most of the build
+    states = set([tree_state(index) for index in indexes])
+    states.discard(None)
+    return lambda hash_val: kernel_states.get(hash_val) in states
+
+def take_slot(hash_val):
+    # A free kernel tree that already holds the case's kernel, the first
+    # free one otherwise
+    state = kernel_states.get(hash_val)
+    if state != None:
+        with free_slots.mutex:
+            for slot in free_slots.queue:
+                if tree_state(slot) == state:
+                    free_slots.queue.remove(slot)
+                    return slot
+    return free_slots.get()
+
+def store_case(hash_val):
+    # The record must be on disk before a lord can pick the case up
+    store.put(hash_val, crawler.cases[hash_val])
+    enqueue_case(hash_val)
+
+def enqueue_case(hash_val):
+    with lock:
+        if hash_val in queued:
+            return
+        queued[hash_val] = True
+        total.value += 1
+        rest.value += 1
+    kernel_states[hash_val] = kernel_state(store.load(hash_val))
+    journal_event('queued', hash=hash_val)
+    if prefetcher != None:
+        prefetcher.submit(hash_val)
+    g_cases.put(hash_val)
+
+def case_finished(hash_val, ok, result=None):
+    journal_event('finished', hash=hash_val, ok=ok)
+    if work_queue == None:
+        return
+    if result == None:
+        result = outcome_of(hash_val)
+    if not work_queue.complete(hash_val, node, ok, result):
+        print("[-] lease of {} expired, its result is dropped".format(hash_val))
+    with lock:
+        in_flight.discard(hash_val)
+        # Requeued by the coordinator, it has to run again here
+        queued.pop(hash_val, None)
+
+def journal_event(event, **fields):
+    if journal != None:
+        journal.append(event, **fields)
+
+def resume_queue(state):
+    # Queue exactly what the interrupted run had left, cases that were in
+    # the middle of a stage first and on the kernel tree they were using
+    with lock:
+        for hash_val in state.finished():
+            queued[hash_val] = True
+    n = 0
+    for hash_val, stage, slot in state.started():
+        if slot >= parallel_max or (args.pipeline and stage not in stages):
+            continue
+        with lock:
+            queued[hash_val] = True
+            total.value += 1
+            if not args.pipeline or stage == stages[0]:
+                rest.value += 1
+        if not args.pipeline:
+            resumed[slot].append(hash_val)
+        elif stage == stages[0]:
+            pinned[hash_val] = slot
+            g_cases.put(hash_val)
+        else:
+            stage_queues[stage].put((slot, hash_val))
+        if args.pipeline and slot in free_slots.queue:
+            free_slots.queue.remove(slot)
+        n += 1
+    for hash_val in state.remaining():
+        enqueue_case(hash_val)
+    print("[*] resumed {} cases, {} of them in the middle of a stage, {} finished before".format(len(state.remaining()), n, len(state.finished())))
+
+def outcome_of(hash_val):
+    for catalog in ['succeed', 'completed', 'error']:
+        if os.path.isdir(os.path.join(os.getcwd(), "work", catalog, hash_val[:7])):
+            return catalog
+    return 'incomplete'
+
+def queue_for_nodes(hash_val):
+    # Coordinator sink, nodes get the whole record since they have no store of ours
+    if hash_val in ignore:
+        return
+    priority = 0
+    if args.schedule == 'sjf':
+        priority = estimate_cost(hash_val)
+    elif args.schedule == 'lpt':
+        priority = -estimate_cost(hash_val)
+    work_queue.push(hash_val, store.load(hash_val), priority)
+
+def store_case_for_nodes(hash_val):
+    store.put(hash_val, crawler.cases[hash_val])
+    queue_for_nodes(hash_val)
+
+def lease_cases(parallel_max):
+    # Keeps up to parallel_max leased cases in flight on this node
+    lease_time = int(args.lease_timeout)
+    try:
+        while True:
+            with lock:
+                n = len(in_flight)
+            if n < parallel_max and (autoscaler == None or autoscaler.admits(n)):
+                leased = work_queue.lease(node, lease_time)
+                if leased != None:
+                    hash_val, record = leased
+                    store.put(hash_val, record)
+                    with lock:
+                        in_flight.add(hash_val)
+                    enqueue_case(hash_val)
+                    continue
+                if n == 0 and work_queue.drained():
+                    break
+            time.sleep(5)
+    finally:
+        crawl_done.set()
+
+def send_heartbeats():
+    lease_time = int(args.lease_timeout)
+    while True:
+        with lock:
+            hashes = list(in_flight)
+        try:
+            work_queue.heartbeat(node, hashes, lease_time)
+        except sqlite3.Error as e:
+            print("[-] heartbeat failed: {}".format(e))
+        time.sleep(max(1, lease_time // 4))
+
+def autoscale():
+    autoscaler.sample()
+    while True:
+        time.sleep(autoscaler.interval)
+        before = autoscaler.limit
+        decision, sample = autoscaler.step()
+        if autoscaler.limit != before:
+            print("[*] autoscale: {} to {} cases in flight, {}".format(decision, autoscaler.limit, autoscaler.format(sample)))
+
+def coordinate():
+    while not work_queue.drained():
+        work_queue.requeue_expired()
+        print("[*] work queue: {}".format(work_queue.stats()))
+        time.sleep(60)
+    print("[*] work queue: {}".format(work_queue.stats()))
+
 def get_hash(path):
     ret = []
     log_path = os.path.join(path, "log")
@@ -237,6 +869,81 @@ def check_requirements():
     env_stamp = os.path.join(tools_path, ".stamp/ENV_SETUP")
     return os.path.isfile(env_stamp)
 
+def toolchain_state():
+    # Everything requirements.sh and check_kvm.sh look at: the scripts
+    # themselves, the stamps of the tools they set up and access to KVM
+    proj_path = os.getcwd()
+    state = []
+    for script in ["requirements.sh", "check_kvm.sh"]:
+        with open(os.path.join(proj_path, "syzscope/scripts", script), 'rb') as f:
+            state.append(hashlib.sha1(f.read()).hexdigest())
+    for stamp in toolchain_stamps:
+        state.append(os.path.isfile(os.path.join(proj_path, "tools/.stamp", stamp)))
+    state.append(os.path.exists("/usr/lib/x86_64-linux-gnu/libmpfr.so.4"))
+    state.append(os.access("/dev/kvm", os.R_OK | os.W_OK))
+    return hashlib.sha1(json.dumps(state).encode('utf-8')).hexdigest()
+
+def check_environment():
+    # The scripts only run again when the toolchain state changed since the
+    # last time they passed
+    env_stamp = os.path.join(os.getcwd(), "tools/.stamp/ENV_CHECKED")
+    try:
+        with open(env_stamp, 'r') as f:
+            if f.read() == toolchain_state():
+                clean_unfinished_jobs()
+                return True
+    except OSError:
+        pass
+    if install_requirments() != 0:
+        print("Fail to install requirements.")
+        return False
+    if not check_requirements():
+        print("No essential components found. Install them by --install-requirements")
+        return False
+    check_kvm()
+    with open(env_stamp, 'w') as f:
+        f.write(toolchain_state())
+    return True
+
+def clean_unfinished_jobs():
+    # What requirements.sh does on every run besides installing
+    tools_path = os.path.join(os.getcwd(), "tools")
+    for path in glob.glob(os.path.join(tools_path, "linux-*/.git/index.lock")) + glob.glob(os.path.join(tools_path, "linux-*/THIS_KERNEL_IS_BEING_USED")):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+def build_resource_scheduler(args):
+    capacity = {}
+    for kind, name in [('cores', 'max_cores'), ('mem', 'max_mem'), ('vcpu', 'max_vcpus'), ('disk', 'max_disk')]:
+        if getattr(args, name) != None:
+            capacity[kind] = int(getattr(args, name))
+    max_compiling = int(args.max_compiling_kernel_concurrently)
+    if max_compiling == -1:
+        max_compiling = int(args.parallel_max)
+    # deploy.sh builds with nproc/max_compiling jobs
+    build_cores = max(1, (os.cpu_count() or 1) // max(1, max_compiling))
+    profiles = stage_profiles(build_cores=build_cores, vm_count=max_qemu_for_one_case)
+    slices = None
+    if args.cgroup != None:
+        slices = CgroupSlices(args.cgroup or None)
+        if not slices.available:
+            print("[-] cgroup v2 slices are not available, stages run without them")
+            slices = None
+    return ResourceScheduler(capacity=capacity, profiles=profiles, slices=slices)
+
+def build_cost_model(args):
+    defaults = {'fuzz': int(args.timeout_kernel_fuzzing)*60*60}
+    if args.timeout_static_analysis != None:
+        defaults['static'] = int(args.timeout_static_analysis)
+    if args.timeout_symbolic_execution != None:
+        defaults['symbolic'] = int(args.timeout_symbolic_execution)
+    return CostModel.load(StageTimes(), defaults)
+
+def estimate_cost(hash_val):
+    return cost_model.estimate(features_of(hash_val, store.summary(hash_val)), stages)
+
 def build_work_dir():
     work_path = os.path.join(os.getcwd(), "work")
     os.makedirs(work_path, exist_ok=True)
@@ -255,80 +962,205 @@ def args_dependencies():
 
 if __name__ == '__main__':
     args = args_parse()
+    journal = None
+    state = None
+    if args.resume:
+        plan = args.plan
+        journal = RunJournal()
+        state = journal.replay()
+        if state.argv == None:
+            print("No interrupted batch to resume in {}".format(journal.path))
+            sys.exit(1)
+        print("[*] resume: {}".format(" ".join(state.argv)))
+        args = args_parse(state.argv)
+        args.resume = True
+        args.plan = plan
     if args.key == None:
         args.key = ['']
     if args.deduplicate == None:
         args.deduplicate = []
-    if install_requirments() != 0:
-        print("Fail to install requirements.")
-        exit(0)
+    # Mirroring syzbot needs none of the kernel tools
+    if args.serve_mirror != None:
+        serve_mirror(args)
+        sys.exit(0)
+    if args.snapshot != None:
+        snapshot_syzbot(args)
+        sys.exit(0)
+    if args.query:
+        store = CaseStore()
+        for hash_val in query_cases(args, store, read_lines(args.ignore), read_lines(args.ignore_batch)):
+            print("{} {}".format(hash_val, store.index[hash_val].get('title')))
+        sys.exit(0)
+    if args.get_hash != None:
+        get_hash(args.get_hash)
+        sys.exit(0)
+    # Planning reads what earlier runs left behind, it needs no tools
+    if args.plan:
+        plan_batch(args, state)
+        sys.exit(0)
     if args.install_requirements:
+        if install_requirments() != 0:
+            print("Fail to install requirements.")
         exit(0)
-    if not check_requirements():
-        print("No essential components found. Install them by --install-requirements")
+    if not check_environment():
         exit(0)
 
     print_args_info(args)
-    check_kvm()
     args_dependencies()
 
-    if args.get_hash != None:
-        get_hash(args.get_hash)
-        sys.exit(0)
-
-    ignore = []
     build_work_dir()
+    store = CaseStore()
+    # Capacity is measured once here, case processes inherit the scheduler
+    resources = build_resource_scheduler(args)
+    print("[*] resources: {}".format(resources.stats()))
+    get_transport(rate=float(args.crawl_rate))
+    http_cache = None
+    if int(args.http_cache_size) > 0:
+        http_cache = enable_http_cache(max_size=int(args.http_cache_size)*1024*1024)
     manager = multiprocessing.Manager()
-    if args.ignore != None:
-        with open(args.ignore, "r") as f:
-            text = f.readlines()
-            for line in text:
-                line = line.strip('\n')
-                ignore.append(line)
-    ignore_batch = []
-    if args.ignore_batch != None:
-        with open(args.ignore_batch, "r") as f:
-            text = f.readlines()
-            for line in text:
-                line = line.strip('\n')
-                ignore_batch.append(line)
-    if args.input != None and args.use_cache:
-        print("Can not use cache when specifying inputs")
-        sys.exit(1)
-    crawler = Crawler(url=args.url, keyword=args.key, max_retrieve=int(args.max), deduplicate=args.deduplicate, ignore_batch=ignore_batch,
-        filter_by_reported=int(args.filter_by_reported), filter_by_closed=int(args.filter_by_closed), include_high_risk=args.include_high_risk, debug=args.debug)
-    if args.replay != None:
-        for url in urlsOfCases(args.replay):
-            crawler.run_one_case(url)
-    elif args.input != None:
-        if len(args.input) == 40:
-            crawler.run_one_case(args.input)
-        else:
-            with open(args.input, 'r') as f:
-                text = f.readlines()
-                for line in text:
-                    line = line.strip('\n')
-                    crawler.run_one_case(line)
-    else:
-        if args.use_cache:
-            crawler.cases = read_cases_from_cache()
-        else:
-            crawler.run()
-    if not args.use_cache:
-        cache_cases(crawler.cases)
+    ignore = read_lines(args.ignore)
+    ignore_batch = read_lines(args.ignore_batch)
+    check_sources(args)
     if args.dynamic_validation:
         args.symbolic_execution = True
         args.static_analysis = True
     parallel_max = int(args.parallel_max)
-    parallel_count = 0
     lock = threading.Lock()
-    g_cases = manager.Queue()
-    for key in crawler.cases:
-        g_cases.put(key)
-    #g_cases = manager.list([crawler.cases[x] for x in crawler.cases])
-    l = list(crawler.cases.keys())
-    total = len(l)
-    rest = manager.Value('i', total)
-    for i in range(0,min(parallel_max,total)):
-        x = threading.Thread(target=prepare_cases, args=(i, args,), name="lord-{}".format(i))
-        x.start()
\ No newline at end of file
+    crawl_done = threading.Event()
+    stages = enabled_stages(args.kernel_fuzzing, args.reproduce, args.static_analysis, args.symbolic_execution)
+    cost_model = build_cost_model(args)
+    g_cases = CaseQueue(args.schedule, estimate_cost)
+    work_queue = None
+    node = None
+    in_flight = set()
+    autoscaler = None
+    if args.coordinator != None and args.worker != None:
+        print("A node is either the coordinator or a worker")
+        sys.exit(1)
+    if args.worker != None and (args.use_cache or args.input != None or args.replay != None):
+        print("Worker nodes only run cases leased from the coordinator")
+        sys.exit(1)
+    if args.resume and (args.coordinator != None or args.worker != None):
+        print("The work queue of --coordinator keeps the progress of distributed runs, there is nothing to resume")
+        sys.exit(1)
+    if args.coordinator != None:
+        work_queue = WorkQueue(args.coordinator)
+        # A coordinator restarted to add cases
+        work_queue.reopen()
+    if args.worker != None:
+        work_queue = WorkQueue(args.worker)
+        node = args.node or default_node_name()
+    queued = {}
+    kernel_states = {}
+    total = manager.Value('i', 0)
+    rest = manager.Value('i', 0)
+    prefetcher = None
+    if http_cache != None:
+        # Artifacts land in the http cache, scripts then copy them from there
+        prefetcher = ArtifactPrefetcher(request_get, store.load, concurrency=max(4, int(args.crawl_concurrency)))
+    crawler = Crawler(url=args.url, keyword=args.key, max_retrieve=int(args.max), deduplicate=args.deduplicate, ignore_batch=ignore_batch,
+        filter_by_reported=int(args.filter_by_reported), filter_by_closed=int(args.filter_by_closed), include_high_risk=args.include_high_risk,
+        concurrency=int(args.crawl_concurrency), sink=store_case, index=store.index, debug=args.debug)
+    if args.coordinator != None:
+        crawler.sink = store_case_for_nodes
+        try:
+            if args.use_cache:
+                for key in query_cases(args, store, ignore, ignore_batch):
+                    queue_for_nodes(key)
+            elif args.input != None:
+                if len(args.input) == 40:
+                    crawler.run_one_case(args.input)
+                else:
+                    with open(args.input, 'r') as f:
+                        crawler.run_cases([line.strip('\n') for line in f.readlines()])
+            elif args.incremental:
+                crawler.run(previous=store)
+            else:
+                crawler.run()
+            if not args.use_cache:
+                store.save_index()
+        finally:
+            work_queue.close()
+        coordinate()
+        sys.exit(0)
+    if args.autoscale:
+        autoscaler = Autoscaler(min(int(args.parallel_min), parallel_max), parallel_max, resources=resources,
+            interval=int(args.autoscale_interval))
+        threading.Thread(target=autoscale, name="autoscale", daemon=True).start()
+    if args.worker != None:
+        threading.Thread(target=send_heartbeats, name="heartbeat", daemon=True).start()
+        threading.Thread(target=lease_cases, args=(parallel_max,), name="lease").start()
+    # Cases picked up again by --resume
+    resumed = {i: [] for i in range(0, parallel_max)}
+    pinned = {}
+    crawled = False
+    if args.pipeline:
+        stage_workers = parse_stage_workers(args.stage_workers, parallel_max)
+        free_slots = queue.Queue()
+        for i in range(0, parallel_max):
+            free_slots.put(i)
+        stage_queues = {stage: queue.Queue() for stage in stages}
+        stage_queues[stages[0]] = g_cases
+        stage_done = {stage: threading.Event() for stage in stages}
+        stage_lords = {stage: stage_workers[stage] for stage in stages}
+    if args.resume:
+        state = journal.resume()
+        resume_queue(state)
+        crawled = state.crawled
+        if not crawled:
+            print("[*] the interrupted run was still retrieving cases, retrieving them again")
+    elif work_queue == None:
+        journal = RunJournal()
+        journal.start(sys.argv[1:], stages)
+    if args.use_cache and not crawled:
+        for key in query_cases(args, store, ignore, ignore_batch):
+            enqueue_case(key)
+        if not args.resume:
+            parallel_max = min(parallel_max, total.value)
+    # Lords start before crawling, every case is deployed as soon as it is retrieved
+    lords = []
+    if args.pipeline:
+        for stage in stages:
+            for i in range(0, stage_workers[stage]):
+                x = threading.Thread(target=run_stage, args=(stage, i, args,), name="{}-{}".format(stage, i))
+                x.start()
+                lords.append(x)
+    else:
+        for i in range(0, parallel_max):
+            x = threading.Thread(target=prepare_cases, args=(i, args,), name="lord-{}".format(i))
+            x.start()
+            lords.append(x)
+    try:
+        if args.use_cache or args.worker != None or crawled:
+            pass
+        elif args.replay != None:
+            crawler.run_cases(urlsOfCases(args.replay))
+        elif args.input != None:
+            if len(args.input) == 40:
+                crawler.run_one_case(args.input)
+            else:
+                with open(args.input, 'r') as f:
+                    text = f.readlines()
+                    crawler.run_cases([line.strip('\n') for line in text])
+        elif args.incremental:
+            crawler.run(previous=store)
+        else:
+            crawler.run()
+        if not args.use_cache and args.worker == None and not crawled:
+            store.save_index()
+        journal_event('crawled')
+        if http_cache != None:
+            print("[*] http cache: {}".format(http_cache.stats()))
+        print("[*] http transport: {}".format(get_transport().stats()))
+    finally:
+        # Let the lords exit once the queue drains, even if crawling failed,
+        # a worker node is done once the coordinator's queue drains
+        if args.worker == None:
+            crawl_done.set()
+    for x in lords:
+        x.join()
+    if prefetcher != None:
+        prefetcher.shutdown()
+        print("[*] artifact prefetch: {}".format(prefetcher.stats()))
+    if journal != None:
+        journal.close()
@@ -0,0 +1,53 @@
+import logging
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+
+# Everything deploying a case downloads from syzbot
+artifact_keys = ['config', 'syz_repro', 'c_repro', 'report', 'log']
+
+class ArtifactPrefetcher:
+    """
+    Downloads the artifacts of queued cases in the background, so they are
+    already in the http cache when a lord picks the case up. Cases are
+    prefetched in the order they were queued.
+    """
+    def __init__(self, fetch, load, concurrency=4, logger=None):
+        self.fetch = fetch
+        self.load = load
+        self.executor = ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="prefetch")
+        self.logger = logger
+        if self.logger == None:
+            self.logger = logging.getLogger(__name__)
+        self.lock = threading.Lock()
+        self.fetched = 0
+        self.failed = 0
+
+    def submit(self, hash_val):
+        return self.executor.submit(self.__prefetch_case, hash_val)
+
+    def shutdown(self, wait=True):
+        self.executor.shutdown(wait=wait)
+
+    def stats(self):
+        return "{} artifacts prefetched, {} failed".format(self.fetched, self.failed)
+
+    def __prefetch_case(self, hash_val):
+        case = self.load(hash_val)
+        if case == None:
+            return
+        for key in artifact_keys:
+            url = case.get(key)
+            if url == None:
+                continue
+            try:
+                r = self.fetch(url)
+                ok = r.status_code == 200
+            except Exception as e:
+                self.logger.error("Fail to prefetch {} of {}: {}".format(key, hash_val, e))
+                ok = False
+            with self.lock:
+                if ok:
+                    self.fetched += 1
+                else:
+                    self.failed += 1
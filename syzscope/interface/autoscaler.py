@@ -0,0 +1,84 @@
+import json
+import os
+import time
+
+# A host over any of the first limits sheds a case, one under all of the
+# second takes one more. load is the 1 minute load average per core, mem
+# the share of memory available, iowait the share of CPU time waiting on
+# I/O and vcpu the share of KVM vCPU tokens granted.
+overloaded = {'load': 1.5, 'mem': 0.1, 'iowait': 0.3, 'vcpu': 0.95}
+underloaded = {'load': 0.7, 'mem': 0.3, 'iowait': 0.1, 'vcpu': 0.75}
+
+def cpu_times():
+    with open("/proc/stat", 'r') as f:
+        fields = [int(each) for each in f.readline().split()[1:]]
+    # iowait is the fifth field
+    return fields[4], sum(fields)
+
+def mem_available():
+    info = {}
+    with open("/proc/meminfo", 'r') as f:
+        for line in f:
+            key, value = line.split(':', 1)
+            info[key] = int(value.split()[0])
+    return info.get('MemAvailable', info.get('MemFree', 0)) / max(info.get('MemTotal', 1), 1)
+
+class Autoscaler:
+    """
+    Decides how many cases may be in flight, between low and high. Every
+    interval seconds it samples the host and sheds one case when the host is
+    overloaded or takes one more when it is underloaded, starting from low.
+    Lords over the limit stop taking new cases, the ones they run finish.
+    Every sample and decision goes to work/autoscale.jsonl.
+    """
+    def __init__(self, low, high, resources=None, interval=60, path=None):
+        self.low = low
+        self.high = high
+        self.limit = low
+        self.resources = resources
+        self.interval = interval
+        self.path = path
+        if self.path == None:
+            self.path = os.path.join(os.getcwd(), "work/autoscale.jsonl")
+        self.last_cpu = None
+
+    def admits(self, n):
+        # n cases are in flight, or n is the index of the lord asking
+        return n < self.limit
+
+    def step(self):
+        sample = self.sample()
+        decision = self.decide(sample)
+        if decision == 'shed':
+            self.limit = max(self.low, self.limit - 1)
+        elif decision == 'take':
+            self.limit = min(self.high, self.limit + 1)
+        entry = {'time': int(time.time()), 'decision': decision, 'limit': self.limit}
+        entry.update(sample)
+        with open(self.path, 'a') as f:
+            f.write(json.dumps(entry) + "\n")
+        return decision, sample
+
+    def decide(self, sample):
+        if sample['load'] > overloaded['load'] or sample['mem'] < overloaded['mem'] or \
+            sample['iowait'] > overloaded['iowait'] or sample['vcpu'] > overloaded['vcpu']:
+            return 'shed'
+        if sample['load'] < underloaded['load'] and sample['mem'] > underloaded['mem'] and \
+            sample['iowait'] < underloaded['iowait'] and sample['vcpu'] < underloaded['vcpu']:
+            return 'take'
+        return 'hold'
+
+    def sample(self):
+        res = {'load': os.getloadavg()[0] / (os.cpu_count() or 1), 'mem': mem_available(), 'iowait': 0, 'vcpu': 0}
+        iowait, total = cpu_times()
+        if self.last_cpu != None and total > self.last_cpu[1]:
+            res['iowait'] = (iowait - self.last_cpu[0]) / (total - self.last_cpu[1])
+        self.last_cpu = (iowait, total)
+        if self.resources != None:
+            used, _, _ = self.resources.usage()
+            capacity = self.resources.capacity.get('vcpu', 0) or os.cpu_count() or 1
+            res['vcpu'] = used['vcpu'] / capacity
+        return {key: round(res[key], 3) for key in res}
+
+    def format(self, sample):
+        return "load {} mem {}% iowait {}% vcpu {}%".format(sample['load'], int(sample['mem']*100), int(sample['iowait']*100), int(sample['vcpu']*100))
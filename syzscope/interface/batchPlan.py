@@ -0,0 +1,193 @@
+import heapq
+import os
+
+from collections import deque
+
+from syzscope.interface.stageTimes import CostModel, features_of
+from syzscope.interface.kernelTrees import kernel_state, tree_state
+
+# The resource profiles a stage holds while it runs, see Deployer.deploy()
+profiles_of_stage = {
+    'build': ['build_kernel'],
+    'fuzz': ['read_crash', 'fuzzing'],
+    'static': ['static_analysis'],
+    'symbolic': ['symbolic_execution'],
+}
+# The stamp that makes Deployer skip a stage, fuzz depends on -KF
+done_stamps = {
+    'static': "FINISH_STATIC_ANALYSIS",
+    'symbolic': "FINISH_SYM_EXEC",
+}
+# MB of a tools/linux-N that has not been cloned yet
+linux_tree_disk = 6144
+catalogs = ['incomplete', 'succeed', 'completed', 'error']
+
+def case_folder(hash_val):
+    # Deployer moves the folder of a case to incomplete from wherever it is
+    for catalog in catalogs:
+        path = os.path.join(os.getcwd(), "work", catalog, hash_val[:7])
+        if os.path.isdir(path):
+            return catalog, path
+    return None, None
+
+def stage_tokens(profiles, stage):
+    res = {}
+    for name in profiles_of_stage.get(stage, []):
+        for kind, n in profiles.get(name, {}).items():
+            res[kind] = max(res.get(kind, 0), n)
+    return res
+
+class BatchPlan:
+    """
+    Estimates a batch without running it. For every case it checks which
+    of its kernel, syzkaller and bitcode are already built and which stages
+    are already done, prices the rest with the stage times of earlier cases
+    and plays the queue through the lords, or the stage workers of
+    --pipeline, in the order of the schedule. Resource waits are not played,
+    a batch that needs more than capacity takes longer than estimated.
+    """
+    def __init__(self, store, stages, cost, records, profiles, capacity, parallel_max,
+            trees=None, stage_workers=None, schedule='fifo', kernel_fuzzing=False, force=False):
+        self.store = store
+        self.stages = stages
+        self.cost = cost
+        self.profiles = profiles
+        self.capacity = capacity
+        self.parallel_max = parallel_max
+        self.trees = trees
+        if self.trees == None:
+            self.trees = list(range(0, parallel_max))
+        self.stage_workers = stage_workers
+        self.schedule = schedule
+        self.force = force
+        self.done_stamps = dict(done_stamps)
+        self.done_stamps['fuzz'] = "FINISH_FUZZING" if kernel_fuzzing else "REPRO_ORI_POC"
+        # Without records, a stage keeps its cores and the vCPUs of its VMs busy
+        cpu_defaults = {}
+        for stage in cost.defaults:
+            tokens = stage_tokens(profiles, stage)
+            cpu_defaults[stage] = cost.defaults[stage] * max(1, tokens.get('cores', 0) + tokens.get('vcpu', 0))
+        self.cpu_cost = CostModel(records, cpu_defaults, field='cpu')
+
+    def inspect(self, hash_val):
+        catalog, path = case_folder(hash_val)
+        res = {'hash': hash_val, 'catalog': catalog, 'kernel': False, 'syzkaller': False, 'bitcode': False, 'tree': False}
+        stamps = []
+        if path != None and not self.force:
+            if os.path.isdir(os.path.join(path, ".stamp")):
+                stamps = os.listdir(os.path.join(path, ".stamp"))
+            res['kernel'] = "BUILD_KERNEL" in stamps
+            res['syzkaller'] = "BUILD_SYZKALLER" in stamps
+            res['bitcode'] = os.path.isfile(os.path.join(path, "one.bc"))
+        if not self.force and not res['kernel']:
+            state = kernel_state(self.store.load(hash_val))
+            res['tree'] = state != None and state in [tree_state(index) for index in self.trees]
+        features = features_of(hash_val, self.store.summary(hash_val), catalog or 'incomplete')
+        features['cached'] = res['kernel']
+        res['stages'] = []
+        for stage in self.stages:
+            # deploy.sh always runs, it is quick for a built kernel
+            if stage != 'build' and self.done_stamps[stage] in stamps:
+                continue
+            tokens = stage_tokens(self.profiles, stage)
+            if (stage == 'build' and res['kernel']) or (stage == 'static' and res['bitcode']):
+                tokens['disk'] = 0
+            res['stages'].append((stage, self.cost.stage_cost(stage, features), self.cpu_cost.stage_cost(stage, features), tokens))
+        res['wall'] = sum([each[1] for each in res['stages']])
+        return res
+
+    def plan(self, hashes):
+        cases = [self.inspect(hash_val) for hash_val in hashes]
+        if self.schedule == 'sjf':
+            cases.sort(key=lambda case: case['wall'])
+        elif self.schedule == 'lpt':
+            cases.sort(key=lambda case: -case['wall'])
+        wall, intervals = self.__simulate(cases)
+        res = {'cases': len(cases), 'wall': wall, 'serial': sum([case['wall'] for case in cases])}
+        for name in ['kernel', 'tree', 'syzkaller', 'bitcode']:
+            res[name] = len([case for case in cases if case[name]])
+        # Every stage after the build is done
+        res['done'] = len([case for case in cases if len(case['stages']) == 1 and len(self.stages) > 1])
+        res['cpu_hours'] = sum([each[2] for case in cases for each in case['stages']]) / 3600
+        for kind in ['cores', 'mem', 'vcpu', 'disk']:
+            res[kind] = self.__peak(intervals, kind)
+        new_trees = [index for index in self.trees if not os.path.isdir(os.path.join(os.getcwd(), "tools", "linux-{}".format(index)))]
+        res['trees'] = len(new_trees)
+        res['disk'] += len(new_trees) * linux_tree_disk
+        return res
+
+    def format(self, res):
+        lines = []
+        lines.append("{} cases, {} of them only need deploy.sh again".format(res['cases'], res['done']))
+        lines.append("cached: {} kernels ({} more on a kernel tree already), {} syzkallers, {} bitcode".format(
+            res['kernel'], res['tree'], res['syzkaller'], res['bitcode']))
+        lines.append("wall time: {} with {} cases in flight, {} one after another".format(
+            format_duration(res['wall']), self.parallel_max, format_duration(res['serial'])))
+        lines.append("cpu: {:.1f} core-hours, up to {} cores and {} vCPUs at once".format(res['cpu_hours'], res['cores'], res['vcpu']))
+        lines.append("memory: up to {} MB".format(res['mem']))
+        lines.append("disk: up to {} MB, {} new kernel trees included".format(res['disk'], res['trees']))
+        for kind, name in [('cores', 'cores'), ('mem', 'memory'), ('vcpu', 'vCPUs'), ('disk', 'disk')]:
+            if self.capacity.get(kind, 0) > 0 and res[kind] > self.capacity[kind]:
+                lines.append("{} {} over the capacity of {}, stages will wait for it and take longer".format(name, res[kind], self.capacity[kind]))
+        return lines
+
+    def __simulate(self, cases):
+        # Every case holds one of parallel_max kernel trees from its first
+        # stage to its last, each stage runs on one of its workers in the
+        # order cases reach it. Returns the makespan and (start, end, tokens)
+        # of every stage run.
+        workers = self.stage_workers
+        if workers == None:
+            workers = {stage: self.parallel_max for stage in self.stages}
+        waiting = {stage: deque() for stage in self.stages}
+        busy = {stage: 0 for stage in self.stages}
+        pending = deque(cases)
+        slots = self.parallel_max
+        running = []
+        intervals = []
+        now = 0
+        seq = 0
+        while True:
+            while slots > 0 and len(pending) > 0:
+                case = pending.popleft()
+                if len(case['stages']) == 0:
+                    continue
+                slots -= 1
+                waiting[case['stages'][0][0]].append((case, 0))
+            for stage in self.stages:
+                while len(waiting[stage]) > 0 and busy[stage] < workers[stage]:
+                    case, i = waiting[stage].popleft()
+                    _, wall, _, tokens = case['stages'][i]
+                    busy[stage] += 1
+                    intervals.append((now, now + wall, tokens))
+                    heapq.heappush(running, (now + wall, seq, case, i))
+                    seq += 1
+            if len(running) == 0:
+                break
+            now, _, case, i = heapq.heappop(running)
+            busy[case['stages'][i][0]] -= 1
+            if i + 1 < len(case['stages']):
+                waiting[case['stages'][i+1][0]].append((case, i + 1))
+            else:
+                slots += 1
+        return now, intervals
+
+    def __peak(self, intervals, kind):
+        events = []
+        for start, end, tokens in intervals:
+            if tokens.get(kind, 0) > 0 and end > start:
+                events.append((start, tokens[kind]))
+                events.append((end, -tokens[kind]))
+        # A stage ending frees its tokens before one starting at that moment takes them
+        events.sort()
+        res = n = 0
+        for _, delta in events:
+            n += delta
+            res = max(res, n)
+        return res
+
+def format_duration(seconds):
+    seconds = int(seconds)
+    if seconds >= 24*60*60:
+        return "{}d {}h".format(seconds // (24*60*60), seconds % (24*60*60) // 3600)
+    return "{}h {}m".format(seconds // 3600, seconds % 3600 // 60)
@@ -0,0 +1,117 @@
+import re
+import numpy as np
+
+bug_types = ['use-after-free Write', 'use-after-free Read', 'out-of-bounds Write', 'out-of-bounds Read',
+             'invalid-free', 'null-ptr-deref', 'WARNING', 'INFO', 'general protection fault', 'KMSAN',
+             'possible deadlock',
+             'KCSAN', 'BUG', 'memory leak', 'inconsistent lock state', 'suspicious RCU usage', 'kernel-infoleak',
+             'divide error']
+
+# Columns holding an index into the string table, -1 means missing.
+# The other columns are integers where -1 means missing as well.
+string_fields = ['Title', 'Hash', 'Patch', 'Repro', 'Bisected']
+
+def days_of(age):
+    if age == None:
+        return -1
+    m = re.search(r'(\d+)d', age)
+    if m == None:
+        return -1
+    return int(m.groups()[0])
+
+def type_index(title):
+    for i in range(0, len(bug_types)):
+        if bug_types[i] in title:
+            return i
+    return -1
+
+class CaseDataset:
+    """
+    Cases from gather_cases() stored by column. Every field is one numpy
+    array, strings are indexes into a shared string table, and the whole
+    dataset is one .npz file. Count, Reported and Last hold days or counts
+    as integers instead of syzbot's "1042d" strings.
+    """
+    def __init__(self, columns, strings):
+        self.columns = columns
+        self.strings = strings
+        self.__titles = None
+
+    @classmethod
+    def from_cases(cls, cases):
+        strings = []
+        lookup = {}
+        def intern(value):
+            if value == None:
+                return -1
+            if value not in lookup:
+                lookup[value] = len(strings)
+                strings.append(value)
+            return lookup[value]
+        columns = {}
+        for field in string_fields:
+            columns[field] = np.array([intern(each.get(field)) for each in cases], dtype=np.int32)
+        columns['Count'] = np.array([int(each['Count']) if str(each.get('Count', '')).isdigit() else -1 for each in cases], dtype=np.int32)
+        columns['Reported'] = np.array([days_of(each.get('Reported')) for each in cases], dtype=np.int32)
+        columns['Last'] = np.array([days_of(each.get('Last')) for each in cases], dtype=np.int32)
+        columns['days_patch_commit'] = np.array([each.get('days_patch_commit', -1) for each in cases], dtype=np.int32)
+        columns['days_patch_merge'] = np.array([each.get('days_patch_merge', -1) for each in cases], dtype=np.int32)
+        columns['bug_type'] = np.array([type_index(each.get('Title', '')) for each in cases], dtype=np.int16)
+        return cls(columns, strings)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            columns = {key[4:]: data[key] for key in data.files if key.startswith('col_')}
+            blob = data['strings_blob'].tobytes()
+            offsets = data['strings_offsets']
+        strings = [blob[offsets[i]:offsets[i+1]].decode('utf-8') for i in range(0, len(offsets) - 1)]
+        return cls(columns, strings)
+
+    def save(self, path):
+        encoded = [each.encode('utf-8') for each in self.strings]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(each) for each in encoded])
+        blob = np.frombuffer(b''.join(encoded), dtype=np.uint8)
+        arrays = {'col_' + key: self.columns[key] for key in self.columns}
+        np.savez(path, strings_blob=blob, strings_offsets=offsets, **arrays)
+
+    def __len__(self):
+        return len(self.columns['Title'])
+
+    def string_column(self, field):
+        table = np.array(self.strings + [None], dtype=object)
+        return table[self.columns[field]]
+
+    def titles(self):
+        # Fixed width unicode, so substring tests run inside numpy
+        if self.__titles is None:
+            self.__titles = np.array([self.strings[i] if i != -1 else '' for i in self.columns['Title']], dtype=str)
+        return self.__titles
+
+    def title_contains(self, keys):
+        mask = np.zeros(len(self), dtype=bool)
+        for key in keys:
+            mask |= np.char.find(self.titles(), key) >= 0
+        return mask
+
+    def take(self, index):
+        return CaseDataset({key: self.columns[key][index] for key in self.columns}, self.strings)
+
+    def sorted_by(self, field):
+        return self.take(np.argsort(self.columns[field], kind='stable'))
+
+    def to_cases(self):
+        res = []
+        for i in range(0, len(self)):
+            case = {}
+            for field in string_fields:
+                if self.columns[field][i] != -1:
+                    case[field] = self.strings[self.columns[field][i]]
+            for field in ['Count', 'days_patch_commit', 'days_patch_merge']:
+                case[field] = int(self.columns[field][i])
+            for field in ['Reported', 'Last']:
+                if self.columns[field][i] != -1:
+                    case[field] = "{}d".format(self.columns[field][i])
+            res.append(case)
+        return res
@@ -0,0 +1,242 @@
+import datetime
+import re
+
+from dateutil import parser as time_parser
+
+# The first matching class wins, titles look like "KASAN: use-after-free Read in foo"
+bug_class_regx = [
+    ('double-free', r'double-free'),
+    ('uaf-write', r'use-after-free Write'),
+    ('uaf', r'use-after-free'),
+    ('oob-write', r'out-of-bounds Write'),
+    ('oob', r'out-of-bounds'),
+    ('null-ptr-deref', r'null-ptr-deref|NULL pointer dereference'),
+    ('gpf', r'general protection fault'),
+    ('warning', r'^WARNING'),
+    ('info', r'^INFO:'),
+    ('kernel-bug', r'^kernel BUG'),
+    ('kmsan', r'^KMSAN'),
+]
+compiled_bug_class_regx = [(name, re.compile(regx)) for name, regx in bug_class_regx]
+high_risk_classes = ['uaf-write', 'oob-write']
+patch_commit_regx = re.compile(r'id=(\w+)')
+time_formats = ['%Y/%m/%d %H:%M', '%Y-%m-%d %H:%M']
+
+def bug_class_of(title):
+    for name, regx in compiled_bug_class_regx:
+        if regx.search(title) != None:
+            return name
+    return 'other'
+
+def arch_of(manager):
+    # Same rule as the deployer, managers fuzzing i386 carry 386 in their names
+    if manager != None and '386' in manager:
+        return 'i386'
+    return 'amd64'
+
+def parse_time(text):
+    if text == None:
+        return None
+    for format in time_formats:
+        try:
+            return datetime.datetime.strptime(text, format)
+        except ValueError:
+            pass
+    try:
+        return time_parser.parse(text).replace(tzinfo=None)
+    except (ValueError, OverflowError):
+        return None
+
+class CaseQuery:
+    """
+    What to pick from the cached cases. Unset fields match everything.
+    keyword and exclude are title substrings, since and until bound the
+    time of the crash syzbot reproduced, reported_within and last_within
+    are ages in days. Like -de when crawling, only the first case of each
+    patch is kept among the titles deduplicate matches, every title with
+    dedup_patch, and a patch that also fixed a high-risk bug drops them
+    unless include_high_risk. hashes limits the query to those cases.
+    """
+    def __init__(self, keyword=None, exclude=None, bug_class=None, manager=None, arch=None,
+                 since=None, until=None, reported_within=-1, last_within=-1,
+                 dedup_patch=False, deduplicate=None, ignore=None, ignore_patch_of=None, include_high_risk=False, limit=None,
+                 hashes=None):
+        self.keyword = [each for each in (keyword or []) if each != '']
+        self.exclude = exclude or []
+        self.bug_class = bug_class or []
+        self.manager = manager or []
+        self.arch = arch
+        self.since = since
+        self.until = until
+        self.reported_within = reported_within
+        self.last_within = last_within
+        self.dedup_patch = dedup_patch
+        self.deduplicate = deduplicate or []
+        self.ignore = ignore or []
+        # Hashes whose patches are already analyzed, like --ignore-batch
+        self.ignore_patch_of = ignore_patch_of or []
+        self.include_high_risk = include_high_risk
+        self.limit = limit
+        self.hashes = hashes
+
+    def narrows(self):
+        # Whether anything besides ignored cases picks among the cached ones
+        return len(self.keyword) > 0 or len(self.exclude) > 0 or len(self.bug_class) > 0 or len(self.manager) > 0 or \
+            self.arch != None or self.since != None or self.until != None or self.reported_within > -1 or \
+            self.last_within > -1 or self.dedup_patch or len(self.deduplicate) > 0 or self.limit != None or \
+            self.hashes != None
+
+class CaseIndex:
+    """
+    Inverted indexes over the summaries of a CaseStore index. Selecting
+    cases intersects posting sets first and only then runs the remaining
+    per-case checks on the survivors, so queries over tens of thousands
+    of cases stay interactive.
+    """
+    def __init__(self, index):
+        self.hashes = list(index)
+        self.position = {hash_val: i for i, hash_val in enumerate(self.hashes)}
+        self.titles = {}
+        self.bug_classes = {}
+        self.patches = {}
+        self.times = {}
+        self.reported = {}
+        self.last_crash = {}
+        self.by_class = {}
+        self.by_arch = {}
+        self.by_manager = {}
+        self.by_token = {}
+        self.by_patch = {}
+        for hash_val in self.hashes:
+            self.__add(hash_val, index[hash_val])
+
+    def select(self, query, now=None):
+        if now == None:
+            now = datetime.datetime.utcnow()
+        candidates = None
+        if query.hashes != None:
+            candidates = set([hash_val for hash_val in query.hashes if hash_val in self.position])
+        if len(query.bug_class) > 0:
+            candidates = self.__intersect(candidates, self.__union(self.by_class, query.bug_class))
+        if query.arch != None:
+            candidates = self.__intersect(candidates, self.by_arch.get(query.arch, set()))
+        if len(query.manager) > 0:
+            managers = [name for name in self.by_manager if any(each in name for each in query.manager)]
+            candidates = self.__intersect(candidates, self.__union(self.by_manager, managers))
+        if len(query.keyword) > 0:
+            postings = [self.__keyword_candidates(each) for each in query.keyword]
+            if None not in postings:
+                candidates = self.__intersect(candidates, set().union(*postings))
+        if candidates == None:
+            ordered = self.hashes
+        else:
+            ordered = sorted(candidates, key=self.position.get)
+
+        keyword = self.__compile(query.keyword)
+        exclude = self.__compile(query.exclude)
+        # '' matches every title, as it does for the crawler
+        deduplicate = None
+        if len(query.deduplicate) > 0:
+            deduplicate = re.compile("|".join([re.escape(each) for each in query.deduplicate]))
+        ignore = set(query.ignore)
+        ignored_patches = set([self.patches[each] for each in query.ignore_patch_of if self.patches.get(each) != None])
+        seen_patches = set()
+        high_risk_patches = set()
+        if not query.include_high_risk:
+            for each in high_risk_classes:
+                for hash_val in self.by_class.get(each, []):
+                    if self.patches[hash_val] != None:
+                        high_risk_patches.add(self.patches[hash_val])
+        reported_after = None
+        if query.reported_within > -1:
+            reported_after = now - datetime.timedelta(days=query.reported_within)
+        last_after = None
+        if query.last_within > -1:
+            last_after = now - datetime.timedelta(days=query.last_within)
+
+        res = []
+        for hash_val in ordered:
+            if hash_val in ignore:
+                continue
+            title = self.titles[hash_val]
+            if keyword != None and keyword.search(title) == None:
+                continue
+            if exclude != None and exclude.search(title) != None:
+                continue
+            if query.since != None or query.until != None:
+                time = self.times[hash_val]
+                if time == None or (query.since != None and time < query.since) or (query.until != None and time > query.until):
+                    continue
+            if reported_after != None and (self.reported[hash_val] == None or self.reported[hash_val] < reported_after):
+                continue
+            if last_after != None and (self.last_crash[hash_val] == None or self.last_crash[hash_val] < last_after):
+                continue
+            patch = self.patches[hash_val]
+            if patch != None:
+                if patch in ignored_patches:
+                    continue
+                if query.dedup_patch or (deduplicate != None and deduplicate.search(title) != None):
+                    # A patch that also fixed a high-risk bug is already known to be high-risk
+                    if patch in high_risk_patches and self.bug_classes[hash_val] not in high_risk_classes:
+                        continue
+                    if patch in seen_patches:
+                        continue
+                    seen_patches.add(patch)
+            res.append(hash_val)
+            if query.limit != None and len(res) >= query.limit:
+                break
+        return res
+
+    def classes(self):
+        return {name: len(self.by_class[name]) for name in self.by_class}
+
+    def __add(self, hash_val, summary):
+        title = summary.get('title') or ''
+        self.titles[hash_val] = title
+        commit = None
+        if summary.get('patch') != None:
+            m = patch_commit_regx.search(summary['patch'])
+            if m != None:
+                commit = m.groups()[0]
+        self.patches[hash_val] = commit
+        self.times[hash_val] = parse_time(summary.get('time'))
+        self.reported[hash_val] = parse_time(summary.get('reported'))
+        self.last_crash[hash_val] = parse_time(summary.get('last_crash'))
+        self.bug_classes[hash_val] = bug_class_of(title)
+        self.by_class.setdefault(self.bug_classes[hash_val], set()).add(hash_val)
+        self.by_arch.setdefault(arch_of(summary.get('manager')), set()).add(hash_val)
+        self.by_manager.setdefault(summary.get('manager') or '', set()).add(hash_val)
+        for token in set(re.findall(r'\w+', title.lower())):
+            self.by_token.setdefault(token, set()).add(hash_val)
+        if commit != None:
+            self.by_patch.setdefault(commit, []).append(hash_val)
+
+    def __keyword_candidates(self, keyword):
+        # The words inside a keyword must be whole words of the title, the
+        # first and last one may be cut, eg. "after-fr" in "use-after-free".
+        # None means the keyword is too short to narrow anything down.
+        tokens = re.findall(r'\w+', keyword.lower())
+        inner = tokens[1:-1]
+        if len(inner) == 0:
+            return None
+        res = None
+        for token in inner:
+            res = self.__intersect(res, self.by_token.get(token, set()))
+        return res
+
+    def __compile(self, keywords):
+        keywords = [each for each in keywords if each != '']
+        if len(keywords) == 0:
+            return None
+        return re.compile("|".join([re.escape(each) for each in keywords]))
+
+    def __union(self, postings, keys):
+        res = set()
+        for key in keys:
+            res |= postings.get(key, set())
+        return res
+
+    def __intersect(self, candidates, posting):
+        if candidates == None:
+            return set(posting)
+        return candidates & posting
@@ -0,0 +1,121 @@
+import json
+import os
+import threading
+
+from collections.abc import Mapping
+
+# Fields kept in the index, enough to filter and schedule cases without
+# opening their records
+summary_keys = ['title', 'time', 'manager', 'patch', 'count', 'last', 'last_crash', 'reported']
+
+class CaseStore(Mapping):
+    """
+    Cases crawled from syzbot, one JSON record per hash under records/ and
+    a compact index.json of summaries in crawl order. Indexing the store
+    loads a full record from disk, iterating it only touches the index.
+    last holds the hashes the last crawl stored, in the order it stored them.
+    """
+    def __init__(self, path=None, legacy_path=None):
+        if path == None:
+            path = os.path.join(os.getcwd(), "work/cases")
+        if legacy_path == None:
+            legacy_path = os.path.join(os.path.dirname(path), "cases.json")
+        self.path = path
+        self.records_path = os.path.join(path, "records")
+        self.index_path = os.path.join(path, "index.json")
+        self.legacy_path = legacy_path
+        self.index = {}
+        self.last = []
+        # Hashes stored since the index was loaded, in order
+        self.batch = {}
+        self.lock = threading.Lock()
+        self.load_index()
+
+    def load_index(self):
+        if os.path.isfile(self.index_path):
+            with open(self.index_path, 'r') as f:
+                data = json.load(f)
+            self.index = data['cases']
+            self.last = data.get('last', list(self.index))
+        elif os.path.isfile(self.legacy_path):
+            self.migrate()
+        return self.index
+
+    def migrate(self):
+        # work/cases.json used to hold every case in one file
+        with open(self.legacy_path, 'r') as f:
+            cases = json.load(f)
+        for hash_val in cases:
+            self.put(hash_val, cases[hash_val])
+        self.save_index()
+        self.batch = {}
+
+    def record_path(self, hash_val):
+        return os.path.join(self.records_path, hash_val[:2], "{}.json".format(hash_val))
+
+    def put(self, hash_val, case):
+        path = self.record_path(hash_val)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.__write_atomic(path, json.dumps(case))
+        with self.lock:
+            self.batch[hash_val] = True
+            self.index[hash_val] = summary_of(case)
+
+    def load(self, hash_val):
+        try:
+            with open(self.record_path(hash_val), 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def summary(self, hash_val):
+        return self.index.get(hash_val)
+
+    def save_index(self):
+        # The cases of this run are merged into what is on disk, so a run of
+        # a few cases keeps every case crawled before it in the index. They
+        # also become the last batch.
+        index = {}
+        if os.path.isfile(self.index_path):
+            try:
+                with open(self.index_path, 'r') as f:
+                    index = json.load(f)['cases']
+            except (OSError, ValueError, KeyError):
+                pass
+        with self.lock:
+            index.update(self.index)
+            self.index = index
+            self.last = list(self.batch)
+            text = json.dumps({'cases': self.index, 'last': self.last})
+        os.makedirs(self.path, exist_ok=True)
+        self.__write_atomic(self.index_path, text)
+
+    def __getitem__(self, hash_val):
+        if hash_val not in self.index:
+            raise KeyError(hash_val)
+        case = self.load(hash_val)
+        if case == None:
+            raise KeyError(hash_val)
+        return case
+
+    def __iter__(self):
+        return iter(list(self.index))
+
+    def __len__(self):
+        return len(self.index)
+
+    def __contains__(self, hash_val):
+        return hash_val in self.index
+
+    def __write_atomic(self, path, text):
+        tmp = "{}.{}.{}.tmp".format(path, os.getpid(), threading.get_ident())
+        with open(tmp, 'w') as f:
+            f.write(text)
+        os.replace(tmp, path)
+
+def summary_of(case):
+    res = {}
+    for key in summary_keys:
+        if key in case:
+            res[key] = case[key]
+    return res
@@ -0,0 +1,130 @@
+import logging
+import os
+import re
+
+from contextlib import contextmanager
+
+controllers = ['cpu', 'memory', 'io']
+# memory.high throttles a stage that grows past its tokens by this much
+memory_headroom = 1.5
+
+def cgroup2_mount():
+    try:
+        with open("/proc/self/mountinfo", 'r') as f:
+            for line in f:
+                fields = line.split()
+                sep = fields.index('-')
+                if fields[sep+1] == 'cgroup2':
+                    return fields[4]
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+def own_cgroup(mount, pid='self'):
+    try:
+        with open("/proc/{}/cgroup".format(pid), 'r') as f:
+            for line in f:
+                if line.startswith("0::"):
+                    return os.path.join(mount, line.strip()[3:].lstrip('/'))
+    except OSError:
+        pass
+    return None
+
+def read_pressure(path):
+    # "some" lines of the PSI files in a cgroup, or in /proc/pressure for
+    # the whole host: avg10 in percent and total stall time in us
+    res = {}
+    for kind in controllers:
+        try:
+            with open(os.path.join(path, "{}.pressure".format(kind)), 'r') as f:
+                for line in f:
+                    if line.startswith("some"):
+                        fields = dict([each.split('=') for each in line.split()[1:]])
+                        res[kind] = {'avg10': float(fields['avg10']), 'total': int(fields['total'])}
+        except (OSError, ValueError, KeyError):
+            pass
+    return res
+
+class CgroupSlices:
+    """
+    Runs every stage of a case in its own cgroup v2 slice under parent, so
+    QEMU, syz-manager, make, dr_checker and angr of one case can't starve
+    the others. The case process moves into the slice while the stage holds
+    its tokens, everything it starts follows, and it moves back afterwards.
+    cpu.weight and io.weight follow the stage's cores and disk tokens,
+    memory.high its memory tokens. Without cgroup v2, or without the right
+    to write parent, stages simply run where they are.
+    """
+    def __init__(self, parent=None, logger=None):
+        self.logger = logger
+        if self.logger == None:
+            self.logger = logging.getLogger(__name__)
+        self.mount = cgroup2_mount()
+        self.parent = parent
+        if self.parent == None and self.mount != None:
+            self.parent = os.path.join(self.mount, "syzscope")
+        self.enabled = []
+        self.available = self.__setup()
+
+    def pressure(self):
+        # Of all slices together
+        if not self.available:
+            return {}
+        return read_pressure(self.parent)
+
+    @contextmanager
+    def slice(self, name, tokens):
+        path = None
+        if self.available:
+            path = os.path.join(self.parent, re.sub(r'[^\w.-]', '_', "{}-{}".format(name, os.getpid())))
+            home = own_cgroup(self.mount)
+            try:
+                os.makedirs(path, exist_ok=True)
+                self.__limit(path, tokens)
+                self.__write(path, "cgroup.procs", os.getpid())
+            except OSError as e:
+                self.logger.warning("Fail to enter cgroup {}: {}".format(path, e))
+                path = None
+        try:
+            yield path
+        finally:
+            if path != None:
+                try:
+                    self.__write(home, "cgroup.procs", os.getpid())
+                    os.rmdir(path)
+                except OSError as e:
+                    # Leftover processes of the stage keep the slice alive
+                    self.logger.warning("Fail to leave cgroup {}: {}".format(path, e))
+
+    def __setup(self):
+        if self.parent == None:
+            self.logger.info("No cgroup v2 hierarchy, stages run without slices")
+            return False
+        try:
+            os.makedirs(self.parent, exist_ok=True)
+            with open(os.path.join(self.parent, "cgroup.controllers"), 'r') as f:
+                offered = f.read().split()
+            self.enabled = [each for each in controllers if each in offered]
+            if self.enabled != []:
+                self.__write(self.parent, "cgroup.subtree_control", " ".join(["+" + each for each in self.enabled]))
+        except OSError as e:
+            self.logger.info("Can not use cgroup {}, stages run without slices: {}".format(self.parent, e))
+            return False
+        if self.enabled != controllers:
+            self.logger.info("cgroup {} has no {} controller, those limits are skipped".format(self.parent,
+                ", ".join([each for each in controllers if each not in self.enabled])))
+        return True
+
+    def __limit(self, path, tokens):
+        if 'cpu' in self.enabled:
+            self.__write(path, "cpu.weight", min(10000, max(1, 100 * tokens.get('cores', 0))))
+        if 'io' in self.enabled:
+            # Builds, fuzzing and static analysis are the ones that write a lot
+            self.__write(path, "io.weight", 100 if tokens.get('disk', 0) > 0 else 50)
+        if 'memory' in self.enabled:
+            mem = tokens.get('mem', 0)
+            self.__write(path, "memory.high", int(mem * memory_headroom) * 1024 * 1024 if mem > 0 else "max")
+
+    def __write(self, path, name, value):
+        with open(os.path.join(path, name), 'w') as f:
+            f.write(str(value))
@@ -0,0 +1,106 @@
+import datetime
+import os
+import re
+import subprocess
+import threading
+
+from bs4 import BeautifulSoup
+
+kernel_commit_url = "https://git.kernel.org/pub/scm/linux/kernel/git/torvalds/linux.git/commit/?id="
+commit_id_regx = r'^[0-9a-f]{7,40}$'
+
+class CommitResolver:
+    """
+    Subject, author date and commit date of kernel commits. Commits are
+    looked up in a local linux tree in one batch, only the ones missing
+    there are scraped from git.kernel.org.
+    Dates are timezone aware datetimes, the author date is when the patch
+    was written and the commit date is when it was merged.
+    """
+    def __init__(self, repo=None, fetch=None, logger=None):
+        if repo == None:
+            repo = os.path.join(os.getcwd(), "tools/linux-0")
+        self.repo = repo
+        self.fetch = fetch
+        self.logger = logger
+        self.commits = {}
+        self.lock = threading.Lock()
+        self.local_hits = 0
+        self.remote_hits = 0
+
+    def resolve(self, commit):
+        return self.resolve_all([commit]).get(commit)
+
+    def resolve_all(self, commits):
+        commits = [each for each in dict.fromkeys(commits) if each != None and re.match(commit_id_regx, each)]
+        with self.lock:
+            missing = [each for each in commits if each not in self.commits]
+        if len(missing) > 0:
+            found = self.__resolve_local(missing)
+            for commit in missing:
+                if commit not in found:
+                    info = self.__resolve_remote(commit)
+                    if info != None:
+                        found[commit] = info
+            with self.lock:
+                self.local_hits += len([each for each in found if found[each]['source'] == 'local'])
+                self.remote_hits += len([each for each in found if found[each]['source'] == 'remote'])
+                self.commits.update(found)
+        with self.lock:
+            return {each: self.commits[each] for each in commits if each in self.commits}
+
+    def __resolve_local(self, commits):
+        res = {}
+        if not os.path.exists(os.path.join(self.repo, ".git")):
+            return res
+        # git log aborts on the first unknown commit, filter them out first
+        p = subprocess.run(["git", "cat-file", "--batch-check"], cwd=self.repo, input="\n".join(commits) + "\n",
+            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, universal_newlines=True)
+        present = {}
+        for commit, line in zip(commits, p.stdout.split('\n')):
+            fields = line.split()
+            if len(fields) == 3 and fields[1] == 'commit':
+                present.setdefault(fields[0], []).append(commit)
+        if len(present) == 0:
+            return res
+        p = subprocess.run(["git", "log", "--no-walk=unsorted", "--stdin", "--format=%H%x00%s%x00%aI%x00%cI"], cwd=self.repo,
+            input="\n".join(present.keys()) + "\n", stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, universal_newlines=True)
+        for line in p.stdout.split('\n'):
+            fields = line.split('\x00')
+            if len(fields) != 4 or fields[0] not in present:
+                continue
+            try:
+                info = {'subject': fields[1],
+                    'author_date': datetime.datetime.fromisoformat(fields[2]),
+                    'commit_date': datetime.datetime.fromisoformat(fields[3]),
+                    'source': 'local'}
+            except ValueError:
+                continue
+            for commit in present[fields[0]]:
+                res[commit] = info
+        return res
+
+    def __resolve_remote(self, commit):
+        if self.fetch == None:
+            return None
+        try:
+            r = self.fetch(kernel_commit_url + commit)
+            soup = BeautifulSoup(r.text, "html.parser")
+            subject = soup.find_all('div', {'class': 'commit-subject'})[0].text
+        except Exception as e:
+            if self.logger != None:
+                self.logger.error("Fail to resolve commit {}: {}".format(commit, e))
+            return None
+        info = {'subject': subject, 'author_date': None, 'commit_date': None, 'source': 'remote'}
+        try:
+            commit_info = soup.find_all('table', {'class': 'commit-info'})[0]
+            author_date = commit_info.contents[1].contents[2].contents[0]
+            commit_date = commit_info.contents[3].contents[2].contents[0]
+            info['author_date'] = datetime.datetime.strptime(author_date, '%Y-%m-%d %H:%M:%S %z')
+            info['commit_date'] = datetime.datetime.strptime(commit_date, '%Y-%m-%d %H:%M:%S %z')
+        except Exception:
+            pass
+        return info
+
+    def stats(self):
+        return "{} commits resolved locally, {} from git.kernel.org".format(self.local_hits, self.remote_hits)
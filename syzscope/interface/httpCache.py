@@ -0,0 +1,225 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import requests
+
+NEVER_EXPIRE = None
+# An object younger than this may belong to a put() that has not written
+# its index entry yet, eviction leaves it alone even when nothing points to it
+orphan_grace = 60
+
+# The first matching rule decides how long a response stays fresh.
+# Artifacts are addressed by an immutable id, bug pages slowly gain new
+# crashes and fixes, list pages change all the time.
+default_ttl_rules = [
+    (r'\/text\?tag=\w+&(amp;)?x=[0-9a-f]+', NEVER_EXPIRE),
+    (r'\/x\/[\w.\-]+\?x=[0-9a-f]+', NEVER_EXPIRE),
+    (r'git\.kernel\.org\/.*\/commit\/\?id=[0-9a-f]{40}', NEVER_EXPIRE),
+    (r'\/bug\?(id|extid)=', 24*60*60),
+    (r'.*', 10*60),
+]
+
+class HttpCache:
+    def __init__(self, path, fetch, max_size=2*1024*1024*1024, ttl_rules=default_ttl_rules):
+        self.path = path
+        self.objects_path = os.path.join(path, "objects")
+        self.index_path = os.path.join(path, "index")
+        self.fetch = fetch
+        self.max_size = max_size
+        self.ttl_rules = [(re.compile(regx), ttl) for regx, ttl in ttl_rules]
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.size = None
+        os.register_at_fork(after_in_child=self.__after_fork)
+
+    def get(self, url):
+        entry = self.__lookup(url)
+        if entry != None:
+            data = self.__read_object(entry['digest'])
+            if data != None:
+                self.__count(hit=True)
+                self.__touch(url)
+                return self.__make_response(url, data, entry['encoding'])
+        self.__count(hit=False)
+        r = self.fetch(url)
+        if r.status_code == 200:
+            try:
+                self.put(url, r.content, r.encoding)
+            except OSError:
+                pass
+        return r
+
+    def put(self, url, data, encoding=None):
+        digest = hashlib.sha256(data).hexdigest()
+        object_path = self.object_path(digest)
+        grown = 0
+        if not os.path.isfile(object_path):
+            os.makedirs(os.path.dirname(object_path), exist_ok=True)
+            self.__write_atomic(object_path, data)
+            grown = len(data)
+        entry = {'url': url, 'digest': digest, 'size': len(data), 'encoding': encoding, 'fetched': time.time()}
+        os.makedirs(self.index_path, exist_ok=True)
+        self.__write_atomic(self.__index_file(url), json.dumps(entry).encode())
+        with self.lock:
+            if self.size == None:
+                self.size = self.__disk_usage()
+            else:
+                self.size += grown
+            over_limit = self.size > self.max_size
+        if over_limit:
+            self.evict()
+        return digest
+
+    def object_path(self, digest):
+        return os.path.join(self.objects_path, digest[:2], digest[2:])
+
+    def local_path(self, url):
+        entry = self.__lookup(url)
+        if entry == None:
+            return None
+        path = self.object_path(entry['digest'])
+        if not os.path.isfile(path):
+            return None
+        self.__touch(url)
+        return path
+
+    def ttl_of(self, url):
+        for regx, ttl in self.ttl_rules:
+            if regx.search(url) != None:
+                return ttl
+        return 0
+
+    def evict(self):
+        # Least recently used entries go first, an entry's mtime is bumped on every hit.
+        entries = []
+        if not os.path.isdir(self.index_path):
+            return
+        for name in os.listdir(self.index_path):
+            path = os.path.join(self.index_path, name)
+            try:
+                with open(path, 'r') as f:
+                    entry = json.load(f)
+                entries.append((os.path.getmtime(path), path, entry))
+            except (OSError, ValueError):
+                continue
+        entries.sort(key=lambda x: x[0])
+        referenced = {}
+        for _, _, entry in entries:
+            referenced[entry['digest']] = referenced.get(entry['digest'], 0) + 1
+        # Objects left behind by a URL fetched again with new content go first
+        size = self.__drop_orphans(referenced)
+        target = self.max_size * 0.9
+        for _, path, entry in entries:
+            if size <= target:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            referenced[entry['digest']] -= 1
+            if referenced[entry['digest']] == 0:
+                try:
+                    os.remove(self.object_path(entry['digest']))
+                    size -= entry['size']
+                except OSError:
+                    pass
+        with self.lock:
+            self.size = size
+
+    def stats(self):
+        total = self.hits + self.misses
+        ratio = 0
+        if total > 0:
+            ratio = self.hits / total * 100
+        return "{} hits, {} misses ({:.1f}% hit rate)".format(self.hits, self.misses, ratio)
+
+    def __lookup(self, url):
+        try:
+            with open(self.__index_file(url), 'r') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if entry['url'] != url:
+            return None
+        ttl = self.ttl_of(url)
+        if ttl != NEVER_EXPIRE and time.time() - entry['fetched'] > ttl:
+            return None
+        return entry
+
+    def __read_object(self, digest):
+        try:
+            with open(self.object_path(digest), 'rb') as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def __touch(self, url):
+        try:
+            os.utime(self.__index_file(url))
+        except OSError:
+            pass
+
+    def __count(self, hit):
+        with self.lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def __index_file(self, url):
+        return os.path.join(self.index_path, hashlib.sha1(url.encode()).hexdigest())
+
+    def __drop_orphans(self, referenced):
+        # Deletes the objects no index entry points to, returns the size of the rest
+        size = 0
+        if not os.path.isdir(self.objects_path):
+            return size
+        now = time.time()
+        for root, _, files in os.walk(self.objects_path):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                    if not name.endswith(".tmp") and os.path.basename(root) + name not in referenced \
+                            and now - st.st_mtime > orphan_grace:
+                        os.remove(path)
+                        continue
+                    size += st.st_size
+                except OSError:
+                    pass
+        return size
+
+    def __disk_usage(self):
+        size = 0
+        if not os.path.isdir(self.objects_path):
+            return size
+        for root, _, files in os.walk(self.objects_path):
+            for name in files:
+                try:
+                    size += os.path.getsize(os.path.join(root, name))
+                except OSError:
+                    pass
+        return size
+
+    def __write_atomic(self, path, data):
+        tmp = "{}.{}.{}.tmp".format(path, os.getpid(), threading.get_ident())
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+    def __after_fork(self):
+        # A forked deploy process may have copied the lock held by a crawler thread
+        self.lock = threading.Lock()
+
+    def __make_response(self, url, data, encoding):
+        r = requests.Response()
+        r._content = data
+        r.status_code = 200
+        r.url = url
+        r.encoding = encoding
+        r.headers['X-SyzScope-Cache'] = 'hit'
+        return r
@@ -0,0 +1,22 @@
+import hashlib
+import os
+
+# deploy.sh writes "<kernel state> <compiler>" to tools/.stamp/linux-N.state
+# once linux-N is built, and every script that touches the tree afterwards
+# removes it
+
+def kernel_state(case):
+    # The compiler is picked from the config, so commit and config say it all
+    if case == None or case.get('commit') == None or case.get('config') == None:
+        return None
+    return "{}-{}".format(case['commit'], hashlib.sha1(case['config'].encode('utf-8')).hexdigest()[:12])
+
+def tree_state_path(index, linux_folder='linux'):
+    return os.path.join(os.getcwd(), "tools/.stamp", "{}-{}.state".format(linux_folder, index))
+
+def tree_state(index, linux_folder='linux'):
+    try:
+        with open(tree_state_path(index, linux_folder), 'r') as f:
+            return f.read().split()[0]
+    except (OSError, IndexError):
+        return None
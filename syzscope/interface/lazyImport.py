@@ -0,0 +1,14 @@
+import importlib
+
+def lazy_getattr(package, attrs):
+    """
+    Module __getattr__ for a package whose classes live in submodules that
+    are expensive to import, eg. anything that pulls in angr or pwntools.
+    attrs maps a class name to the submodule defining it, relative to the
+    package, which is only imported the first time the class is used.
+    """
+    def __getattr__(name):
+        if name not in attrs:
+            raise AttributeError("module {} has no attribute {}".format(package, name))
+        return getattr(importlib.import_module(attrs[name], package), name)
+    return __getattr__
@@ -0,0 +1,128 @@
+import fcntl
+import logging
+import os
+import socket
+import time
+
+from syzscope.interface.resourceScheduler import process_start_time
+
+class PortAllocator:
+    """
+    Hands out TCP ports for QEMU ssh forwarding, gdb stubs and monitors.
+    Every leased port has a lease file under work/.ports naming the process
+    that holds it, created with O_EXCL so two processes never get the same
+    port. A port is only leased if it can be bound right now, and leases of
+    dead processes are taken over. The ports asked for are hints, the next
+    free port after a taken one is used instead.
+    """
+    def __init__(self, path=None, low=1024, high=65535, logger=None):
+        if path == None:
+            path = os.path.join(os.getcwd(), "work/.ports")
+        self.path = path
+        self.low = low
+        self.high = high
+        self.leased = []
+        self.logger = logger
+        if self.logger == None:
+            self.logger = logging.getLogger(__name__)
+
+    def lease(self, hint=None, count=1):
+        os.makedirs(self.path, exist_ok=True)
+        if hint == None or hint < self.low or hint > self.high:
+            hint = self.low
+        res = []
+        port = hint
+        for _ in range(self.low, self.high + 1):
+            if self.__try_lease(port):
+                res.append(port)
+                if len(res) == count:
+                    return res
+            port += 1
+            if port > self.high:
+                port = self.low
+        self.release(res)
+        raise OSError("No free port for {} leases from {}".format(count, hint))
+
+    def release(self, ports=None):
+        if ports == None:
+            ports = list(self.leased)
+        for port in ports:
+            if port not in self.leased:
+                continue
+            self.leased.remove(port)
+            try:
+                os.remove(self.lease_path(port))
+            except OSError:
+                pass
+
+    def lease_path(self, port):
+        return os.path.join(self.path, str(port))
+
+    def owner(self, port):
+        try:
+            with open(self.lease_path(port), 'r') as f:
+                pid, start = f.read().split()
+            return int(pid), int(start)
+        except (OSError, ValueError):
+            return None
+
+    def __try_lease(self, port):
+        path = self.lease_path(port)
+        try:
+            fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            if not self.__stale(port):
+                return False
+            fd = self.__take_over(port)
+            if fd == None:
+                return False
+        with os.fdopen(fd, 'w') as f:
+            f.write("{} {}".format(os.getpid(), process_start_time(os.getpid()) or 0))
+        if not self.__bindable(port):
+            os.remove(path)
+            return False
+        self.leased.append(port)
+        return True
+
+    def __take_over(self, port):
+        # The lease of a dead process, checked again under the lock so only
+        # one of the processes that noticed it gets the port
+        with open(os.path.join(self.path, ".lock"), 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                if not self.__stale(port):
+                    return None
+                os.remove(self.lease_path(port))
+                return os.open(self.lease_path(port), os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except OSError:
+                return None
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def __stale(self, port):
+        owner = self.owner(port)
+        if owner == None:
+            # Being written right now, or left empty by a process that died
+            # in between
+            try:
+                return time.time() - os.path.getmtime(self.lease_path(port)) > 60
+            except OSError:
+                return False
+        pid, start = owner
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return True
+        except PermissionError:
+            return False
+        return start != 0 and process_start_time(pid) != start
+
+    def __bindable(self, port):
+        s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        try:
+            s.bind(('', port))
+            return True
+        except OSError:
+            return False
+        finally:
+            s.close()
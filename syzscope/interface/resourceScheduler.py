@@ -0,0 +1,232 @@
+import fcntl
+import json
+import logging
+import os
+import shutil
+import time
+import uuid
+
+from contextlib import contextmanager
+from syzscope.interface.cgroupSlices import read_pressure
+
+# cores and vcpu are counts, mem and disk are MB
+resource_kinds = ['cores', 'mem', 'vcpu', 'disk']
+
+# New stages wait while the stages running in cgroup slices stall this
+# much, avg10 of PSI "some" in percent
+pressure_limits = {'memory': 20.0, 'io': 50.0}
+
+# What one QEMU instance takes, see VM() and the syzkaller config
+vm_tokens = {'cores': 0, 'mem': 2048, 'vcpu': 2, 'disk': 0}
+
+def stage_profiles(build_cores=1, vm_count=1):
+    # build_cores is the make -j share deploy.sh gives one kernel build,
+    # vm_count is how many QEMUs a case boots at once
+    return {
+        'build_kernel': {'cores': build_cores, 'mem': 2048, 'vcpu': 0, 'disk': 8192},
+        'read_crash': {'cores': 1, 'mem': vm_tokens['mem']*vm_count, 'vcpu': vm_tokens['vcpu']*vm_count, 'disk': 0},
+        'fuzzing': {'cores': 1, 'mem': vm_tokens['mem']*vm_count, 'vcpu': vm_tokens['vcpu']*vm_count, 'disk': 2048},
+        'static_analysis': {'cores': build_cores, 'mem': 8192, 'vcpu': 0, 'disk': 4096},
+        'symbolic_execution': {'cores': 1, 'mem': 8192+vm_tokens['mem'], 'vcpu': vm_tokens['vcpu'], 'disk': 1024},
+    }
+
+def host_capacity(path):
+    res = {'cores': os.cpu_count() or 1, 'vcpu': os.cpu_count() or 1}
+    res['mem'] = 0
+    try:
+        with open("/proc/meminfo", 'r') as f:
+            for line in f:
+                if line.startswith("MemTotal:"):
+                    # Leave some room for the host itself
+                    res['mem'] = int(int(line.split()[1]) / 1024 * 0.9)
+                    break
+    except (OSError, ValueError):
+        pass
+    try:
+        res['disk'] = int(shutil.disk_usage(path).free / 1024 / 1024)
+    except OSError:
+        res['disk'] = 0
+    return res
+
+def process_start_time(pid):
+    # Tells a live process from a new one that got a recycled pid
+    try:
+        with open("/proc/{}/stat".format(pid), 'r') as f:
+            text = f.read()
+        return int(text[text.rfind(')')+2:].split()[19])
+    except (OSError, ValueError, IndexError):
+        return None
+
+class ResourceScheduler:
+    """
+    Grants resource tokens to the stages of every case running on this
+    host. The ledger is a JSON file under work/ guarded by flock, so lords,
+    their case processes and pool workers all share it. A stage blocks
+    until its tokens fit in what is left of the capacity, waiters are served
+    first come first served, and tokens held by dead processes are reclaimed.
+    A capacity of 0 means that resource is not limited. With slices, stages
+    run in their own cgroups, new stages wait while the running ones stall
+    on memory or I/O, and every stage reports how long it stalled.
+    """
+    def __init__(self, path=None, capacity=None, profiles=None, poll_interval=1, slices=None, logger=None):
+        if path == None:
+            path = os.path.join(os.getcwd(), "work")
+        self.path = path
+        self.ledger_path = os.path.join(path, "resources.json")
+        self.lock_path = os.path.join(path, "resources.lock")
+        self.capacity = host_capacity(path)
+        if capacity != None:
+            for kind in capacity:
+                if capacity[kind] != None:
+                    self.capacity[kind] = capacity[kind]
+        self.profiles = profiles
+        if self.profiles == None:
+            self.profiles = stage_profiles()
+        self.poll_interval = poll_interval
+        self.slices = slices
+        self.logger = logger
+        if self.logger == None:
+            self.logger = logging.getLogger(__name__)
+
+    def tokens_of(self, stage, **tokens):
+        res = dict(self.profiles.get(stage, {}))
+        res.update(tokens)
+        for kind in resource_kinds:
+            res[kind] = res.get(kind, 0)
+            # A request larger than the host still runs, just alone
+            if self.capacity.get(kind, 0) > 0:
+                res[kind] = min(res[kind], self.capacity[kind])
+        return res
+
+    @contextmanager
+    def hold(self, stage, tag=None, **tokens):
+        grant = self.acquire(stage, tag, **tokens)
+        try:
+            if self.slices == None:
+                yield grant
+            else:
+                with self.slices.slice("{}-{}".format(tag or "case", stage), self.tokens_of(stage, **tokens)) as path:
+                    begin = time.time()
+                    try:
+                        yield grant
+                    finally:
+                        if path != None:
+                            self.__report(stage, tag, read_pressure(path), time.time() - begin)
+        finally:
+            self.release(grant)
+
+    def acquire(self, stage, tag=None, **tokens):
+        need = self.tokens_of(stage, **tokens)
+        ticket = {'id': uuid.uuid4().hex, 'pid': os.getpid(), 'start': process_start_time(os.getpid()),
+            'stage': stage, 'tag': tag, 'tokens': need, 'since': time.time()}
+        begin = time.time()
+        with self.__ledger() as ledger:
+            ledger['waiting'].append(ticket)
+        try:
+            while True:
+                with self.__ledger() as ledger:
+                    if ledger['waiting'][0]['id'] == ticket['id'] and self.__fits(ledger, need) and not self.__under_pressure(ledger):
+                        ledger['waiting'].pop(0)
+                        ledger['grants'][ticket['id']] = ticket
+                        break
+                time.sleep(self.poll_interval)
+        except BaseException:
+            # Don't leave a ticket behind that blocks everyone queued after it
+            with self.__ledger() as ledger:
+                ledger['waiting'] = [each for each in ledger['waiting'] if each['id'] != ticket['id']]
+            raise
+        waited = time.time() - begin
+        if waited >= 60:
+            self.logger.info("{} waited {}s for {} {}".format(tag or os.getpid(), int(waited), stage, self.__format(need)))
+        return ticket['id']
+
+    def release(self, grant):
+        with self.__ledger() as ledger:
+            ledger['grants'].pop(grant, None)
+
+    def usage(self):
+        with self.__ledger() as ledger:
+            used = self.__used(ledger)
+            return used, [each['stage'] for each in ledger['grants'].values()], len(ledger['waiting'])
+
+    def stats(self):
+        used, stages, waiting = self.usage()
+        res = "{} of {} in use by {} stages, {} waiting".format(self.__format(used), self.__format(self.capacity), len(stages), waiting)
+        if self.slices != None and self.slices.available:
+            pressure = self.slices.pressure()
+            res += ", pressure " + " ".join(["{}={}%".format(kind, pressure[kind]['avg10']) for kind in pressure])
+        return res
+
+    def stalls(self):
+        # Share of its time the last run of each stage spent stalled, per resource
+        with self.__ledger() as ledger:
+            return dict(ledger.get('stalls', {}))
+
+    def __fits(self, ledger, need):
+        used = self.__used(ledger)
+        for kind in resource_kinds:
+            if self.capacity.get(kind, 0) > 0 and used[kind] + need[kind] > self.capacity[kind]:
+                return False
+        return True
+
+    def __under_pressure(self, ledger):
+        # The first stage always runs, pressure only comes from running ones
+        if self.slices == None or len(ledger['grants']) == 0:
+            return False
+        pressure = self.slices.pressure()
+        for kind in pressure_limits:
+            if kind in pressure and pressure[kind]['avg10'] > pressure_limits[kind]:
+                return True
+        return False
+
+    def __report(self, stage, tag, pressure, wall):
+        stalls = {kind: round(pressure[kind]['total'] / 1000000 / max(wall, 1), 3) for kind in pressure}
+        stalled = ["{} {}%".format(kind, int(stalls[kind]*100)) for kind in stalls if stalls[kind] >= 0.1]
+        if stalled != []:
+            self.logger.info("{} {} stalled on {} of its time".format(tag or os.getpid(), stage, ", ".join(stalled)))
+        with self.__ledger() as ledger:
+            ledger.setdefault('stalls', {})[stage] = stalls
+
+    def __used(self, ledger):
+        res = {kind: 0 for kind in resource_kinds}
+        for each in ledger['grants'].values():
+            for kind in resource_kinds:
+                res[kind] += each['tokens'].get(kind, 0)
+        return res
+
+    def __alive(self, ticket):
+        try:
+            os.kill(ticket['pid'], 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            pass
+        return ticket.get('start') == None or process_start_time(ticket['pid']) == ticket['start']
+
+    @contextmanager
+    def __ledger(self):
+        os.makedirs(self.path, exist_ok=True)
+        with open(self.lock_path, 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                ledger = {'grants': {}, 'waiting': []}
+                try:
+                    with open(self.ledger_path, 'r') as f:
+                        ledger = json.load(f)
+                except (OSError, ValueError):
+                    pass
+                for key in list(ledger['grants']):
+                    if not self.__alive(ledger['grants'][key]):
+                        self.logger.info("Reclaim {} tokens of dead process {}".format(ledger['grants'][key]['stage'], ledger['grants'][key]['pid']))
+                        del ledger['grants'][key]
+                ledger['waiting'] = [each for each in ledger['waiting'] if self.__alive(each)]
+                yield ledger
+                tmp = "{}.{}.tmp".format(self.ledger_path, os.getpid())
+                with open(tmp, 'w') as f:
+                    json.dump(ledger, f)
+                os.replace(tmp, self.ledger_path)
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def __format(self, tokens):
+        return "cores={} mem={}M vcpu={} disk={}M".format(tokens.get('cores', 0), tokens.get('mem', 0), tokens.get('vcpu', 0), tokens.get('disk', 0))
@@ -0,0 +1,147 @@
+import json
+import os
+import threading
+import time
+
+class RunJournal:
+    """
+    Append-only log of a batch run in work/journal.jsonl: the command line,
+    every queued case, every stage a case starts and ends and every case
+    that is finished. Events are written by a background thread and fsynced
+    in batches every flush_interval seconds, so a crash loses at most the
+    last batch. Replaying it tells a restarted run exactly which cases are
+    left and where each of them stopped.
+    """
+    def __init__(self, path=None, flush_interval=1):
+        if path == None:
+            path = os.path.join(os.getcwd(), "work/journal.jsonl")
+        self.path = path
+        self.flush_interval = flush_interval
+        self.pending = []
+        self.lock = threading.Lock()
+        self.closed = threading.Event()
+        self.file = None
+        self.flusher = None
+
+    def start(self, argv, stages):
+        # A new batch, the journal of the previous one is kept aside
+        if os.path.isfile(self.path):
+            os.replace(self.path, self.path + ".prev")
+        self.__open()
+        self.append('run', argv=argv, stages=stages)
+
+    def resume(self):
+        state = self.replay()
+        self.__open()
+        self.append('resume')
+        return state
+
+    def append(self, event, **fields):
+        fields['e'] = event
+        fields['t'] = round(time.time(), 3)
+        with self.lock:
+            self.pending.append(json.dumps(fields))
+
+    def close(self):
+        self.closed.set()
+        if self.flusher != None:
+            self.flusher.join()
+        self.flush()
+        if self.file != None:
+            self.file.close()
+            self.file = None
+
+    def flush(self):
+        with self.lock:
+            lines = self.pending
+            self.pending = []
+            if len(lines) == 0 or self.file == None:
+                return
+            self.file.write("\n".join(lines) + "\n")
+            self.file.flush()
+            os.fsync(self.file.fileno())
+
+    def replay(self):
+        state = JournalState()
+        if not os.path.isfile(self.path):
+            return state
+        with open(self.path, 'r') as f:
+            for line in f:
+                try:
+                    event = json.loads(line)
+                except ValueError:
+                    # The last line of a run that died while writing it
+                    continue
+                state.apply(event)
+        return state
+
+    def __open(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.file = open(self.path, 'a+')
+        if self.file.tell() > 0:
+            # End a line torn by a crash so the next event starts on its own
+            self.file.seek(self.file.tell() - 1)
+            if self.file.read(1) != "\n":
+                self.file.write("\n")
+        self.flusher = threading.Thread(target=self.__flush_loop, name="journal", daemon=True)
+        self.flusher.start()
+
+    def __flush_loop(self):
+        while not self.closed.wait(self.flush_interval):
+            self.flush()
+
+class JournalState:
+    """
+    Where every case of a journaled run stands. A case is either finished,
+    waiting to start its next stage or was in the middle of one, slot is the
+    kernel tree it was using.
+    """
+    def __init__(self):
+        self.argv = None
+        self.stages = []
+        self.order = []
+        self.cases = {}
+        self.crawled = False
+
+    def apply(self, event):
+        kind = event.get('e')
+        if kind == 'run':
+            self.argv = event.get('argv')
+            self.stages = event.get('stages') or []
+            return
+        if kind == 'crawled':
+            self.crawled = True
+            return
+        hash_val = event.get('hash')
+        if hash_val == None:
+            return
+        if hash_val not in self.cases:
+            self.order.append(hash_val)
+            self.cases[hash_val] = {'stage': None, 'slot': None, 'running': False, 'finished': False}
+        case = self.cases[hash_val]
+        if kind == 'start':
+            case['stage'] = event.get('stage')
+            case['slot'] = event.get('slot')
+            case['running'] = True
+        elif kind == 'stage':
+            case['running'] = False
+            stage = event.get('stage')
+            if stage in self.stages and self.stages.index(stage) + 1 < len(self.stages):
+                case['stage'] = self.stages[self.stages.index(stage) + 1]
+        elif kind == 'finished':
+            case['finished'] = True
+
+    def remaining(self):
+        return [hash_val for hash_val in self.order if not self.cases[hash_val]['finished']]
+
+    def started(self):
+        # Cases that already hold a kernel tree, by the stage to go on with
+        res = []
+        for hash_val in self.remaining():
+            case = self.cases[hash_val]
+            if case['slot'] != None:
+                res.append((hash_val, case['stage'], case['slot']))
+        return res
+
+    def finished(self):
+        return set([hash_val for hash_val in self.order if self.cases[hash_val]['finished']])
@@ -0,0 +1,153 @@
+import heapq
+import json
+import os
+import queue
+import resource
+import statistics
+import time
+
+from syzscope.interface.caseQuery import bug_class_of
+
+# Seconds a stage takes when nothing was recorded for it yet
+default_stage_costs = {'build': 30*60, 'fuzz': 8*60*60, 'static': 30*60, 'symbolic': 60*60}
+# Fewer records than this and a narrower group falls back to a wider one
+min_samples = 3
+
+def cpu_time():
+    # This process and the children it waited for, builds and VMs included
+    res = 0
+    for who in [resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN]:
+        usage = resource.getrusage(who)
+        res += usage.ru_utime + usage.ru_stime
+    return res
+
+def features_of(hash_val, summary, catalog='incomplete'):
+    title = ''
+    if summary != None:
+        title = summary.get('title') or ''
+    stamp = os.path.join(os.getcwd(), "work", catalog, hash_val[:7], ".stamp", "BUILD_KERNEL")
+    return {'bug_class': bug_class_of(title), 'cached': os.path.isfile(stamp)}
+
+class StageTimes:
+    """
+    Wall and CPU time of every stage run, one JSON line per stage of a case
+    in work/stage-times.jsonl. Lines are appended with a single write, so
+    concurrent cases don't interleave.
+    """
+    def __init__(self, path=None):
+        if path == None:
+            path = os.path.join(os.getcwd(), "work/stage-times.jsonl")
+        self.path = path
+
+    def record(self, hash_val, stage, wall, cpu, features, ok=True):
+        entry = {'hash': hash_val, 'stage': stage, 'wall': round(wall, 3), 'cpu': round(cpu, 3), 'ok': ok, 'time': int(time.time())}
+        entry.update(features)
+        line = json.dumps(entry) + "\n"
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, line.encode('utf-8'))
+        finally:
+            os.close(fd)
+
+    def load(self):
+        res = []
+        if not os.path.isfile(self.path):
+            return res
+        with open(self.path, 'r') as f:
+            for line in f:
+                try:
+                    res.append(json.loads(line))
+                except ValueError:
+                    # A line cut short by a crash
+                    pass
+        return res
+
+class CostModel:
+    """
+    Estimates the wall time of a case from the recorded stages of cases
+    like it: the median of the same stage, bug class and kernel build
+    state, widened to the same stage and bug class, then to the stage
+    alone, then to default_stage_costs. field 'cpu' estimates CPU time
+    instead.
+    """
+    def __init__(self, records, defaults=None, field='wall'):
+        self.defaults = dict(default_stage_costs)
+        if defaults != None:
+            self.defaults.update(defaults)
+        groups = {}
+        for each in records:
+            stage = each.get('stage')
+            for key in [(stage, each.get('bug_class'), each.get('cached')), (stage, each.get('bug_class')), (stage,)]:
+                groups.setdefault(key, []).append(each.get(field, 0))
+        self.medians = {key: statistics.median(groups[key]) for key in groups if len(groups[key]) >= min_samples}
+
+    @classmethod
+    def load(cls, stage_times, defaults=None, field='wall'):
+        return cls(stage_times.load(), defaults, field)
+
+    def stage_cost(self, stage, features):
+        for key in [(stage, features.get('bug_class'), features.get('cached')), (stage, features.get('bug_class')), (stage,)]:
+            if key in self.medians:
+                return self.medians[key]
+        return self.defaults.get(stage, 0)
+
+    def estimate(self, features, stages):
+        return sum([self.stage_cost(stage, features) for stage in stages])
+
+class CaseQueue(queue.Queue):
+    """
+    Case hashes waiting for a lord. fifo hands them out in the order they
+    were queued, sjf cheapest first and lpt most expensive first, where
+    cost(hash) gives the estimate. Ties keep the queued order. get_matching()
+    lets a lord take a case its kernel tree already built out of order.
+    """
+    def __init__(self, policy='fifo', cost=None):
+        self.policy = policy
+        self.cost = cost
+        self.seq = 0
+        queue.Queue.__init__(self)
+
+    def _init(self, maxsize):
+        self.queue = []
+
+    def _qsize(self):
+        return len(self.queue)
+
+    def _put(self, hash_val):
+        key = 0
+        if self.policy == 'sjf':
+            key = self.cost(hash_val)
+        elif self.policy == 'lpt':
+            key = -self.cost(hash_val)
+        heapq.heappush(self.queue, (key, self.seq, hash_val))
+        self.seq += 1
+
+    def _get(self):
+        return heapq.heappop(self.queue)[2]
+
+    def get_matching(self, match, block=True, timeout=None):
+        # Like get(), but the first queued case in order that match() accepts
+        # goes ahead of the others
+        with self.not_empty:
+            if not block:
+                if not self._qsize():
+                    raise queue.Empty
+            elif timeout == None:
+                while not self._qsize():
+                    self.not_empty.wait()
+            else:
+                endtime = time.monotonic() + timeout
+                while not self._qsize():
+                    remaining = endtime - time.monotonic()
+                    if remaining <= 0.0:
+                        raise queue.Empty
+                    self.not_empty.wait(remaining)
+            for entry in sorted(self.queue):
+                if match(entry[2]):
+                    self.queue.remove(entry)
+                    heapq.heapify(self.queue)
+                    break
+            else:
+                entry = heapq.heappop(self.queue)
+            self.not_full.notify()
+            return entry[2]
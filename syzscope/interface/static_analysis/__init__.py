@@ -1 +1,3 @@
-from .staticAnalysis import StaticAnalysis
\ No newline at end of file
+from syzscope.interface.lazyImport import lazy_getattr
+
+__getattr__ = lazy_getattr(__name__, {'StaticAnalysis': '.staticAnalysis'})
@@ -1 +1,4 @@
-from .symExec import SymExec
\ No newline at end of file
+from syzscope.interface.lazyImport import lazy_getattr
+
+# angr is only imported once symbolic execution runs, .error stays cheap
+__getattr__ = lazy_getattr(__name__, {'SymExec': '.symExec'})
@@ -0,0 +1,210 @@
+import os
+import random
+import threading
+import time
+import requests
+
+from urllib.parse import urlsplit
+
+# Worth retrying: the server is throttling us or is briefly unhealthy
+retry_status = [429, 500, 502, 503, 504]
+
+class TokenBucket:
+    def __init__(self, rate, burst=None):
+        # rate <= 0 means no limit
+        self.rate = rate
+        self.burst = burst or max(1, rate)
+        self.tokens = self.burst
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        if self.rate <= 0:
+            return
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+                self.last = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+class AdaptiveLimit:
+    """
+    A semaphore whose size follows AIMD: it grows by one every time a full
+    window of requests comes back healthy and halves on throttling, errors
+    or latency far above the best seen so far.
+    """
+    def __init__(self, initial, minimum=1, maximum=32):
+        self.minimum = minimum
+        self.maximum = max(minimum, maximum)
+        self.limit = float(min(max(initial, minimum), self.maximum))
+        self.in_flight = 0
+        self.best_latency = None
+        self.since_decrease = 0
+        self.cond = threading.Condition()
+
+    def acquire(self):
+        with self.cond:
+            while self.in_flight >= int(self.limit):
+                self.cond.wait()
+            self.in_flight += 1
+
+    def release(self):
+        with self.cond:
+            self.in_flight -= 1
+            self.cond.notify()
+
+    def on_success(self, latency):
+        with self.cond:
+            self.since_decrease += 1
+            if self.best_latency == None or latency < self.best_latency:
+                self.best_latency = latency
+            if latency > self.best_latency * 4 + 1:
+                self.__decrease()
+                return
+            self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            self.cond.notify_all()
+
+    def on_error(self):
+        with self.cond:
+            self.since_decrease += 1
+            self.__decrease()
+
+    def set_maximum(self, maximum):
+        with self.cond:
+            self.maximum = max(self.minimum, maximum)
+            self.limit = min(self.limit, self.maximum)
+            self.cond.notify_all()
+
+    def __decrease(self):
+        # Requests already in flight fail together, halve at most once per window
+        if self.since_decrease < self.limit:
+            return
+        self.since_decrease = 0
+        self.limit = max(self.minimum, self.limit / 2)
+
+class Transport:
+    """
+    The HTTP client behind request_get. Requests share one keep-alive
+    session and go through a token bucket, a per-host adaptive concurrency
+    limit and retries with jittered exponential backoff.
+    """
+    def __init__(self, rate=10, max_concurrency=10, max_retries=5, backoff_base=1, backoff_max=60, timeout=60):
+        self.rate = rate
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.timeout = timeout
+        self.session = None
+        self.buckets = {}
+        self.limits = {}
+        self.metrics = {'requests': 0, 'retries': 0, 'throttled': 0, 'errors': 0, 'failed': 0, 'bytes': 0}
+        self.start_time = time.monotonic()
+        self.lock = threading.Lock()
+        self.__mount_session()
+        os.register_at_fork(after_in_child=self.__after_fork)
+
+    def set_max_concurrency(self, max_concurrency):
+        with self.lock:
+            self.max_concurrency = max(1, max_concurrency)
+            self.__mount_session()
+            for host in self.limits:
+                self.limits[host].set_maximum(self.max_concurrency)
+
+    def set_rate(self, rate):
+        with self.lock:
+            self.rate = rate
+            self.buckets = {}
+
+    def get(self, url):
+        host = urlsplit(url).netloc
+        bucket, limit = self.__host_state(host)
+        attempt = 0
+        while True:
+            bucket.acquire()
+            limit.acquire()
+            start = time.monotonic()
+            try:
+                r = self.session.get(url, timeout=self.timeout)
+            except (requests.exceptions.Timeout, requests.exceptions.ConnectionError) as e:
+                limit.on_error()
+                self.__count('errors')
+                if attempt >= self.max_retries:
+                    self.__count('failed')
+                    raise e
+                delay = None
+            else:
+                if r.status_code not in retry_status:
+                    limit.on_success(time.monotonic() - start)
+                    self.__count('requests')
+                    self.__count('bytes', len(r.content))
+                    return r
+                limit.on_error()
+                self.__count('throttled' if r.status_code == 429 else 'errors')
+                if attempt >= self.max_retries:
+                    self.__count('failed')
+                    return r
+                delay = self.__retry_after(r)
+            finally:
+                limit.release()
+            attempt += 1
+            self.__count('retries')
+            if delay == None:
+                delay = self.backoff(attempt)
+            time.sleep(delay)
+
+    def backoff(self, attempt):
+        # Full jitter keeps parallel workers from retrying in lockstep
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def stats(self):
+        elapsed = max(time.monotonic() - self.start_time, 0.001)
+        limits = ", ".join(["{}: {:.1f}".format(host, self.limits[host].limit) for host in self.limits])
+        return "{} requests ({:.1f}/s, {:.1f} KB/s), {} retries, {} throttled, {} errors, {} failed, concurrency {{{}}}".format(
+            self.metrics['requests'], self.metrics['requests'] / elapsed, self.metrics['bytes'] / 1024 / elapsed,
+            self.metrics['retries'], self.metrics['throttled'], self.metrics['errors'], self.metrics['failed'], limits)
+
+    def __host_state(self, host):
+        with self.lock:
+            if host not in self.buckets:
+                self.buckets[host] = TokenBucket(self.rate)
+            if host not in self.limits:
+                self.limits[host] = AdaptiveLimit(min(4, self.max_concurrency), maximum=self.max_concurrency)
+            return self.buckets[host], self.limits[host]
+
+    def __retry_after(self, r):
+        value = r.headers.get('Retry-After')
+        if value == None:
+            return None
+        try:
+            return min(self.backoff_max, float(value))
+        except ValueError:
+            return None
+
+    def __count(self, key, n=1):
+        with self.lock:
+            self.metrics[key] += n
+
+    def __mount_session(self):
+        if self.session == None:
+            self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=self.max_concurrency, pool_maxsize=self.max_concurrency)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def __after_fork(self):
+        # A forked deploy process starts over with its own session, locks and
+        # host state. Its copy of the parent's session is dropped without
+        # closing it, its sockets and pool locks belong to the crawler threads
+        self.lock = threading.Lock()
+        self.session = None
+        self.__mount_session()
+        self.buckets = {}
+        self.limits = {}
+        self.metrics = {key: 0 for key in self.metrics}
+        self.start_time = time.monotonic()
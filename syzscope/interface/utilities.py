@@ -1,11 +1,16 @@
 import os, re, stat
 import requests
+import threading
 import numpy as np
 import json
 import datetime
 
 from bs4 import BeautifulSoup
 from dateutil import parser as time_parser
+from .httpCache import HttpCache
+from .transport import Transport
+from .commitResolver import CommitResolver
+from .caseDataset import CaseDataset, bug_types
 
 FOLDER=0
 CASE=1
@@ -274,8 +279,51 @@ def chmodX(path):
     st = os.stat(path)
     os.chmod(path, st.st_mode | stat.S_IEXEC)
 
+transport = None
+transport_lock = threading.Lock()
+
+def get_transport(concurrency=None, rate=None):
+    # One transport shared by every fetch, so parallel crawling reuses
+    # connections and stays under a single rate limit per host.
+    global transport
+    with transport_lock:
+        if transport == None:
+            transport = Transport(max_concurrency=concurrency or 10)
+        elif concurrency != None:
+            transport.set_max_concurrency(concurrency)
+        if rate != None:
+            transport.set_rate(rate)
+    return transport
+
+http_cache = None
+
+def fetch_url(url):
+    return get_transport().get(url)
+
+def enable_http_cache(path=None, max_size=2*1024*1024*1024):
+    global http_cache
+    if path == None:
+        path = os.path.join(os.getcwd(), "work/.http-cache")
+    http_cache = HttpCache(path, fetch_url, max_size=max_size)
+    return http_cache
+
 def request_get(url):
-    return requests.request(method='GET', url=url)
+    if http_cache != None:
+        return http_cache.get(url)
+    return fetch_url(url)
+
+def artifact_env(urls):
+    # The environment of a script, listing the prefetched artifacts it may
+    # copy instead of downloading them again, see scripts/artifact.sh
+    env = dict(os.environ)
+    lines = []
+    for url in urls:
+        if http_cache != None and url != None:
+            path = http_cache.local_path(url)
+            if path != None:
+                lines.append("{} {}".format(url, path))
+    env['SYZSCOPE_ARTIFACTS'] = "\n".join(lines)
+    return env
 
 def levenshtein(seq1, seq2):
     size_x = len(seq1) + 1
@@ -303,7 +351,12 @@ def levenshtein(seq1, seq2):
     #print (matrix)
     return (matrix[size_x - 1, size_y - 1])
 
-def get_patch_commit(hash):
+def get_patch_commit(hash, patch_url=None):
+        # The crawled case already knows its patch, syzbot is the fallback
+        if patch_url != None:
+            res = regx_get(r'id=(\w*)', patch_url, 0)
+            if res != None:
+                return res
         url = syzbot_host_url + syzbot_bug_base_url + hash
         req = request_get(url)
         soup = BeautifulSoup(req.text, "html.parser")
@@ -518,19 +571,28 @@ def get_case_from_file(path, workdir, folder=[]):
                     print("No hash found on case: {}".format(case_hash))
     return res
 
-def get_patch_title(hash):
-    url = syzbot_host_url + syzbot_bug_base_url + hash
-    req = request_get(url)
-    soup = BeautifulSoup(req.text, "html.parser")
-    try:
-        fix = soup.find_all('span', {'class': 'mono'})[0].contents[1]
-        url = fix.attrs['href']
-    except:
-        res=None
-    req = request_get(url)
-    soup = BeautifulSoup(req.text, "html.parser")
-    title = soup.find_all('div', {'class': 'commit-subject'})
-    return title[0].text
+def get_patch_title(hash, patch_url=None):
+    if patch_url == None:
+        url = syzbot_host_url + syzbot_bug_base_url + hash
+        req = request_get(url)
+        soup = BeautifulSoup(req.text, "html.parser")
+        try:
+            fix = soup.find_all('span', {'class': 'mono'})[0].contents[1]
+            patch_url = fix.attrs['href']
+        except:
+            return None
+    info = get_commit_resolver().resolve(regx_get(r'id=(\w*)', patch_url, 0))
+    if info == None:
+        return None
+    return info['subject']
+
+commit_resolver = None
+
+def get_commit_resolver():
+    global commit_resolver
+    if commit_resolver == None:
+        commit_resolver = CommitResolver(fetch=request_get)
+    return commit_resolver
 
 def set_compiler_version(time, config_url):
     GCC = 0
@@ -652,37 +714,30 @@ def retrieve_cases_match_regx(dirOfCases, regx):
 
 def calculate_patch_info(each):
     if 'Patch' in each:
-        r = request_get(each['Patch'])
-        soup = BeautifulSoup(r.text, "html.parser")
-        commit_info = soup.find_all('table', {'class': 'commit-info'})
-        if len(commit_info) > 0:
-            try:
-                commit_date_time_str = commit_info[0].contents[1].contents[2].contents[0]
-                merge_date_time_str = commit_info[0].contents[3].contents[2].contents[0]
-            except:
-                print(each, 'has no valid commit date')
-                return None
-            import datetime
-            from dateutil.tz import UTC
-            commit_date_time_obj = datetime.datetime.strptime(commit_date_time_str, '%Y-%m-%d %H:%M:%S %z').astimezone(UTC)
-            merge_date_time_obj = datetime.datetime.strptime(merge_date_time_str, '%Y-%m-%d %H:%M:%S %z').astimezone(UTC)
-            patched_commit = datetime.datetime.today().astimezone(UTC) - commit_date_time_obj
-            patched_merge = datetime.datetime.today().astimezone(UTC) - merge_date_time_obj
-            reported = regx_get(r'(\d+)d', each['Reported'], 0)
-            if reported == None:
-                return None
-            reported = int(reported)
-            if reported > patched_commit.days:
-                each['days_patch_commit'] = reported - patched_commit.days
-            else:
-                each['days_patch_commit'] = -1
-            if reported > patched_merge.days:
-                each['days_patch_merge'] = reported - patched_merge.days
-            else:
-                each['days_patch_merge'] = -1
-            if each['days_patch_commit']>each['days_patch_merge']:
-                return None
-            return each
+        info = get_commit_resolver().resolve(regx_get(r'id=(\w*)', each['Patch'], 0))
+        if info == None or info['commit_date'] == None:
+            print(each, 'has no valid commit date')
+            return None
+        from dateutil.tz import UTC
+        commit_date_time_obj = info['author_date'].astimezone(UTC)
+        merge_date_time_obj = info['commit_date'].astimezone(UTC)
+        patched_commit = datetime.datetime.today().astimezone(UTC) - commit_date_time_obj
+        patched_merge = datetime.datetime.today().astimezone(UTC) - merge_date_time_obj
+        reported = regx_get(r'(\d+)d', each['Reported'], 0)
+        if reported == None:
+            return None
+        reported = int(reported)
+        if reported > patched_commit.days:
+            each['days_patch_commit'] = reported - patched_commit.days
+        else:
+            each['days_patch_commit'] = -1
+        if reported > patched_merge.days:
+            each['days_patch_merge'] = reported - patched_merge.days
+        else:
+            each['days_patch_merge'] = -1
+        if each['days_patch_commit']>each['days_patch_merge']:
+            return None
+        return each
     return None
 
 def save_cases_as_json(key, max_num):
@@ -693,7 +748,7 @@ def save_cases_as_json(key, max_num):
     spec.loader.exec_module(foo)
     foo.Crawler()
     crawler = foo.Crawler(keyword=key, max_retrieve=max_num, debug=True)
-    cases = crawler.gather_cases()
+    cases, _ = crawler.gather_cases()
     with open(pwd+'/cases_{}.json'.format("-".join(key)), 'w') as f:
         for each in cases:
             #new_each = calculate_patch_info(each)
@@ -713,6 +768,46 @@ def load_cases_from_json(path):
             res.append(crash)
     return res
 
+def calculate_patches_info(cases, now=None):
+    # calculate_patch_info over a whole dataset, patches are resolved in one
+    # batch and the cases calculate_patch_info would drop are left out
+    from dateutil.tz import UTC
+    if now == None:
+        now = datetime.datetime.today().astimezone(UTC)
+    patches = cases.string_column('Patch')
+    commits = [regx_get(r'id=(\w*)', each, 0) if each != None else None for each in patches]
+    infos = get_commit_resolver().resolve_all(commits)
+    patched_commit = np.full(len(cases), -1, dtype=np.int32)
+    patched_merge = np.full(len(cases), -1, dtype=np.int32)
+    resolved = np.zeros(len(cases), dtype=bool)
+    for i in range(0, len(commits)):
+        info = infos.get(commits[i])
+        if info == None or info['commit_date'] == None:
+            continue
+        patched_commit[i] = (now - info['author_date'].astimezone(UTC)).days
+        patched_merge[i] = (now - info['commit_date'].astimezone(UTC)).days
+        resolved[i] = True
+    reported = cases.columns['Reported']
+    days_patch_commit = np.where(reported > patched_commit, reported - patched_commit, -1)
+    days_patch_merge = np.where(reported > patched_merge, reported - patched_merge, -1)
+    valid = resolved & (reported != -1) & (days_patch_commit <= days_patch_merge)
+    cases.columns['days_patch_commit'] = days_patch_commit.astype(np.int32)
+    cases.columns['days_patch_merge'] = days_patch_merge.astype(np.int32)
+    return cases.take(np.nonzero(valid)[0])
+
+def save_cases_as_dataset(key, max_num, path=None):
+    from syzscope.modules.syzbotCrawler import Crawler
+    if path == None:
+        path = os.getcwd()+'/cases_{}.npz'.format("-".join(key))
+    crawler = Crawler(keyword=key, max_retrieve=max_num, debug=True)
+    cases, _ = crawler.gather_cases()
+    dataset = CaseDataset.from_cases(cases)
+    dataset.save(path)
+    return dataset
+
+def load_cases_from_dataset(path):
+    return CaseDataset.load(path)
+
 def cmp_case_with_last_day(case):
     try:
         a = case['days_patch_merge']
@@ -721,28 +816,14 @@ def cmp_case_with_last_day(case):
     return case['days_patch_merge']
 
 def percentage_of_each_bug(crashes):
-    bug_types = ['use-after-free Write', 'use-after-free Read', 'out-of-bounds Write', 'out-of-bounds Read',
-                 'invalid-free', 'null-ptr-deref', 'WARNING', 'INFO', 'general protection fault', 'KMSAN',
-                 'possible deadlock',
-                 'KCSAN', 'BUG', 'memory leak', 'inconsistent lock state', 'suspicious RCU usage', 'kernel-infoleak',
-                 'divide error']
-    n = {}
-    rest = []
+    if not isinstance(crashes, CaseDataset):
+        crashes = CaseDataset.from_cases(crashes)
     print(len(crashes))
-    for type in bug_types:
-        n[type] = 0
-    for each in crashes:
-        found = False
-        for type in bug_types:
-            if type in each['Title']:
-                n[type] += 1
-                found = True
-                break
-        if not found:
-            rest.append(each['Title'])
-    for type in bug_types:
-        print(type, n[type], str(n[type] / len(crashes) * 100) + "%")
-    for each in rest:
+    types = crashes.columns['bug_type']
+    n = np.bincount(types[types >= 0], minlength=len(bug_types))
+    for i in range(0, len(bug_types)):
+        print(bug_types[i], n[i], str(n[i] / len(crashes) * 100) + "%")
+    for each in crashes.string_column('Title')[types == -1]:
         print(each)
 
 def type_of_bug(title, bug_types):
@@ -752,32 +833,24 @@ def type_of_bug(title, bug_types):
     return None
 
 def get_median_average(sorted_cases, keyword, bug_name=None):
-    d = 0
-    n = 0
-    p = {}
-    unduplicated = []
-    median = 0
+    # Cases count once per patch, in the order given
+    if isinstance(sorted_cases, CaseDataset):
+        cases = sorted_cases
+    else:
+        cases = CaseDataset.from_cases(sorted_cases)
     if bug_name == None:
-        keys = []
+        candidates = np.arange(len(cases))
     else:
-        keys = bug_name.split(' && ')
-    for i in range(0, len(sorted_cases)):
-        if sorted_cases[i]['Patch'] not in p:
-            same_type = True
-            for j in range(0, len(keys)):
-                key = keys[j]
-                if key in sorted_cases[i]['Title']:
-                    break
-                if j == len(keys) - 1:
-                    same_type = False
-            if not same_type:
-                continue
-            n += 1
-            d += sorted_cases[i][keyword]
-            p[sorted_cases[i]['Patch']] = 1
-            unduplicated.append(sorted_cases[i])
-    median = unduplicated[len(unduplicated) // 2][keyword]
-    average = d / n
+        candidates = np.nonzero(cases.title_contains(bug_name.split(' && ')))[0]
+    _, first = np.unique(cases.columns['Patch'][candidates], return_index=True)
+    index = candidates[np.sort(first)]
+    values = cases.columns[keyword][index]
+    median = int(values[len(values) // 2])
+    average = int(values.sum()) / len(values)
+    if isinstance(sorted_cases, CaseDataset):
+        unduplicated = cases.take(index)
+    else:
+        unduplicated = [sorted_cases[i] for i in index]
     return median, average, unduplicated
 
 def duplicated_warning():
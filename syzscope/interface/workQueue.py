@@ -0,0 +1,143 @@
+import json
+import os
+import socket
+import sqlite3
+import time
+
+from contextlib import contextmanager
+
+schema = [
+    """CREATE TABLE IF NOT EXISTS cases (
+        hash TEXT PRIMARY KEY,
+        record TEXT,
+        priority REAL DEFAULT 0,
+        seq INTEGER,
+        state TEXT DEFAULT 'queued',
+        node TEXT,
+        lease_until REAL,
+        attempts INTEGER DEFAULT 0,
+        result TEXT,
+        updated REAL)""",
+    "CREATE INDEX IF NOT EXISTS cases_state ON cases (state, priority, seq)",
+    """CREATE TABLE IF NOT EXISTS stages (
+        hash TEXT,
+        stage TEXT,
+        node TEXT,
+        ok INTEGER,
+        wall REAL,
+        time REAL)""",
+    """CREATE TABLE IF NOT EXISTS nodes (
+        node TEXT PRIMARY KEY,
+        heartbeat REAL,
+        cases INTEGER)""",
+    "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)",
+]
+
+def default_node_name():
+    return "{}-{}".format(socket.gethostname(), os.getpid())
+
+class WorkQueue:
+    """
+    Cases shared by several SyzScope nodes through one SQLite database,
+    eg. on a shared filesystem. The coordinator pushes cases with their
+    records, nodes lease them one at a time and keep their leases alive
+    with heartbeats. A lease that is not renewed in time, because its node
+    died, puts the case back in the queue, up to max_attempts times.
+    """
+    def __init__(self, path, max_attempts=3, timeout=60):
+        self.path = path
+        self.max_attempts = max_attempts
+        self.timeout = timeout
+        with self.__transaction() as db:
+            for each in schema:
+                db.execute(each)
+
+    def push(self, hash_val, record, priority=0):
+        # A case already in the queue keeps its state, only its record is refreshed
+        with self.__transaction() as db:
+            seq = db.execute("SELECT COALESCE(MAX(seq), 0) + 1 FROM cases").fetchone()[0]
+            db.execute("INSERT INTO cases (hash, record, priority, seq, updated) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT(hash) DO UPDATE SET record=excluded.record",
+                (hash_val, json.dumps(record), priority, seq, time.time()))
+
+    def close(self):
+        # No more cases are coming, nodes exit once the queue drains
+        with self.__transaction() as db:
+            db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('closed', '1')")
+
+    def reopen(self):
+        with self.__transaction() as db:
+            db.execute("DELETE FROM meta WHERE key='closed'")
+
+    def lease(self, node, lease_time):
+        now = time.time()
+        with self.__transaction() as db:
+            self.__requeue_expired(db, now)
+            row = db.execute("SELECT hash, record FROM cases WHERE state='queued' ORDER BY priority, seq LIMIT 1").fetchone()
+            if row == None:
+                return None
+            db.execute("UPDATE cases SET state='leased', node=?, lease_until=?, attempts=attempts+1, updated=? WHERE hash=?",
+                (node, now + lease_time, now, row[0]))
+            return row[0], json.loads(row[1])
+
+    def heartbeat(self, node, hashes, lease_time):
+        now = time.time()
+        with self.__transaction() as db:
+            db.execute("INSERT OR REPLACE INTO nodes (node, heartbeat, cases) VALUES (?, ?, ?)", (node, now, len(hashes)))
+            for hash_val in hashes:
+                db.execute("UPDATE cases SET lease_until=?, updated=? WHERE hash=? AND node=? AND state='leased'",
+                    (now + lease_time, now, hash_val, node))
+
+    def report_stage(self, hash_val, stage, node, ok, wall):
+        with self.__transaction() as db:
+            db.execute("INSERT INTO stages (hash, stage, node, ok, wall, time) VALUES (?, ?, ?, ?, ?, ?)",
+                (hash_val, stage, node, int(ok), wall, time.time()))
+
+    def complete(self, hash_val, node, ok, result=None):
+        # False when the lease expired and the case went to someone else
+        with self.__transaction() as db:
+            cur = db.execute("UPDATE cases SET state=?, result=?, updated=? WHERE hash=? AND node=? AND state='leased'",
+                ('done' if ok else 'failed', result, time.time(), hash_val, node))
+            return cur.rowcount == 1
+
+    def requeue_expired(self):
+        with self.__transaction() as db:
+            return self.__requeue_expired(db, time.time())
+
+    def drained(self):
+        with self.__transaction() as db:
+            closed = db.execute("SELECT value FROM meta WHERE key='closed'").fetchone() != None
+            left = db.execute("SELECT COUNT(*) FROM cases WHERE state IN ('queued', 'leased')").fetchone()[0]
+            return closed and left == 0
+
+    def stats(self):
+        with self.__transaction() as db:
+            rows = db.execute("SELECT state, COUNT(*) FROM cases GROUP BY state").fetchall()
+            nodes = db.execute("SELECT COUNT(*) FROM nodes WHERE heartbeat > ?", (time.time() - 10*60,)).fetchone()[0]
+        counts = dict(rows)
+        return "{} queued, {} leased, {} done, {} failed, {} nodes alive".format(counts.get('queued', 0),
+            counts.get('leased', 0), counts.get('done', 0), counts.get('failed', 0), nodes)
+
+    def __requeue_expired(self, db, now):
+        cur = db.execute("UPDATE cases SET state='queued', node=NULL, updated=? WHERE state='leased' AND lease_until < ? AND attempts < ?",
+            (now, now, self.max_attempts))
+        n = cur.rowcount
+        db.execute("UPDATE cases SET state='failed', result='lease expired', updated=? WHERE state='leased' AND lease_until < ?",
+            (now, now))
+        return n
+
+    @contextmanager
+    def __transaction(self):
+        # Rollback journal rather than WAL, WAL needs shared memory that
+        # network filesystems don't provide
+        db = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+        try:
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                yield db
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+        finally:
+            db.close()
@@ -1,3 +1,11 @@
-from .syzbotCrawler import Crawler
-from .crash import CrashChecker
-from .deploy import Deployer
+from syzscope.interface.lazyImport import lazy_getattr
+
+# Submodules are only imported once their class is used, so a subcommand
+# that never crawls or deploys doesn't pay for them
+__getattr__ = lazy_getattr(__name__, {
+    'Crawler': '.syzbotCrawler',
+    'SyzbotMirror': '.syzbotMirror',
+    'MirrorServer': '.syzbotMirror',
+    'CrashChecker': '.crash',
+    'Deployer': '.deploy',
+})
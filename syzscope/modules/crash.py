@@ -7,7 +7,7 @@ import threading
 import json
 import pathlib
 import queue
-from syzscope.interface.vm import VM
+from contextlib import nullcontext
 
 from subprocess import call, Popen, PIPE, STDOUT
 from .syzbotCrawler import Crawler
@@ -34,7 +34,7 @@ SUSPICIOUS = 2
 thread_fn = None
 
 class CrashChecker:
-    def __init__(self, project_path, case_path, ssh_port, logger, debug, offset, qemu_num, store_read=True, compiler="gcc-7", max_compiling_kernel=1):
+    def __init__(self, project_path, case_path, ssh_port, logger, debug, offset, qemu_num, store_read=True, compiler="gcc-7", max_compiling_kernel=1, resources=None):
         os.makedirs("{}/poc".format(case_path), exist_ok=True)
         self.logger = logger
         self.project_path = project_path
@@ -43,13 +43,19 @@ class CrashChecker:
         self.image_path = "{}/img".format(self.case_path)
         self.linux_path = "{}/linux".format(self.case_path)
         self.qemu_num = qemu_num
-        self.ssh_port = ssh_port
+        # One port per VM, a single port means the ones after it
+        if isinstance(ssh_port, list):
+            self.ssh_ports = ssh_port
+        else:
+            self.ssh_ports = [ssh_port + i for i in range(0, qemu_num)]
+        self.ssh_port = self.ssh_ports[0]
         self.kasan_func_list = self.read_kasan_funcs()
         self.debug = debug
         self.store_read = store_read
         self.compiler = compiler
         self.kill_qemu = False
         self.max_compiling_kernel = max_compiling_kernel
+        self.resources = resources
         self.queue = queue.Queue()
         self.case_logger = self.__init_case_logger("{}-info".format(case_path))
 
@@ -156,15 +162,22 @@ class CrashChecker:
         exitcode = self.deploy_linux(linux_commit, config, 0)
         return res
     
+    def hold(self, stage, **tokens):
+        if self.resources == None:
+            return nullcontext()
+        return self.resources.hold(stage, tag=os.path.basename(self.case_path), **tokens)
+
     def patch_applying_check(self, linux_commit, config, patch_commit):
         target = os.path.join(self.package_path, "scripts/patch_applying_check.sh")
         utilities.chmodX(target)
-        p = Popen([target, self.linux_path, linux_commit, config, patch_commit, self.compiler, str(self.max_compiling_kernel),   ],
-                stdout=PIPE,
-                stderr=STDOUT)
-        with p.stdout:
-            self.__log_subprocess_output(p.stdout, logging.INFO)
-        exitcode = p.wait()
+        with self.hold('build_kernel'):
+            p = Popen([target, self.linux_path, linux_commit, config, patch_commit, self.compiler, str(self.max_compiling_kernel),   ],
+                    stdout=PIPE,
+                    stderr=STDOUT,
+                    env=utilities.artifact_env([config]))
+            with p.stdout:
+                self.__log_subprocess_output(p.stdout, logging.INFO)
+            exitcode = p.wait()
         return exitcode
     
     def read_kasan_funcs(self):
@@ -230,7 +243,7 @@ class CrashChecker:
         res = []
         trigger = False
         repro_type = utilities.CASE
-        if utilities.regx_match(r'https:\/\/syzkaller\.appspot\.com\/', syz_repro):
+        if utilities.regx_match(r'^https?:\/\/', syz_repro):
             repro_type = utilities.URL
         c_hash = ""
         if repro_type == utilities.CASE:
@@ -244,24 +257,25 @@ class CrashChecker:
             res = self.read_from_log(log)
         else:
             self.case_logger.info("=============================crash.read_crash=============================")
-            for i in range(0, self.qemu_num):
-                x = threading.Thread(target=self.trigger_ori_crash, args=(syz_repro, syz_commit, c_repro, i386, i, c_hash, repro_type, fixed, ), name="trigger_ori_crash-{}".format(i))
-                x.start()
-                if self.debug:
-                    x.join()
-                #crashes, trigger = self.trigger_ori_crash(syz_repro, syz_commit, c_repro, i386, fixed)
-            for i in range(0, self.qemu_num):
-                [crashes, high_risk] = self.queue.get(block=True)
-                if not trigger and high_risk:
-                    trigger = high_risk
-                    res = crashes
-                    self.kill_qemu = True
-                    if utilities.regx_match(r'https:\/\/syzkaller\.appspot\.com\/', syz_repro):
-                        self.save_crash_log(res, "ori")
-                    else:
-                        self.save_crash_log(res, c_hash[:7])
-                if res == []:
-                    res = crashes
+            with self.hold('read_crash'):
+                for i in range(0, self.qemu_num):
+                    x = threading.Thread(target=self.trigger_ori_crash, args=(syz_repro, syz_commit, c_repro, i386, i, c_hash, repro_type, fixed, ), name="trigger_ori_crash-{}".format(i))
+                    x.start()
+                    if self.debug:
+                        x.join()
+                    #crashes, trigger = self.trigger_ori_crash(syz_repro, syz_commit, c_repro, i386, fixed)
+                for i in range(0, self.qemu_num):
+                    [crashes, high_risk] = self.queue.get(block=True)
+                    if not trigger and high_risk:
+                        trigger = high_risk
+                        res = crashes
+                        self.kill_qemu = True
+                        if utilities.regx_match(r'^https?:\/\/', syz_repro):
+                            self.save_crash_log(res, "ori")
+                        else:
+                            self.save_crash_log(res, c_hash[:7])
+                    if res == []:
+                        res = crashes
         if len(res) == 1 and isinstance(res[0], str):
             self.case_logger.error(res[0])
             self.logger.error(res[0])
@@ -326,6 +340,10 @@ class CrashChecker:
                 f.write("\n")
     
     def deploy_linux(self, commit, config, fixed):
+        with self.hold('build_kernel'):
+            return self.__run_deploy_linux_script(commit, config, fixed)
+
+    def __run_deploy_linux_script(self, commit, config, fixed):
         target = os.path.join(self.package_path, "scripts/deploy_linux.sh")
         utilities.chmodX(target)
         p = None
@@ -338,7 +356,8 @@ class CrashChecker:
             #self.logger.info("run: scripts/deploy_linux.sh {} {} {} {}".format(self.linux_path, patch_path, commit, config))
             p = Popen([target, self.compiler, str(fixed), self.linux_path, self.project_path, str(self.max_compiling_kernel), commit, config,  "0"],
                 stdout=PIPE,
-                stderr=STDOUT)
+                stderr=STDOUT,
+                env=utilities.artifact_env([config]))
         with p.stdout:
             self.__log_subprocess_output(p.stdout, logging.INFO)
         exitcode = p.wait()
@@ -347,7 +366,8 @@ class CrashChecker:
     def trigger_ori_crash(self, syz_repro, syz_commit, c_repro, i386, th_index,c_hash,repro_type,fixed=0):
         res = []
         trgger_hunted_bug = False
-        qemu = VM(hash_tag=c_hash, linux=self.linux_path, port=self.ssh_port+th_index, image=self.image_path, proj_path="{}/poc/".format(self.case_path) ,log_name="qemu-{}.log".format(c_hash), log_suffix=str(th_index), timeout=10*60, debug=self.debug)
+        from syzscope.interface.vm import VM
+        qemu = VM(hash_tag=c_hash, linux=self.linux_path, port=self.ssh_ports[th_index], image=self.image_path, proj_path="{}/poc/".format(self.case_path) ,log_name="qemu-{}.log".format(c_hash), log_suffix=str(th_index), timeout=10*60, debug=self.debug)
         qemu.qemu_logger.info("QEMU-{} launched. Fixed={}\n".format(th_index, fixed))
         p = qemu.run()
         
@@ -366,11 +386,11 @@ class CrashChecker:
                 if p.poll() != None and not qemu.qemu_ready:
                     qemu_close = True
                 if qemu.qemu_ready and out_begin == 0:
-                    ok = self.upload_exp(syz_repro, self.ssh_port+th_index, syz_commit, repro_type, c_repro, i386, fixed, qemu.qemu_logger)
+                    ok = self.upload_exp(syz_repro, self.ssh_ports[th_index], syz_commit, repro_type, c_repro, i386, fixed, qemu.qemu_logger)
                     if not ok:
                         p.kill()
                         break
-                    ok = self.run_exp(syz_repro, self.ssh_port+th_index, repro_type, ok, i386, th_index, qemu.qemu_logger)
+                    ok = self.run_exp(syz_repro, self.ssh_ports[th_index], repro_type, ok, i386, th_index, qemu.qemu_logger)
                     if not ok:
                         p.kill()
                         break
@@ -428,7 +448,8 @@ class CrashChecker:
         p = Popen([target, self.case_path, syz_repro,
             str(port), self.image_path, syz_commit, str(repro_type), str(c_repro), str(i386), str(fixed), self.compiler],
         stdout=PIPE,
-        stderr=STDOUT)
+        stderr=STDOUT,
+        env=utilities.artifact_env([syz_repro]))
         with p.stdout:
             log_anything(p.stdout, logger, self.debug)
         exitcode = p.wait()
@@ -849,7 +870,7 @@ def reproduce_one_case(index):
                 checker.logger.info("difference of characters of two testcase: {}".format(n))
                 checker.logger.info("successful crash: {}".format(res[1]))
         if args.identify_by_patch:
-            commit = utilities.get_patch_commit(hash)
+            commit = utilities.get_patch_commit(hash, case.get("patch"))
             if commit != None:
                 checker.repro_on_fixed_kernel(syz_commit, case["commit"], config, c_repro, i386, commit)
 
@@ -1,5 +1,9 @@
 import datetime
 import logging
+
+from contextlib import nullcontext
+from syzscope.interface.portAllocator import PortAllocator
+from syzscope.interface.stageTimes import StageTimes
 import os, stat, sys
 
 stamp_finish_fuzzing = "FINISH_FUZZING"
@@ -8,11 +12,12 @@ stamp_build_kernel = "BUILD_KERNEL"
 stamp_reproduce_ori_poc = "REPRO_ORI_POC"
 stamp_symbolic_execution = "FINISH_SYM_EXEC"
 stamp_static_analysis = "FINISH_STATIC_ANALYSIS"
+stamp_succeed = "SUCCEED"
 
 max_qemu_for_one_case = 4
 
 class Case:
-    def __init__(self, index, parallel_max, debug=False, force=False, port=53777, replay='incomplete', linux_index=-1, time=8, kernel_fuzzing=False, reproduce=False, alert=[], static_analysis=False, symbolic_execution=False, gdb_port=1235, qemu_monitor_port=9700, max_compiling_kernel=-1):
+    def __init__(self, index, parallel_max, debug=False, force=False, port=53777, replay='incomplete', linux_index=-1, time=8, kernel_fuzzing=False, reproduce=False, alert=[], static_analysis=False, symbolic_execution=False, gdb_port=1235, qemu_monitor_port=9700, max_compiling_kernel=-1, resources=None):
         self.linux_folder = "linux"
         self.project_path = ""
         self.package_path = None
@@ -41,6 +46,7 @@ class Case:
         if max_compiling_kernel == -1:
             self.max_compiling_kernel = parallel_max
         self.max_qemu_for_one_case = max_qemu_for_one_case
+        self.resources = resources
         self.sa = None
         if replay == None:
             self.replay = False
@@ -48,9 +54,13 @@ class Case:
         else:
             self.replay = True
             self.catalog = replay
+        # Only hints, lease_ports() picks the ports actually used
         self.ssh_port = port + max_qemu_for_one_case*index
         self.gdb_port = gdb_port + max_qemu_for_one_case*index
         self.qemu_monitor_port = qemu_monitor_port + max_qemu_for_one_case*index
+        self.ssh_ports = [self.ssh_port + i for i in range(0, max_qemu_for_one_case)]
+        self.ports = PortAllocator()
+        self.stage_times = StageTimes()
         if linux_index != -1:
             self.index = linux_index
         self.debug = debug
@@ -75,6 +85,23 @@ class Case:
             self.logger.setLevel(logging.INFO)
             self.logger.propagate = False
     
+    def hold(self, stage, **tokens):
+        # Blocks until the host has room for this stage of the case
+        if self.resources == None:
+            return nullcontext()
+        return self.resources.hold(stage, tag=self.hash_val[:7], **tokens)
+
+    def lease_ports(self):
+        # One ssh port per VM read_crash boots, the first one is shared by
+        # symbolic execution and syzkaller's http server
+        self.ssh_ports = self.ports.lease(hint=self.ssh_port, count=self.max_qemu_for_one_case)
+        self.ssh_port = self.ssh_ports[0]
+        self.gdb_port = self.ports.lease(hint=self.gdb_port)[0]
+        self.qemu_monitor_port = self.ports.lease(hint=self.qemu_monitor_port)[0]
+
+    def release_ports(self):
+        self.ports.release()
+
     def setup_hash(self, hash_val):
         self.hash_val = hash_val
         self.init_logger(self.debug, self.hash_val[:7])
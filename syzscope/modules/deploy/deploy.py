@@ -12,9 +12,23 @@ from syzscope.modules.syzbotCrawler import syzbot_host_url, syzbot_bug_base_url
 from syzscope.interface import s2e, static_analysis, sym_exec
 from subprocess import call, Popen, PIPE, STDOUT
 from syzscope.interface.utilities import URL, chmodX
+from syzscope.interface.kernelTrees import kernel_state
 from dateutil import parser as time_parser
 from .worker import Workers
 
+# A case goes through these in order, the ones a run doesn't enable are skipped
+pipeline_stages = ['build', 'fuzz', 'static', 'symbolic']
+
+def enabled_stages(kernel_fuzzing, reproduce, static_analysis, symbolic_execution):
+    res = ['build']
+    if kernel_fuzzing or reproduce:
+        res.append('fuzz')
+    if static_analysis:
+        res.append('static')
+    if symbolic_execution:
+        res.append('symbolic')
+    return res
+
 syz_config_template="""
 {{ 
         "target": "linux/amd64/{8}",
@@ -42,8 +56,8 @@ syz_config_template="""
 }}"""
 
 class Deployer(Workers):
-    def __init__(self, index, parallel_max, debug=False, force=False, port=53777, replay='incomplete', linux_index=-1, time=8, kernel_fuzzing=False, reproduce=False, alert=[], static_analysis=False, symbolic_execution=False, gdb_port=1235, qemu_monitor_port=9700, max_compiling_kernel=-1, timeout_dynamic_validation=None, timeout_static_analysis=None, timeout_symbolic_execution=None, guided=False, be_bully=False, se_poc=None):
-        Workers.__init__(self, index, parallel_max, debug, force, port, replay, linux_index, time, kernel_fuzzing, reproduce, alert, static_analysis, symbolic_execution, gdb_port, qemu_monitor_port, max_compiling_kernel, timeout_dynamic_validation, timeout_static_analysis, timeout_symbolic_execution, guided, be_bully, se_poc)
+    def __init__(self, index, parallel_max, debug=False, force=False, port=53777, replay='incomplete', linux_index=-1, time=8, kernel_fuzzing=False, reproduce=False, alert=[], static_analysis=False, symbolic_execution=False, gdb_port=1235, qemu_monitor_port=9700, max_compiling_kernel=-1, timeout_dynamic_validation=None, timeout_static_analysis=None, timeout_symbolic_execution=None, guided=False, be_bully=False, se_poc=None, resources=None):
+        Workers.__init__(self, index, parallel_max, debug, force, port, replay, linux_index, time, kernel_fuzzing, reproduce, alert, static_analysis, symbolic_execution, gdb_port, qemu_monitor_port, max_compiling_kernel, timeout_dynamic_validation, timeout_static_analysis, timeout_symbolic_execution, guided, be_bully, se_poc, resources)
         self.clone_linux()
     
     def init_replay_crash(self, hash_val):
@@ -51,7 +65,14 @@ class Deployer(Workers):
         self.logger.info("run: scripts/init-replay.sh {} {}".format(self.catalog, hash_val))
         call(["syzscope/scripts/init-replay.sh", self.catalog, hash_val])
 
-    def deploy(self, hash_val, case):
+    def deploy(self, hash_val, case, stages=None):
+        # stages picks which part of the pipeline runs in this call, the
+        # stamps left by earlier calls tell what is already done. Returns
+        # 'continue' when the case goes on with its next stage, 'done' once
+        # it is finished, either early or after its last stage, and 'error'
+        # when it failed.
+        if stages == None:
+            stages = pipeline_stages
         self.setup_hash(hash_val)
         self.project_path = os.getcwd()
         self.package_path = os.path.join(self.project_path, "syzscope")
@@ -63,24 +84,29 @@ class Deployer(Workers):
         if utilities.regx_match(r'386', case["manager"]):
             self.arch = "386"
         self.logger.info(hash_val)
+        self.lease_ports()
 
-        if self.replay:
+        first = 'build' in stages
+        if self.replay and first:
             self.init_replay_crash(hash_val[:7])    
         self.compiler = utilities.set_compiler_version(time_parser.parse(case["time"]), case["config"])
         impact_without_mutating = False
-        succeed = self.__create_dir_for_case()
-        if self.force:
-            self.cleanup_built_kernel(hash_val)
-            self.cleanup_built_syzkaller(hash_val)
-            if self.kernel_fuzzing:
-                self.cleanup_reproduced_ori_poc(hash_val)
-                self.cleanup_finished_fuzzing(hash_val)
-            if self.reproduce_ori_bug:
-                self.cleanup_reproduced_ori_poc(hash_val)
-            if self.symbolic_execution:
-                self.cleanup_finished_symbolic_execution(hash_val)
-            if self.static_analysis:
-                self.cleanup_finished_static_analysis(hash_val)
+        if first:
+            if self.__create_dir_for_case():
+                # Remembered for the stage that finishes the case
+                self.create_succeed_stamp()
+            if self.force:
+                self.cleanup_built_kernel(hash_val)
+                self.cleanup_built_syzkaller(hash_val)
+                if self.kernel_fuzzing:
+                    self.cleanup_reproduced_ori_poc(hash_val)
+                    self.cleanup_finished_fuzzing(hash_val)
+                if self.reproduce_ori_bug:
+                    self.cleanup_reproduced_ori_poc(hash_val)
+                if self.symbolic_execution:
+                    self.cleanup_finished_symbolic_execution(hash_val)
+                if self.static_analysis:
+                    self.cleanup_finished_static_analysis(hash_val)
         self.case_logger = self.__init_case_logger("{}-log".format(hash_val))
         self.case_info_logger = self.__init_case_logger("{}-info".format(hash_val))
         url = syzbot_host_url + syzbot_bug_base_url + hash_val
@@ -93,100 +119,125 @@ class Deployer(Workers):
         
         #if 'use-after-free' in case['title'] or 'out-of-bounds' in case['title']:
         #    self.store_read = False
-        self.init_crash_checker(self.ssh_port)
+        self.init_crash_checker(self.ssh_ports)
 
         need_patch = 0
         #if self.__need_kasan_patch(case['title']):
         #    need_patch = 1
-        if not self.kernel_fuzzing and not self.reproduce_ori_bug:
-            contexts = self.get_buggy_contexts(case)
-            valid = 0
-            for context in contexts:
-                if context['offset'] != None and context['size'] != None and \
-                 ((context['type'] == utilities.CASE and os.path.exists(context['repro'])) or\
-                  (context['type'] == utilities.URL and context['repro'] != None)):
-                    valid = 1
-            if not valid:
-                self.logger.info("No valid offset or size")
-                self.__move_to_completed()
-                return
+        if first:
+            if not self.kernel_fuzzing and not self.reproduce_ori_bug:
+                contexts = self.get_buggy_contexts(case)
+                valid = 0
+                for context in contexts:
+                    if context['offset'] != None and context['size'] != None and \
+                     ((context['type'] == utilities.CASE and os.path.exists(context['repro'])) or\
+                      (context['type'] == utilities.URL and context['repro'] != None)):
+                        valid = 1
+                if not valid:
+                    self.logger.info("No valid offset or size")
+                    self.__move_to_completed()
+                    return 'done'
+
+            with self.hold('build_kernel'), self.timed('build', case):
+                r = self.__run_delopy_script(hash_val[:7], case, need_patch)
+            if r != 0:
+                self.logger.error("Error occur in deploy.sh")
+                self.__save_error(hash_val)
+                return 'error'
+
+        if first or 'fuzz' in stages:
+            # The config names this call's ports
+            req = utilities.request_get(case["syz_repro"])
+            self.__write_config(req.content.decode("utf-8"), hash_val[:7])
 
-        r = self.__run_delopy_script(hash_val[:7], case, need_patch)
-        if r != 0:
-            self.logger.error("Error occur in deploy.sh")
-            self.__save_error(hash_val)
-            return
-
-        req = requests.request(method='GET', url=case["syz_repro"])
         is_error = 0
-        self.__write_config(req.content.decode("utf-8"), hash_val[:7])
-        if self.kernel_fuzzing:
-            title = None
-            if not self.reproduced_ori_poc(hash_val, 'incomplete'):
-                impact_without_mutating, title = self.do_reproducing_ori_poc(case, hash_val, i386)
-            if not self.finished_fuzzing(hash_val, 'incomplete'):
-                limitedMutation = True
-                if 'patch' in case:
-                    limitedMutation = False
-                exitcode = self.run_syzkaller(hash_val, limitedMutation)
-                #self.remove_gopath(os.path.join(self.current_case_path, "poc"))
-                is_error = self.save_case(hash_val, exitcode, case, limitedMutation, impact_without_mutating, title=title)
-            else:
-                self.logger.info("{} has finished fuzzing".format(hash_val[:7]))
-        elif self.reproduce_ori_bug:
-            if not self.reproduced_ori_poc(hash_val, 'incomplete'):
-                impact_without_mutating, title = self.do_reproducing_ori_poc(case, hash_val, i386)
-                #self.remove_gopath(os.path.join(self.current_case_path, "poc"))
-                is_error = self.save_case(hash_val, 0, case, False, impact_without_mutating, title=title)
+        if 'fuzz' in stages and (self.kernel_fuzzing or self.reproduce_ori_bug):
+            with self.timed('fuzz', case):
+                if self.kernel_fuzzing:
+                    title = None
+                    if not self.reproduced_ori_poc(hash_val, 'incomplete'):
+                        impact_without_mutating, title = self.do_reproducing_ori_poc(case, hash_val, i386)
+                    if not self.finished_fuzzing(hash_val, 'incomplete'):
+                        limitedMutation = True
+                        if 'patch' in case:
+                            limitedMutation = False
+                        with self.hold('fuzzing'):
+                            exitcode = self.run_syzkaller(hash_val, limitedMutation)
+                        #self.remove_gopath(os.path.join(self.current_case_path, "poc"))
+                        is_error = self.save_case(hash_val, exitcode, case, limitedMutation, impact_without_mutating, title=title)
+                    else:
+                        self.logger.info("{} has finished fuzzing".format(hash_val[:7]))
+                elif self.reproduce_ori_bug:
+                    if not self.reproduced_ori_poc(hash_val, 'incomplete'):
+                        impact_without_mutating, title = self.do_reproducing_ori_poc(case, hash_val, i386)
+                        #self.remove_gopath(os.path.join(self.current_case_path, "poc"))
+                        is_error = self.save_case(hash_val, 0, case, False, impact_without_mutating, title=title)
 
         if is_error:
-            return
+            return 'error'
+        succeed = self.succeeded_before(hash_val)
         if self.__success_check(hash_val, "ConfirmedDoubleFree") or \
             self.__success_check(hash_val, "ConfirmedAbnormallyMemWrite"):
             succeed = True
-        valid_contexts = self.get_buggy_contexts(case)
-        if len(valid_contexts) == 0:
-            self.logger.info("No valid buggy context")
-        for context in valid_contexts:
-            if context['offset'] == None or context['size'] == None or \
-                 ((context['type'] == utilities.CASE and not os.path.exists(context['repro'])) or\
-                  (context['type'] == utilities.URL and context['repro'] == None)):
-                title = context['title']
-                self.case_logger.info("skip an invalid context")
+        analyze = (self.static_analysis and 'static' in stages) or (self.symbolic_execution and 'symbolic' in stages)
+        valid_contexts = []
+        if analyze:
+            valid_contexts = self.get_buggy_contexts(case)
+            if len(valid_contexts) == 0:
+                self.logger.info("No valid buggy context")
+        # Every context is statically analyzed before any of them is executed
+        # symbolically, so the two stages can run in different calls
+        for stage in ['static', 'symbolic']:
+            if stage not in stages or stage not in self.enabled_stages():
                 continue
+            with self.timed(stage, case):
+                for context in valid_contexts:
+                    if context['offset'] == None or context['size'] == None or \
+                         ((context['type'] == utilities.CASE and not os.path.exists(context['repro'])) or\
+                          (context['type'] == utilities.URL and context['repro'] == None)):
+                        title = context['title']
+                        self.case_logger.info("skip an invalid context")
+                        continue
 
-            self.logger.info("Dynamic validate {}".format(context['workdir']))
-            if self.static_analysis:
-                if not self.finished_static_analysis(hash_val, 'incomplete'):
-                    try:
-                        self.do_static_analysis(case, context)
-                        self.logger.info("static analysis finished")
-                    except CompilingError:
-                        self.logger.error("Encounter an error when doing static analysis")
-                else:
-                    self.logger.info("{} has finished static analysis".format(hash_val[:7]))
-
-            if self.symbolic_execution:
-                if not self.finished_symbolic_execution(hash_val, 'incomplete'):
-                    r = self.do_symbolic_execution(case, context, i386, max_round=5)
-                    if r == 0:
-                        succeed = True
-                else:
-                    self.logger.info("{} has finished symbolic execution".format(hash_val[:7]))
+                    self.logger.info("Dynamic validate {}".format(context['workdir']))
+                    if stage == 'static' and self.static_analysis:
+                        if not self.finished_static_analysis(hash_val, 'incomplete'):
+                            try:
+                                with self.hold('static_analysis'):
+                                    self.do_static_analysis(case, context)
+                                self.logger.info("static analysis finished")
+                            except CompilingError:
+                                self.logger.error("Encounter an error when doing static analysis")
+                        else:
+                            self.logger.info("{} has finished static analysis".format(hash_val[:7]))
+
+                    if stage == 'symbolic' and self.symbolic_execution:
+                        if not self.finished_symbolic_execution(hash_val, 'incomplete'):
+                            with self.hold('symbolic_execution'):
+                                r = self.do_symbolic_execution(case, context, i386, max_round=5)
+                            if r == 0:
+                                succeed = True
+                                self.create_succeed_stamp()
+                        else:
+                            self.logger.info("{} has finished symbolic execution".format(hash_val[:7]))
 
-        if self.static_analysis:
+        if self.static_analysis and 'static' in stages:
             self.create_finished_static_analysis_stamp()
-        if self.symbolic_execution:
+        if self.symbolic_execution and 'symbolic' in stages:
             self.create_finished_symbolic_execution_stamp()
 
+        if self.enabled_stages()[-1] not in stages:
+            return 'continue'
         if succeed:
             self.__move_to_succeed(0)
         elif is_error:
             self.__save_error(hash_val)
         else:
             self.__move_to_completed()
-        
-        return self.index
+        return 'done'
+
+    def enabled_stages(self):
+        return enabled_stages(self.kernel_fuzzing, self.reproduce_ori_bug, self.static_analysis, self.symbolic_execution)
 
     def clone_linux(self):
         self.__run_linux_clone_script()
@@ -477,7 +528,7 @@ class Deployer(Workers):
         res = []
         if utilities.regx_match(r'386', case["manager"]):
             i386 = True
-        commit = utilities.get_patch_commit(hash_val)
+        commit = utilities.get_patch_commit(hash_val, case.get("patch"))
         if commit != None:
             res = self.crash_checker.repro_on_fixed_kernel(syz_commit, case["commit"], config, c_repro, i386, commit, crashes_path=crashes_path, limitedMutation=limitedMutation)
         return res
@@ -511,9 +562,10 @@ class Deployer(Workers):
         chmodX(target)
         index = str(self.index)
         self.logger.info("run: scripts/deploy.sh")
-        p = Popen([target, self.linux_folder, hash_val, commit, syzkaller, config, testcase, index, self.catalog, image, self.arch, self.compiler, str(self.max_compiling_kernel)],
+        p = Popen([target, self.linux_folder, hash_val, commit, syzkaller, config, testcase, index, self.catalog, image, self.arch, self.compiler, str(self.max_compiling_kernel), str(kernel_state(case))],
                 stdout=PIPE,
-                stderr=STDOUT
+                stderr=STDOUT,
+                env=utilities.artifact_env([config, testcase])
                 )
         with p.stdout:
             self.__log_subprocess_output(p.stdout, logging.INFO)
@@ -1,6 +1,5 @@
 import re
 import os, stat, sys
-from syzscope.interface.sym_exec.stateManager import StateManager
 import requests
 import threading
 import logging
@@ -8,13 +7,16 @@ import time
 import shutil
 import syzscope.interface.utilities as utilities
 
+from contextlib import contextmanager
+
 from syzscope.modules.syzbotCrawler import syzbot_host_url, syzbot_bug_base_url
 from syzscope.interface import s2e, static_analysis, sym_exec
 from subprocess import call, Popen, PIPE, STDOUT
 from syzscope.modules.crash import CrashChecker
 from syzscope.interface.utilities import chmodX
+from syzscope.interface.stageTimes import cpu_time, features_of
 from dateutil import parser as time_parser
-from .case import Case, stamp_build_kernel, stamp_build_syzkaller, stamp_finish_fuzzing, stamp_reproduce_ori_poc, stamp_symbolic_execution, stamp_static_analysis
+from .case import Case, stamp_build_kernel, stamp_build_syzkaller, stamp_finish_fuzzing, stamp_reproduce_ori_poc, stamp_symbolic_execution, stamp_static_analysis, stamp_succeed
 from syzscope.interface.sym_exec.error import VulnerabilityNotTrigger, ExecutionError, AbnormalGDBBehavior, InvalidCPU
 from syzscope.interface.static_analysis.error import CompilingError
 from syzscope.interface.vm.error import QemuIsDead, AngrRefuseToLoadKernel, KasanReportEntryNotFound
@@ -23,8 +25,8 @@ TIMEOUT_DYNAMIC_VALIDATION=60*60
 TIMEOUT_STATIC_ANALYSIS=60*30
 
 class Workers(Case):
-    def __init__(self, index, parallel_max, debug=False, force=False, port=53777, replay='incomplete', linux_index=-1, time=8, kernel_fuzzing=False, reproduce=False, alert=[], static_analysis=False, symbolic_execution=False, gdb_port=1235, qemu_monitor_port=9700, max_compiling_kernel=-1, timeout_dynamic_validation=None, timeout_static_analysis=None, timeout_symbolic_execution=None, guided=False, be_bully=False, se_poc=None):
-        Case.__init__(self, index, parallel_max, debug, force, port, replay, linux_index, time, kernel_fuzzing, reproduce, alert, static_analysis, symbolic_execution, gdb_port, qemu_monitor_port, max_compiling_kernel)
+    def __init__(self, index, parallel_max, debug=False, force=False, port=53777, replay='incomplete', linux_index=-1, time=8, kernel_fuzzing=False, reproduce=False, alert=[], static_analysis=False, symbolic_execution=False, gdb_port=1235, qemu_monitor_port=9700, max_compiling_kernel=-1, timeout_dynamic_validation=None, timeout_static_analysis=None, timeout_symbolic_execution=None, guided=False, be_bully=False, se_poc=None, resources=None):
+        Case.__init__(self, index, parallel_max, debug, force, port, replay, linux_index, time, kernel_fuzzing, reproduce, alert, static_analysis, symbolic_execution, gdb_port, qemu_monitor_port, max_compiling_kernel, resources)
         if timeout_dynamic_validation == None:
             self.timeout_dynamic_validation=TIMEOUT_DYNAMIC_VALIDATION
         else:
@@ -114,6 +116,8 @@ class Workers(Case):
                     if p != []:
                         paths.append(p)
 
+        # Imports angr, only when symbolic execution is enabled
+        from syzscope.interface.sym_exec.stateManager import StateManager
         os.mkdir(sym_folder)
         is_propagating_global = False
         result = StateManager.NO_ADDITIONAL_USE
@@ -485,18 +489,19 @@ class Workers(Case):
         except Exception as e:
             self.logger.error("Fail to remove {}".format(gopath))
     
-    def init_crash_checker(self, port):
+    def init_crash_checker(self, ports):
         self.crash_checker = CrashChecker(
             self.project_path,
             self.current_case_path,
-            port,
+            ports,
             self.logger,
             self.debug,
             self.index,
             self.max_qemu_for_one_case,
             store_read=self.store_read,
             compiler=self.compiler,
-            max_compiling_kernel=self.max_compiling_kernel)
+            max_compiling_kernel=self.max_compiling_kernel,
+            resources=self.resources)
     
     def write_to_confirm(self, hash_val, new_impact_type):
         if new_impact_type & utilities.AbMemRead:
@@ -529,6 +534,40 @@ class Workers(Case):
     
     def create_reproduced_ori_poc_stamp(self):
         return self.__create_stamp(stamp_reproduce_ori_poc)
+
+    @contextmanager
+    def timed(self, stage, case):
+        # A stage finished by an earlier run takes no time and says nothing
+        # about what the case costs
+        if self.stage_finished(stage):
+            yield
+            return
+        features = features_of(self.hash_val, case, self.catalog)
+        begin = time.time()
+        cpu = cpu_time()
+        ok = False
+        try:
+            yield
+            ok = True
+        finally:
+            self.stage_times.record(self.hash_val, stage, time.time() - begin, cpu_time() - cpu, features, ok)
+
+    def stage_finished(self, stage):
+        if stage == 'fuzz':
+            if self.kernel_fuzzing:
+                return self.finished_fuzzing(self.hash_val, 'incomplete')
+            return self.reproduced_ori_poc(self.hash_val, 'incomplete')
+        if stage == 'static':
+            return self.finished_static_analysis(self.hash_val, 'incomplete')
+        if stage == 'symbolic':
+            return self.finished_symbolic_execution(self.hash_val, 'incomplete')
+        return False
+
+    def create_succeed_stamp(self):
+        return self.__create_stamp(stamp_succeed)
+
+    def succeeded_before(self, hash_val):
+        return self.__check_stamp(stamp_succeed, hash_val[:7], self.catalog)
     
     def cleanup_finished_fuzzing(self, hash_val):
         self.__clean_stamp(stamp_finish_fuzzing, hash_val[:7])
@@ -2,21 +2,216 @@ import requests
 import logging
 import os
 import re
+import datetime
 
-from syzscope.interface.utilities import request_get, extract_vul_obj_offset_and_size, regx_get
+from concurrent.futures import ThreadPoolExecutor
+from syzscope.interface.utilities import request_get, get_transport, extract_vul_obj_offset_and_size, regx_get
 from bs4 import BeautifulSoup
 from bs4 import element
+from html.parser import HTMLParser
+from urllib.parse import urlsplit
 
 syzbot_bug_base_url = "bug?id="
 syzbot_host_url = "https://syzkaller.appspot.com/"
 num_of_elements = 8
+last_crash_format = "%Y-%m-%d %H:%M"
+
+def host_of_url(url):
+    parts = urlsplit(url)
+    if parts.scheme == '' or parts.netloc == '':
+        return syzbot_host_url
+    return "{}://{}/".format(parts.scheme, parts.netloc)
+
+def age_to_date(age, now=None):
+    # syzbot prints ages like "1042d", "1d02h" or "5h23m"
+    if now == None:
+        now = datetime.datetime.utcnow()
+    days = regx_get(r'(\d+)d', age, 0)
+    hours = regx_get(r'(\d+)h', age, 0)
+    minutes = regx_get(r'(\d+)m', age, 0)
+    if days == None and hours == None and minutes == None:
+        return None
+    delta = datetime.timedelta(days=int(days or 0), hours=int(hours or 0), minutes=int(minutes or 0))
+    return now - delta
+
+class ListTableParser(HTMLParser):
+    """
+    Incremental tokenizer for the rows of syzbot's list_table. Only the
+    title, stat and commit_list cells of each row are kept.
+    """
+    kept_cells = ['title', 'stat', 'commit_list']
+    ascii_spaces = str.maketrans('', '', '\x20\x0a\x09\x0c\x0d')
+
+    def __init__(self):
+        HTMLParser.__init__(self)
+        self.n_tables = 0
+        self.rows = []
+        self.table_depth = 0
+        self.row = None
+        self.cell = None
+        self.text = []
+        self.pending = []
+        self.href = None
+
+    def pop_rows(self):
+        rows = self.rows
+        self.rows = []
+        return rows
+
+    def handle_starttag(self, tag, attrs):
+        self.__flush_data()
+        if tag == 'table':
+            if self.table_depth > 0:
+                self.table_depth += 1
+            elif 'list_table' in (dict(attrs).get('class') or '').split():
+                self.table_depth = 1
+                self.n_tables += 1
+            return
+        if self.table_depth == 0:
+            return
+        if tag == 'tr':
+            self.__close_row()
+            self.row = {'title': None, 'href': None, 'stats': [], 'patch': None}
+        elif tag == 'td' and self.row != None:
+            self.__close_cell()
+            for each in (dict(attrs).get('class') or '').split():
+                if each in self.kept_cells:
+                    self.cell = each
+                    break
+        elif tag == 'a' and self.cell != None and self.href == None:
+            self.href = dict(attrs).get('href')
+
+    def handle_endtag(self, tag):
+        self.__flush_data()
+        if self.table_depth == 0:
+            return
+        if tag == 'td':
+            self.__close_cell()
+        elif tag == 'tr':
+            self.__close_row()
+        elif tag == 'table':
+            self.table_depth -= 1
+            if self.table_depth == 0:
+                self.__close_row()
+
+    def handle_data(self, data):
+        if self.cell != None:
+            self.pending.append(data)
+
+    def __flush_data(self):
+        # Collapse whitespace-only strings the way BeautifulSoup does, so
+        # titles and stats come out exactly as they did from the DOM.
+        if len(self.pending) == 0:
+            return
+        data = ''.join(self.pending)
+        self.pending = []
+        if data.translate(self.ascii_spaces) == '':
+            if '\n' in data:
+                data = '\n'
+            else:
+                data = ' '
+        self.text.append(data)
+
+    def __close_cell(self):
+        if self.cell == 'title':
+            self.row['title'] = ''.join(self.text)
+            self.row['href'] = self.href
+        elif self.cell == 'stat':
+            self.row['stats'].append(''.join(self.text))
+        elif self.cell == 'commit_list':
+            self.row['patch'] = self.href
+        self.cell = None
+        self.text = []
+        self.href = None
+
+    def __close_row(self):
+        if self.row == None:
+            return
+        self.__close_cell()
+        if self.row['title'] != None and self.row['href'] != None:
+            self.rows.append(self.row)
+        self.row = None
+
+class BugPage:
+    """
+    Everything SyzScope needs from one syzbot bug page, extracted in a
+    single parse so the page never has to be downloaded twice.
+    crashes holds one entry per upstream crash row, in page order, or
+    None for a row that could not be parsed.
+    """
+    def __init__(self, url, text, host_url=syzbot_host_url):
+        self.url = url
+        self.host_url = host_url
+        self.title = None
+        self.patch = None
+        self.manager = None
+        self.crashes = []
+        self.has_tables = False
+        self.parse(text)
+
+    def parse(self, text):
+        soup = BeautifulSoup(text, "html.parser")
+        try:
+            self.title = str(soup.body.b.contents[0])
+        except (AttributeError, IndexError):
+            pass
+        mono = soup.find("span", {"class": "mono"})
+        if mono != None:
+            try:
+                self.patch = mono.contents[1].attrs['href']
+            except:
+                pass
+        tables = soup.find_all('table', {"class": "list_table"})
+        self.has_tables = len(tables) > 0
+        for table in tables:
+            if table.text.find('Crash') != -1:
+                for case in table.tbody.contents:
+                    if type(case) == element.Tag:
+                        kernel = case.find('td', {"class": "kernel"})
+                        if kernel.text != "upstream":
+                            continue
+                        self.crashes.append(self.parse_crash(case))
+                break
+        for crash in self.crashes:
+            if crash != None:
+                self.manager = crash['manager']
+                break
+
+    def parse_crash(self, case):
+        try:
+            crash = {}
+            crash['manager'] = case.find('td', {"class": "manager"}).text
+            crash['time'] = case.find('td', {"class": "time"}).text
+            tags = case.find_all('td', {"class": "tag"})
+            m = re.search(r'id=([0-9a-z]*)', tags[0].next.attrs['href'])
+            crash['commit'] = m.groups()[0]
+            m = re.search(r'commits\/([0-9a-z]*)', tags[1].next.attrs['href'])
+            crash['syzkaller'] = m.groups()[0]
+            crash['config'] = self.host_url + case.find('td', {"class": "config"}).next.attrs['href']
+            repros = case.find_all('td', {"class": "repro"})
+            crash['log'] = self.host_url + repros[0].next.attrs['href']
+            crash['report'] = self.host_url + repros[1].next.attrs['href']
+        except:
+            return None
+        crash['syz_repro'] = self.__repro_url(repros, 2)
+        crash['c_repro'] = self.__repro_url(repros, 3)
+        return crash
+
+    def __repro_url(self, repros, index):
+        try:
+            return self.host_url + repros[index].next.attrs['href']
+        except:
+            return None
 
 class Crawler:
     def __init__(self,
                  url="https://syzkaller.appspot.com/upstream/fixed",
                  keyword=[''], max_retrieve=10, deduplicate=[''], ignore_batch=[], filter_by_reported=-1, 
-                 filter_by_closed=-1, include_high_risk=False, debug=False):
+                 filter_by_closed=-1, include_high_risk=False, concurrency=1, sink=None, index=None, debug=False):
         self.url = url
+        # Artifacts and bug pages live on the same host as the list page, so
+        # a local mirror of syzbot can be crawled just like the real one.
+        self.host_url = host_of_url(url)
         if type(keyword) == list:
             self.keyword = keyword
         else:
@@ -29,12 +224,20 @@ class Crawler:
         self.max_retrieve = max_retrieve
         self.cases = {}
         self.patches = {}
+        self.bug_pages = {}
         self.logger = None
         self.logger2file = None
         self.include_high_risk = include_high_risk
         self.init_logger(debug)
         self.filter_by_reported = filter_by_reported
         self.filter_by_closed = filter_by_closed
+        self.concurrency = max(1, concurrency)
+        get_transport(concurrency=self.concurrency)
+        # sink is called with the hash of every case as soon as it is fully
+        # retrieved, so cases can be deployed while the crawl goes on.
+        self.sink = sink
+        # Summaries of cases crawled before, hash -> {'title', 'patch', ...}
+        self.index = index or {}
 
     def init_logger(self, debug):
         handler = logging.FileHandler("{}/info".format(os.getcwd()))
@@ -54,10 +257,10 @@ class Crawler:
             self.logger2file.propagate = False
         self.logger2file.addHandler(handler)
 
-    def run(self):
+    def run(self, previous=None):
         if len(self.ignore_batch) > 0:
             for hash_val in self.ignore_batch:
-                patch_url = self.get_patch_of_case(hash_val)
+                patch_url = self.__known_patch(hash_val)
                 if patch_url == None:
                     continue
                 commit = regx_get(r"https:\/\/git\.kernel\.org\/pub\/scm\/linux\/kernel\/git\/torvalds\/linux\.git\/commit\/\?id=(\w+)", patch_url, 0)
@@ -66,6 +269,7 @@ class Crawler:
                 self.patches[commit] = True
             print("Ignore {} patches".format(len(self.patches)))
         cases_hash, high_risk_impacts = self.gather_cases()
+        selected = []
         for each in cases_hash:
             if 'Patch' in each:
                 patch_url = each['Patch']
@@ -74,54 +278,131 @@ class Crawler:
                     (commit in high_risk_impacts and not self.include_high_risk):
                     continue
                 self.patches[commit] = True
-            if self.retreive_case(each['Hash']) != -1:
+            selected.append(each)
+        if previous == None:
+            self.retreive_cases(selected)
+            return
+        # A case store answers from its index without loading records
+        summary = getattr(previous, 'summary', previous.get)
+        changed = []
+        for each in selected:
+            if self.__row_changed(each, summary(each['Hash'])):
+                changed.append(each)
+            else:
+                self.cases[each['Hash']] = previous[each['Hash']]
+                self.__emit(each['Hash'])
+        self.logger.info("{} of {} cases are new or changed since the last crawl".format(len(changed), len(selected)))
+        self.retreive_cases(changed)
+        merged = {}
+        for each in selected:
+            if each['Hash'] in self.cases:
+                merged[each['Hash']] = self.cases[each['Hash']]
+            elif each['Hash'] in previous:
+                # failed to refresh this time, keep the old record
+                merged[each['Hash']] = previous[each['Hash']]
+                self.__emit(each['Hash'])
+        self.cases = merged
+        return
+
+    def __known_patch(self, hash):
+        if hash in self.index and self.index[hash].get('patch') != None:
+            return self.index[hash]['patch']
+        return self.get_patch_of_case(hash)
+
+    def __row_changed(self, row, case):
+        if case == None or 'count' not in case:
+            return True
+        if case['count'] != row['Count'] or case.get('patch') != row.get('Patch'):
+            return True
+        last_crash = age_to_date(row['Last'])
+        if last_crash == None or case.get('last_crash') == None:
+            return case.get('last') != row['Last']
+        # Ages are rounded to days on the list page, allow that much drift
+        prev_last_crash = datetime.datetime.strptime(case['last_crash'], last_crash_format)
+        return abs(last_crash - prev_last_crash) > datetime.timedelta(days=2)
+
+    def retreive_cases(self, crashes):
+        hashes = [each['Hash'] for each in crashes]
+        for each, detail in zip(crashes, self.__map(self.request_detail, hashes)):
+            if self.__fill_case(each['Hash'], detail) != -1:
                 self.cases[each['Hash']]['title'] = each['Title']
                 if 'Patch' in each:
                     self.cases[each['Hash']]['patch'] = each['Patch']
-        return
+                self.cases[each['Hash']]['count'] = each['Count']
+                self.cases[each['Hash']]['last'] = each['Last']
+                last_crash = age_to_date(each['Last'])
+                if last_crash != None:
+                    self.cases[each['Hash']]['last_crash'] = last_crash.strftime(last_crash_format)
+                reported = age_to_date(each.get('Reported', ''))
+                if reported != None:
+                    self.cases[each['Hash']]['reported'] = reported.strftime(last_crash_format)
+                self.__emit(each['Hash'])
 
     def run_one_case(self, hash):
-        self.logger.info("retreive one case: %s",hash)
-        if self.retreive_case(hash) == -1:
+        self.run_cases([hash])
+
+    def run_cases(self, hashes):
+        for hash, res in zip(hashes, self.__map(self.__fetch_one_case, hashes)):
+            self.logger.info("retreive one case: %s",hash)
+            detail, title, patch = res
+            if self.__fill_case(hash, detail) == -1:
+                continue
+            self.cases[hash]['title'] = title
+            if patch != None:
+                self.cases[hash]['patch'] = patch
+            self.__emit(hash)
+
+    def __emit(self, hash):
+        if self.sink != None:
+            self.sink(hash)
+
+    def __fetch_one_case(self, hash):
+        detail = self.request_detail(hash)
+        if len(detail) < num_of_elements:
+            return detail, None, None
+        return detail, self.get_title_of_case(hash), self.get_patch_of_case(hash)
+
+    def __map(self, fn, hashes):
+        # Results always come back in the order of hashes, so self.cases is
+        # filled exactly as the sequential crawl would fill it. Each one is
+        # handed over as soon as it and the ones before it are in, so the
+        # sink gets cases while later pages are still being fetched.
+        if self.concurrency == 1 or len(hashes) < 2:
+            yield from map(fn, hashes)
             return
-        self.cases[hash]['title'] = self.get_title_of_case(hash)
-        patch = self.get_patch_of_case(hash)
-        if patch != None:
-            self.cases[hash]['patch'] = patch
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            yield from executor.map(fn, hashes)
     
+    def get_bug_page(self, hash):
+        page = self.bug_pages.get(hash)
+        if page == None:
+            url = self.host_url + syzbot_bug_base_url + hash
+            self.logger.info("Get bug page from {}".format(url))
+            req = request_get(url)
+            page = BugPage(url, req.text, self.host_url)
+            self.bug_pages[hash] = page
+        return page
+
     def get_title_of_case(self, hash=None, text=None):
         if hash==None and text==None:
             self.logger.info("No case given")
             return None
         if hash!=None:
-            url = syzbot_host_url + syzbot_bug_base_url + hash
-            req = requests.request(method='GET', url=url)
-            soup = BeautifulSoup(req.text, "html.parser")
+            page = self.get_bug_page(hash)
         else:
-            soup = BeautifulSoup(text, "html.parser")
-        title = soup.body.b.contents[0]
-        return title
+            page = BugPage(None, text, self.host_url)
+        return page.title
     
     def get_patch_of_case(self, hash):
-        patch = None
-        url = syzbot_host_url + syzbot_bug_base_url + hash
-        req = requests.request(method='GET', url=url)
-        soup = BeautifulSoup(req.text, "html.parser")
-        mono = soup.find("span", {"class": "mono"})
-        if mono == None:
-            return patch
-        try:
-            patch = mono.contents[1].attrs['href']
-        except:
-            pass 
-        return patch
-
+        return self.get_bug_page(hash).patch
 
     def retreive_case(self, hash):
+        return self.__fill_case(hash, self.request_detail(hash))
+
+    def __fill_case(self, hash, detail):
         self.cases[hash] = {}
-        detail = self.request_detail(hash)
         if len(detail) < num_of_elements:
-            self.logger.error("Failed to get detail of a case {}{}{}".format(syzbot_host_url, syzbot_bug_base_url, hash))
+            self.logger.error("Failed to get detail of a case {}{}{}".format(self.host_url, syzbot_bug_base_url, hash))
             self.cases.pop(hash)
             return -1
         self.cases[hash]["commit"] = detail[0]
@@ -139,149 +420,99 @@ class Crawler:
     def gather_cases(self):
         high_risk_impacts = {}
         res = []
-        tables = self.__get_table(self.url)
-        if tables == []:
-            self.logger.error("error occur in gather_cases")
-            return res, high_risk_impacts
         count = 0
-        for table in tables:
-            #self.logger.info("table caption {}".format(table.caption.text))
-            for case in table.tbody.contents:
-                if type(case) == element.Tag:
-                    title = case.find('td', {"class": "title"})
-                    if title == None:
-                        continue
-                    for keyword in self.deduplicate:
-                        if keyword in title.text:
-                            try:
-                                commit = regx_get(r"https:\/\/git\.kernel\.org\/pub\/scm\/linux\/kernel\/git\/torvalds\/linux\.git\/commit\/\?id=(\w+)", patch_url, 0)
-                                if commit in self.patches or \
-                                    (commit in high_risk_impacts and not self.include_high_risk):
-                                    continue
-                                self.patches[commit] = True
-                            except:
-                                pass
-                    for keyword in self.keyword:
-                        if 'out-of-bounds write' in title.text or \
-                                'use-after-free write' in title.text:
-                            commit_list = case.find('td', {"class": "commit_list"})
-                            try:
-                                patch_url = commit_list.contents[1].contents[1].attrs['href']
-                                high_risk_impacts[patch_url] = True
-                            except:
-                                pass
-                        if keyword in title.text or keyword=='':
-                            crash = {}
-                            commit_list = case.find('td', {"class": "commit_list"})
-                            crash['Title'] = title.text
-                            stats = case.find_all('td', {"class": "stat"})
-                            crash['Repro'] = stats[0].text
-                            crash['Bisected'] = stats[1].text
-                            crash['Count'] = stats[2].text
-                            crash['Last'] = stats[3].text
-                            try:
-                                crash['Reported'] = stats[4].text
-                                if self.filter_by_reported > -1 and int(crash['Reported'][:-1]) > self.filter_by_reported:
-                                    continue
-                                patch_url = commit_list.contents[1].contents[1].attrs['href']
-                                crash['Patch'] = patch_url
-                                crash['Closed'] = stats[4].text
-                                if self.filter_by_closed > -1 and int(crash['Closed'][:-1]) > self.filter_by_closed:
-                                    continue
-                            except:
-                                # patch only works on fixed cases
-                                pass
-                            self.logger.debug("[{}] Find a suitable case: {}".format(count, title.text))
-                            for _ in range(0, 3):
-                                try:
-                                    ele = title.next
-                                    href = ele.attrs['href']
-                                    break
-                                except AttributeError:
-                                    title = title.next
-                            hash_val = href[8:]
-                            self.logger.debug("[{}] Fetch {}".format(count, hash_val))
-                            crash['Hash'] = hash_val
-                            res.append(crash)
-                            count += 1
-                            break
-                    if count == self.max_retrieve:
-                        break
+        for row in self.list_rows(self.url):
+            title = row['title']
+            for keyword in self.keyword:
+                if 'out-of-bounds write' in title or \
+                        'use-after-free write' in title:
+                    if row['patch'] != None:
+                        high_risk_impacts[row['patch']] = True
+                if keyword in title or keyword=='':
+                    crash = {}
+                    stats = row['stats']
+                    crash['Title'] = title
+                    crash['Repro'] = stats[0]
+                    crash['Bisected'] = stats[1]
+                    crash['Count'] = stats[2]
+                    crash['Last'] = stats[3]
+                    try:
+                        crash['Reported'] = stats[4]
+                        if self.filter_by_reported > -1 and int(crash['Reported'][:-1]) > self.filter_by_reported:
+                            continue
+                        if row['patch'] == None:
+                            # patch only works on fixed cases
+                            raise ValueError
+                        crash['Patch'] = row['patch']
+                        crash['Closed'] = stats[4]
+                        if self.filter_by_closed > -1 and int(crash['Closed'][:-1]) > self.filter_by_closed:
+                            continue
+                    except (IndexError, ValueError):
+                        pass
+                    self.logger.debug("[{}] Find a suitable case: {}".format(count, title))
+                    hash_val = row['href'][8:]
+                    self.logger.debug("[{}] Fetch {}".format(count, hash_val))
+                    crash['Hash'] = hash_val
+                    res.append(crash)
+                    count += 1
+                    break
+            if count >= self.max_retrieve:
+                break
         return res, high_risk_impacts
 
+    def list_rows(self, url, chunk_size=1024*1024):
+        # The list pages are many megabytes, tokenize them incrementally and
+        # hand out rows as soon as they are complete instead of building a DOM.
+        self.logger.info("Get table from {}".format(url))
+        req = request_get(url)
+        text = req.text
+        parser = ListTableParser()
+        for i in range(0, len(text), chunk_size):
+            parser.feed(text[i:i+chunk_size])
+            yield from parser.pop_rows()
+        parser.close()
+        yield from parser.pop_rows()
+        if parser.n_tables == 0:
+            print("Fail to retrieve bug cases from list_table")
+            self.logger.error("error occur in gather_cases")
+
     def request_detail(self, hash, index=1):
-        self.logger.debug("\nDetail: {}{}{}".format(syzbot_host_url, syzbot_bug_base_url, hash))
-        url = syzbot_host_url + syzbot_bug_base_url + hash
-        tables = self.__get_table(url)
-        if tables == []:
+        self.logger.debug("\nDetail: {}{}{}".format(self.host_url, syzbot_bug_base_url, hash))
+        url = self.host_url + syzbot_bug_base_url + hash
+        page = self.get_bug_page(hash)
+        if not page.has_tables:
             print("error occur in request_detail: {}".format(hash))
             self.logger2file.info("[Failed] {} error occur in request_detail".format(url))
             return []
-        count = 0
-        for table in tables:
-            if table.text.find('Crash') != -1:
-                for case in table.tbody.contents:
-                    if type(case) == element.Tag:
-                        kernel = case.find('td', {"class": "kernel"})
-                        if kernel.text != "upstream":
-                            self.logger.debug("skip kernel: '{}'".format(kernel.text))
-                            continue
-                        count += 1
-                        if count < index:
-                            continue
-                        try:
-                            manager = case.find('td', {"class": "manager"})
-                            manager_str = manager.text
-                            time = case.find('td', {"class": "time"})
-                            time_str = time.text
-                            tags = case.find_all('td', {"class": "tag"})
-                            m = re.search(r'id=([0-9a-z]*)', tags[0].next.attrs['href'])
-                            commit = m.groups()[0]
-                            self.logger.debug("Kernel commit: {}".format(commit))
-                            m = re.search(r'commits\/([0-9a-z]*)', tags[1].next.attrs['href'])
-                            syzkaller = m.groups()[0]
-                            self.logger.debug("Syzkaller commit: {}".format(syzkaller))
-                            config = syzbot_host_url + case.find('td', {"class": "config"}).next.attrs['href']
-                            self.logger.debug("Config URL: {}".format(config))
-                            repros = case.find_all('td', {"class": "repro"})
-                            log = syzbot_host_url + repros[0].next.attrs['href']
-                            self.logger.debug("Log URL: {}".format(log))
-                            report = syzbot_host_url + repros[1].next.attrs['href']
-                            self.logger.debug("Log URL: {}".format(report))
-                            r = request_get(report)
-                            report_list = r.text.split('\n')
-                            offset, size, _ = extract_vul_obj_offset_and_size(report_list)
-                            try:
-                                syz_repro = syzbot_host_url + repros[2].next.attrs['href']
-                                self.logger.debug("Testcase URL: {}".format(syz_repro))
-                            except:
-                                self.logger.info(
-                                    "Repro is missing. Failed to retrieve case {}{}{}".format(syzbot_host_url, syzbot_bug_base_url, hash))
-                                self.logger2file.info("[Failed] {} Repro is missing".format(url))
-                                break
-                            try:
-                                c_repro = syzbot_host_url + repros[3].next.attrs['href']
-                                self.logger.debug("C prog URL: {}".format(c_repro))
-                            except:
-                                c_repro = None
-                                self.logger.info("No c prog found")
-                        except:
-                            self.logger.info("Failed to retrieve case {}{}{}".format(syzbot_host_url, syzbot_bug_base_url, hash))
-                            continue
-                        return [commit, syzkaller, config, syz_repro, log, c_repro, time_str, manager_str, report, offset, size]
+        for crash in page.crashes[index-1:]:
+            if crash == None:
+                self.logger.info("Failed to retrieve case {}{}{}".format(self.host_url, syzbot_bug_base_url, hash))
+                continue
+            self.logger.debug("Kernel commit: {}".format(crash['commit']))
+            self.logger.debug("Syzkaller commit: {}".format(crash['syzkaller']))
+            self.logger.debug("Config URL: {}".format(crash['config']))
+            self.logger.debug("Log URL: {}".format(crash['log']))
+            self.logger.debug("Log URL: {}".format(crash['report']))
+            try:
+                r = request_get(crash['report'])
+                report_list = r.text.split('\n')
+                offset, size, _ = extract_vul_obj_offset_and_size(report_list)
+            except:
+                self.logger.info("Failed to retrieve case {}{}{}".format(self.host_url, syzbot_bug_base_url, hash))
+                continue
+            if crash['syz_repro'] == None:
+                self.logger.info(
+                    "Repro is missing. Failed to retrieve case {}{}{}".format(self.host_url, syzbot_bug_base_url, hash))
+                self.logger2file.info("[Failed] {} Repro is missing".format(url))
                 break
+            self.logger.debug("Testcase URL: {}".format(crash['syz_repro']))
+            if crash['c_repro'] != None:
+                self.logger.debug("C prog URL: {}".format(crash['c_repro']))
+            else:
+                self.logger.info("No c prog found")
+            return [crash['commit'], crash['syzkaller'], crash['config'], crash['syz_repro'], crash['log'], crash['c_repro'], crash['time'], crash['manager'], crash['report'], offset, size]
         self.logger2file.info("[Failed] {} fail to find a proper crash".format(url))
         return []
 
-    def __get_table(self, url):
-        self.logger.info("Get table from {}".format(url))
-        req = requests.request(method='GET', url=url)
-        soup = BeautifulSoup(req.text, "html.parser")
-        tables = soup.find_all('table', {"class": "list_table"})
-        if len(tables) == 0:
-            print("Fail to retrieve bug cases from list_table")
-            return []
-        return tables
-
 if __name__ == '__main__':
     pass
\ No newline at end of file
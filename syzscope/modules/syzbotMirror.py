@@ -0,0 +1,142 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit
+from syzscope.interface.utilities import request_get
+from syzscope.interface.artifactPrefetcher import artifact_keys
+from .syzbotCrawler import syzbot_bug_base_url
+
+def mirror_key(url):
+    # Crawled artifact urls look like https://syzkaller.appspot.com//text?tag=...,
+    # the mirror only cares about the path and query.
+    parts = urlsplit(url)
+    path = re.sub(r'^\/+', '/', parts.path or '/')
+    if parts.query != '':
+        return "{}?{}".format(path, parts.query)
+    return path
+
+class SyzbotMirror:
+    """
+    A directory holding syzbot pages and artifacts by their url path.
+    index.json maps every path to the file holding its body, which lets
+    MirrorServer answer requests at the same url layout as syzbot.
+    """
+    def __init__(self, path, logger=None):
+        self.path = path
+        self.files_path = os.path.join(path, "files")
+        self.index_path = os.path.join(path, "index.json")
+        self.logger = logger
+        if self.logger == None:
+            self.logger = logging.getLogger(__name__)
+        self.lock = threading.Lock()
+        self.index = {'created': None, 'source': None, 'cases': [], 'urls': {}}
+        if os.path.isfile(self.index_path):
+            with open(self.index_path, 'r') as f:
+                self.index = json.load(f)
+
+    def add(self, url, data, content_type=None):
+        key = mirror_key(url)
+        name = hashlib.sha1(key.encode()).hexdigest()
+        os.makedirs(self.files_path, exist_ok=True)
+        with open(os.path.join(self.files_path, name), 'wb') as f:
+            f.write(data)
+        with self.lock:
+            self.index['urls'][key] = {'file': name, 'url': url, 'content_type': content_type, 'size': len(data)}
+
+    def fetch(self, url):
+        if url == None:
+            return False
+        try:
+            r = request_get(url)
+        except Exception as e:
+            self.logger.error("Fail to mirror {}: {}".format(url, e))
+            return False
+        if r.status_code != 200:
+            self.logger.error("Fail to mirror {}: status {}".format(url, r.status_code))
+            return False
+        self.add(url, r.content, r.headers.get('Content-Type'))
+        return True
+
+    def snapshot(self, crawler):
+        # crawler has already run, mirror what it selected: the list page,
+        # the bug page of every case and the artifacts deploying it needs.
+        urls = []
+        if crawler.url != None:
+            urls.append(crawler.url)
+        for hash_val in crawler.cases:
+            case = crawler.cases[hash_val]
+            urls.append(crawler.host_url + syzbot_bug_base_url + hash_val)
+            for key in artifact_keys:
+                if case.get(key) != None:
+                    urls.append(case[key])
+        with ThreadPoolExecutor(max_workers=crawler.concurrency) as executor:
+            results = list(executor.map(self.fetch, urls))
+        self.index['created'] = time.time()
+        self.index['source'] = crawler.url
+        self.index['cases'] = list(crawler.cases.keys())
+        self.save()
+        return results.count(True), len(urls)
+
+    def lookup(self, url):
+        entry = self.index['urls'].get(mirror_key(url))
+        if entry == None:
+            return None, None
+        return os.path.join(self.files_path, entry['file']), entry['content_type']
+
+    def save(self):
+        os.makedirs(self.path, exist_ok=True)
+        tmp = self.index_path + ".tmp"
+        with open(tmp, 'w') as f:
+            json.dump(self.index, f)
+        os.replace(tmp, self.index_path)
+
+class MirrorRequestHandler(BaseHTTPRequestHandler):
+    mirror = None
+
+    def do_GET(self):
+        path, content_type = self.mirror.lookup(self.path)
+        if path == None or not os.path.isfile(path):
+            self.send_error(404, "Not in mirror")
+            return
+        with open(path, 'rb') as f:
+            data = f.read()
+        self.send_response(200)
+        self.send_header('Content-Type', content_type or 'text/plain; charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        self.mirror.logger.debug("{} {}".format(self.address_string(), format % args))
+
+class MirrorServer:
+    def __init__(self, path, host='127.0.0.1', port=8000):
+        self.mirror = SyzbotMirror(path)
+        handler = type('Handler', (MirrorRequestHandler,), {'mirror': self.mirror})
+        self.httpd = ThreadingHTTPServer((host, port), handler)
+        self.httpd.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return "http://{}:{}/".format(host, port)
+
+    def serve_forever(self):
+        self.httpd.serve_forever()
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever, name="syzbot-mirror", daemon=True)
+        self.thread.start()
+        return self.url
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
@@ -0,0 +1,113 @@
+import gc
+import importlib
+import logging
+import multiprocessing
+import os
+import traceback
+
+from queue import Empty
+
+# Imported once per worker instead of once per case
+heavy_modules = ['angr', 'claripy', 'capstone', 'pwn']
+# Stages that boot VMs under gdb or run symbolic execution, the only ones
+# that need heavy_modules
+heavy_stages = ['fuzz', 'symbolic']
+
+def preload_for(stages):
+    for stage in stages:
+        if stage in heavy_stages:
+            return heavy_modules
+    return []
+
+def current_rss():
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        pass
+    try:
+        with open("/proc/self/statm", 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return 0
+
+def worker_main(target, args, tasks, results, max_cases, max_rss, preload):
+    for name in preload:
+        try:
+            importlib.import_module(name)
+        except ImportError:
+            pass
+    n = 0
+    while True:
+        item = tasks.get()
+        if item == None:
+            break
+        try:
+            res = target(*args, item)
+        except Exception:
+            traceback.print_exc()
+            res = None
+        gc.collect()
+        n += 1
+        # Leaks from angr and friends pile up, start over with a clean process
+        recycle = n >= max_cases or (max_rss > 0 and current_rss() > max_rss)
+        results.put((item, res, recycle))
+        if recycle:
+            break
+
+class PoolWorker:
+    """
+    A long-lived process running target(*args, item) for one item at a
+    time, run() returns what target returned, or None when it raised or
+    the process died. It retires itself after max_cases items or once its
+    RSS grows past max_rss, and a new process is started for the next
+    item, the same happens when the process dies in the middle of an item.
+    """
+    def __init__(self, name, target, args=(), max_cases=20, max_rss=4*1024*1024*1024, preload=heavy_modules, logger=None):
+        self.name = name
+        self.target = target
+        self.args = args
+        self.max_cases = max_cases
+        self.max_rss = max_rss
+        self.preload = preload
+        self.logger = logger
+        if self.logger == None:
+            self.logger = logging.getLogger(__name__)
+        self.process = None
+        self.tasks = None
+        self.results = None
+        self.started = 0
+        self.crashed = 0
+
+    def run(self, item):
+        if self.process == None or not self.process.is_alive():
+            self.start()
+        self.tasks.put(item)
+        while True:
+            try:
+                _, res, recycle = self.results.get(timeout=1)
+            except Empty:
+                if not self.process.is_alive():
+                    self.crashed += 1
+                    self.logger.error("{} died with exitcode {} while running {}".format(self.name, self.process.exitcode, item))
+                    self.process = None
+                    return None
+                continue
+            if recycle:
+                self.process.join()
+                self.process = None
+            return res
+
+    def start(self):
+        self.tasks = multiprocessing.Queue()
+        self.results = multiprocessing.Queue()
+        self.process = multiprocessing.Process(target=worker_main, name=self.name,
+            args=(self.target, self.args, self.tasks, self.results, self.max_cases, self.max_rss, self.preload,))
+        self.process.start()
+        self.started += 1
+
+    def stop(self):
+        if self.process != None and self.process.is_alive():
+            self.tasks.put(None)
+            self.process.join()
+        self.process = None
@@ -0,0 +1,21 @@
+#!/bin/bash
+# Sourced by the scripts that need a case's config or testcase
+#
+# Usage fetch_artifact url dest
+# SyzScope lists the artifacts it prefetched into the http cache in
+# SYZSCOPE_ARTIFACTS, one "url path" per line. A listed artifact is copied,
+# anything else is downloaded, and so is a listed one the cache evicted
+# before it could be copied.
+
+function fetch_artifact() {
+  local URL=$1
+  local DEST=$2
+  local LOCAL=$URL
+  if [ ! -f "$LOCAL" ]; then
+    LOCAL=`echo "$SYZSCOPE_ARTIFACTS" | awk -v url="$URL" '$1 == url {print $2; exit}'`
+  fi
+  if [ -n "$LOCAL" ] && cp "$LOCAL" "$DEST" 2>/dev/null; then
+    return 0
+  fi
+  curl "$URL" > "$DEST"
+}
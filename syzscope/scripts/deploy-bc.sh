@@ -69,6 +69,9 @@ if [ "$OLD_INDEX" != "$INDEX" ]; then
 fi
 
 cd linux
+# The tree won't hold the kernel deploy.sh built for it any more
+TREE=`pwd -P`
+rm -f `dirname $TREE`/.stamp/`basename $TREE`.state
 
 if [ "$COMPILE" != "1" ]; then
 
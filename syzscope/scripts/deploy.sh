@@ -1,9 +1,10 @@
 #!/bin/bash
 # Xiaochen Zou 2020, University of California-Riverside
 #
-# Usage ./deploy.sh linux_clone_path case_hash linux_commit syzkaller_commit linux_config testcase index catalog image arch gcc_version kasan_patch max_compiling_kernel
+# Usage ./deploy.sh linux_clone_path case_hash linux_commit syzkaller_commit linux_config testcase index catalog image arch gcc_version kasan_patch max_compiling_kernel kernel_state
 
 set -ex
+. "$(dirname "$0")/artifact.sh"
 
 echo "running deploy.sh"
 
@@ -89,8 +90,8 @@ function retrieve_proper_patch() {
   git rev-list 9b1f3e6 | grep $(git rev-parse HEAD) || cp $PATCHES_PATH/syzkaller-9b1f3e6.patch ./syzkaller.patch
 }
 
-if [ $# -ne 12 ]; then
-  echo "Usage ./deploy.sh linux_clone_path case_hash linux_commit syzkaller_commit linux_config testcase index catalog image arch gcc_version max_compiling_kernel"
+if [ $# -ne 13 ]; then
+  echo "Usage ./deploy.sh linux_clone_path case_hash linux_commit syzkaller_commit linux_config testcase index catalog image arch gcc_version max_compiling_kernel kernel_state"
   exit 1
 fi
 
@@ -105,10 +106,13 @@ IMAGE=$9
 ARCH=${10}
 COMPILER_VERSION=${11}
 MAX_COMPILING_KERNEL=${12}
+KERNEL_STATE=${13}
 PROJECT_PATH="$(pwd)"
 PKG_NAME="syzscope"
 CASE_PATH=$PROJECT_PATH/work/$CATALOG/$HASH
 PATCHES_PATH=$PROJECT_PATH/$PKG_NAME/patches
+# What linux-$INDEX holds once it's built, any other script that touches the tree removes it
+TREE_STATE=$PROJECT_PATH/tools/.stamp/$1-$INDEX.state
 echo "Compiler: "$COMPILER_VERSION | grep gcc && \
 COMPILER=$PROJECT_PATH/tools/$COMPILER_VERSION/bin/gcc || COMPILER=$PROJECT_PATH/tools/$COMPILER_VERSION/bin/clang
 N_CORES=$((`nproc` / $MAX_COMPILING_KERNEL))
@@ -173,7 +177,7 @@ if [ ! -f "$CASE_PATH/.stamp/BUILD_SYZKALLER" ]; then
   if [ ! -d "workdir" ]; then
     mkdir workdir
   fi
-  curl $TESTCASE > $GOPATH/src/github.com/google/syzkaller/workdir/testcase-$HASH
+  fetch_artifact $TESTCASE $GOPATH/src/github.com/google/syzkaller/workdir/testcase-$HASH
   touch $CASE_PATH/.stamp/BUILD_SYZKALLER
 fi
 
@@ -208,18 +212,27 @@ if [ ! -f "$CASE_PATH/.stamp/BUILD_KERNEL" ]; then
     echo "This kernel is using by other thread"
     exit 1
   fi
-  git stash || echo "it's ok"
-  make clean > /dev/null || echo "it's ok"
-  git clean -fdx -e THIS_KERNEL_IS_BEING_USED > /dev/null || echo "it's ok"
-  #make clean CC=$COMPILER
-  #git stash --all || set_git_config
-  git checkout -f $COMMIT || (git pull https://github.com/torvalds/linux.git master > /dev/null 2>&1 && git checkout -f $COMMIT)
-  #if [ "$KASAN_PATCH" == "1" ]; then
-  #  cp $PATCHES_PATH/kasan.patch ./
-  #  patch -p1 -i kasan.patch
-  #fi
-  #Add a rejection detector in future
-  curl $CONFIG > .config
+  REUSE_TREE=0
+  if [ -f "$TREE_STATE" ] && [ "`cat $TREE_STATE`" == "$KERNEL_STATE $COMPILER_VERSION" ]; then
+    # Built for the same commit and config by an earlier case, make only
+    # rebuilds what changed since
+    echo "[+] $1-$INDEX already holds $KERNEL_STATE"
+    REUSE_TREE=1
+  fi
+  rm -f $TREE_STATE
+  if [ "$REUSE_TREE" != "1" ]; then
+    git stash || echo "it's ok"
+    make clean > /dev/null || echo "it's ok"
+    git clean -fdx -e THIS_KERNEL_IS_BEING_USED > /dev/null || echo "it's ok"
+    #make clean CC=$COMPILER
+    #git stash --all || set_git_config
+    git checkout -f $COMMIT || (git pull https://github.com/torvalds/linux.git master > /dev/null 2>&1 && git checkout -f $COMMIT)
+    #if [ "$KASAN_PATCH" == "1" ]; then
+    #  cp $PATCHES_PATH/kasan.patch ./
+    #  patch -p1 -i kasan.patch
+    #fi
+    #Add a rejection detector in future
+    fetch_artifact $CONFIG .config
 
 #  CONFIGKEYSDISABLE="
 #CONFIG_BUG_ON_DATA_CORRUPTION
@@ -265,23 +278,25 @@ CONFIG_BOOTPARAM_HUNG_TASK_PANIC
 #CONFIG_DEBUG_LOCK_ALLOC
 #CONFIG_DEBUG_ATOMIC_SLEEP
 #CONFIG_DEBUG_LIST
-  
-  for key in $CONFIGKEYSDISABLE;
-  do
-    config_disable $key
-  done
+    
+    for key in $CONFIGKEYSDISABLE;
+    do
+      config_disable $key
+    done
 
-  for key in $CONFIGKEYSENABLE;
-  do
-    config_enable $key
-  done
+    for key in $CONFIGKEYSENABLE;
+    do
+      config_enable $key
+    done
 
-  make olddefconfig CC=$COMPILER
+    make olddefconfig CC=$COMPILER
+  fi
   #wait_for_other_compiling
   make -j$N_CORES CC=$COMPILER > make.log 2>&1 || copy_log_then_exit make.log
   rm $CASE_PATH/config || echo "It's ok"
   cp .config $CASE_PATH/config
   touch THIS_KERNEL_IS_BEING_USED
+  echo "$KERNEL_STATE $COMPILER_VERSION" > $TREE_STATE
   touch $CASE_PATH/.stamp/BUILD_KERNEL
 fi
 
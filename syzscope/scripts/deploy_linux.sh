@@ -4,6 +4,7 @@
 # Usage ./deploy_linux fixed linux_path patch_path [linux_commit, config_url, mode]
 
 set -ex
+. "$(dirname "$0")/artifact.sh"
 
 echo "running deploy_linux.sh"
 
@@ -56,6 +57,9 @@ cd $LINUX
 cd ..
 CASE_PATH=`pwd`
 cd linux
+# The tree won't hold the kernel deploy.sh built for it any more
+TREE=`pwd -P`
+rm -f `dirname $TREE`/.stamp/`basename $TREE`.state
 if [ $# -eq 5 ]; then
   #patch -p1 -N -R < $PATCH
   echo "no more patch"
@@ -70,11 +74,11 @@ if [ $# -eq 8 ]; then
       #git stash --all
       git checkout -f $COMMIT || (git pull https://github.com/torvalds/linux.git master > /dev/null 2>&1 && git checkout -f $COMMIT)
     fi
-    curl $CONFIG > .config
+    fetch_artifact $CONFIG .config
   else
     git format-patch -1 $COMMIT --stdout > fixed.patch
     patch -p1 -N -i fixed.patch || exit 1
-    curl $CONFIG > .config
+    fetch_artifact $CONFIG .config
   fi
 fi
 
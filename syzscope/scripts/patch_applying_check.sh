@@ -4,6 +4,7 @@
 # Usage ./patch_applying_check.sh linux_path linux_commit config_url patch_commit
 
 set -ex
+. "$(dirname "$0")/artifact.sh"
 echo "running patch_applying_check.sh"
 
 
@@ -41,6 +42,9 @@ cd $LINUX
 cd ..
 CASE_PATH=`pwd`
 cd linux
+# The tree won't hold the kernel deploy.sh built for it any more
+TREE=`pwd -P`
+rm -f `dirname $TREE`/.stamp/`basename $TREE`.state
 
 CURRENT_HEAD=`git rev-parse HEAD`
 git stash
@@ -53,7 +57,7 @@ fi
 git format-patch -1 $PATCH --stdout > fixed.patch
 patch -p1 -N -i fixed.patch || jump_to_the_patch
 patch -p1 -R < fixed.patch
-curl $CONFIG > .config
+fetch_artifact $CONFIG .config
 sed -i "s/CONFIG_BUG_ON_DATA_CORRUPTION=y/# CONFIG_BUG_ON_DATA_CORRUPTION is not set/g" .config
 make olddefconfig CC=$COMPILER
 make -j$N_CORES CC=$COMPILER > make.log 2>&1 || copy_log_then_exit make.log
@@ -5,6 +5,7 @@
 # EXITCODE: 2: syz-execprog supports -enable. 3: syz-execprog do not supports -enable.
 
 set -ex
+. "$(dirname "$0")/artifact.sh"
 echo "running upload-exp.sh"
 
 if [ $# -ne 10 ]; then
@@ -45,7 +46,7 @@ cd $CASE_PATH/poc
 if [ "$TYPE" == "1" ]; then
     cp $TESTCASE ./testcase || exit 1
 else
-    curl $TESTCASE > testcase
+    fetch_artifact $TESTCASE ./testcase
 fi
 scp -F /dev/null -o UserKnownHostsFile=/dev/null \
     -o BatchMode=yes -o IdentitiesOnly=yes -o StrictHostKeyChecking=no \
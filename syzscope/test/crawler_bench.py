@@ -0,0 +1,68 @@
+import sys
+import time
+import tracemalloc
+
+from bs4 import BeautifulSoup, element
+from syzscope.modules.syzbotCrawler import ListTableParser
+
+# Usage: python3 -m syzscope.test.crawler_bench saved_page.html [rounds]
+# Save a page first, eg. curl https://syzkaller.appspot.com/upstream/fixed > fixed.html
+
+def soup_rows(text):
+    res = []
+    soup = BeautifulSoup(text, "html.parser")
+    for table in soup.find_all('table', {"class": "list_table"}):
+        for case in table.tbody.contents:
+            if type(case) != element.Tag:
+                continue
+            title = case.find('td', {"class": "title"})
+            if title == None:
+                continue
+            stats = [each.text for each in case.find_all('td', {"class": "stat"})]
+            href = title.find('a').attrs['href']
+            patch = None
+            commit_list = case.find('td', {"class": "commit_list"})
+            try:
+                patch = commit_list.contents[1].contents[1].attrs['href']
+            except:
+                pass
+            res.append({'title': title.text, 'href': href, 'stats': stats, 'patch': patch})
+    return res
+
+def streaming_rows(text):
+    parser = ListTableParser()
+    parser.feed(text)
+    parser.close()
+    return parser.pop_rows()
+
+def measure(fn, text, rounds):
+    best = None
+    for _ in range(0, rounds):
+        start = time.perf_counter()
+        rows = fn(text)
+        elapsed = time.perf_counter() - start
+        if best == None or elapsed < best:
+            best = elapsed
+    tracemalloc.start()
+    fn(text)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return rows, best, peak
+
+if __name__ == '__main__':
+    path = sys.argv[1]
+    rounds = 3
+    if len(sys.argv) > 2:
+        rounds = int(sys.argv[2])
+    with open(path, 'r') as f:
+        text = f.read()
+    print("page size: {:.1f} MB".format(len(text) / 1024 / 1024))
+    rows1, t1, m1 = measure(soup_rows, text, rounds)
+    rows2, t2, m2 = measure(streaming_rows, text, rounds)
+    print("BeautifulSoup: {} rows, {:.3f}s, peak {:.1f} MB".format(len(rows1), t1, m1 / 1024 / 1024))
+    print("ListTableParser: {} rows, {:.3f}s, peak {:.1f} MB".format(len(rows2), t2, m2 / 1024 / 1024))
+    print("speedup: {:.1f}x, memory: {:.1f}x less".format(t1 / t2, m1 / max(m2, 1)))
+    if [(each['title'], each['href'], each['stats'], each['patch']) for each in rows1] != \
+        [(each['title'], each['href'], each['stats'], each['patch']) for each in rows2]:
+        print("Error: rows extracted by both parsers differ")
+        sys.exit(1)
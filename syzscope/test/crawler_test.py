@@ -0,0 +1,292 @@
+import time
+
+from syzscope.modules import syzbotCrawler
+from syzscope.modules.syzbotCrawler import ListTableParser, BugPage, Crawler
+from syzscope.test.crawler_bench import soup_rows
+
+patch_base = "https://git.kernel.org/pub/scm/linux/kernel/git/torvalds/linux.git/commit/?id="
+
+# A trimmed copy of https://syzkaller.appspot.com/upstream/fixed
+list_page = """<html><body>
+<table class="list_table">
+<caption>Fixed</caption>
+<thead><tr><th>Title</th><th>Repro</th><th>Count</th><th>Patched</th></tr></thead>
+<tbody>
+	<tr>
+		<td class="title">
+			<a href="/bug?id=8d5c4f5b2ea1f2b5a1f9f5fbd1d2f04c4a8e2c11">KASAN: use-after-free Read in tty_open</a>
+			<span class="bug-label"><a href="/upstream/fixed?label=subsystems:tty">tty</a></span>
+		</td>
+		<td class="stat">C</td>
+		<td class="stat">12</td>
+		<td class="commit_list">
+			<span class="mono">
+				<a href="https://git.kernel.org/pub/scm/linux/kernel/git/torvalds/linux.git/commit/?id=1b7e2cf27bd8">tty: fix use-after-free</a>
+			</span>
+		</td>
+	</tr>
+	<tr>
+		<td class="title"><a href="/bug?id=5e0b9e8b1c0e4bd0c5c1c1e2a3f4b5c6d7e8f901">WARNING in __alloc_pages</a></td>
+		<td class="stat">syz</td>
+		<td class="stat"> </td>
+		<td class="commit_list"></td>
+	</tr>
+	<tr><td colspan="4">no bug on this row</td></tr>
+</tbody>
+</table>
+<table class="other_table"><tbody><tr><td class="title"><a href="/bug?id=ignored">not a case</a></td></tr></tbody></table>
+</body></html>"""
+
+# A trimmed bug page, one upstream crash with both reproducers, one
+# without a C reproducer, one on another kernel and one cut short
+bug_page = """<html><body>
+<b>KASAN: use-after-free Read in tty_open</b><br>
+Fix commit: <span class="mono">
+<a href="https://git.kernel.org/pub/scm/linux/kernel/git/torvalds/linux.git/commit/?id=1b7e2cf27bd8">tty: fix use-after-free</a></span>
+<table class="list_table">
+<caption>Crashes (4):</caption>
+<tbody>
+<tr>
+<td class="manager">ci-upstream-kasan-gce</td>
+<td class="time">2020/01/02 03:04</td>
+<td class="kernel">upstream</td>
+<td class="tag"><a href="https://git.kernel.org/cgit/linux/kernel/git/torvalds/linux.git/commit/?id=abc123">abc123</a></td>
+<td class="tag"><a href="https://github.com/google/syzkaller/commits/def456">def456</a></td>
+<td class="config"><a href="/text?tag=KernelConfig&x=1">.config</a></td>
+<td class="repro"><a href="/text?tag=CrashLog&x=2">log</a></td>
+<td class="repro"><a href="/text?tag=CrashReport&x=3">report</a></td>
+<td class="repro"><a href="/text?tag=ReproSyz&x=4">syz</a></td>
+<td class="repro"><a href="/text?tag=ReproC&x=5">C</a></td>
+</tr>
+<tr>
+<td class="manager">ci-qemu-upstream</td>
+<td class="time">2020/01/01 00:00</td>
+<td class="kernel">upstream</td>
+<td class="tag"><a href="https://git.kernel.org/cgit/linux/kernel/git/torvalds/linux.git/commit/?id=789abc">789abc</a></td>
+<td class="tag"><a href="https://github.com/google/syzkaller/commits/012def">012def</a></td>
+<td class="config"><a href="/text?tag=KernelConfig&x=6">.config</a></td>
+<td class="repro"><a href="/text?tag=CrashLog&x=7">log</a></td>
+<td class="repro"><a href="/text?tag=CrashReport&x=8">report</a></td>
+<td class="repro"><a href="/text?tag=ReproSyz&x=9">syz</a></td>
+<td class="repro"></td>
+</tr>
+<tr>
+<td class="manager">ci-linux-4.19</td>
+<td class="time">2019/12/31 00:00</td>
+<td class="kernel">linux-4.19</td>
+</tr>
+<tr>
+<td class="manager">ci-upstream-kasan-gce</td>
+<td class="time">2019/12/30 00:00</td>
+<td class="kernel">upstream</td>
+</tr>
+</tbody>
+</table>
+</body></html>"""
+
+def parse(text, chunk=None):
+    parser = ListTableParser()
+    if chunk == None:
+        parser.feed(text)
+    else:
+        for i in range(0, len(text), chunk):
+            parser.feed(text[i:i+chunk])
+    parser.close()
+    return parser
+
+def test_list_table_rows():
+    parser = parse(list_page)
+    rows = parser.pop_rows()
+    assert parser.n_tables == 1
+    assert len(rows) == 2
+    assert rows[0]['href'] == "/bug?id=8d5c4f5b2ea1f2b5a1f9f5fbd1d2f04c4a8e2c11"
+    assert rows[0]['title'].split('\n')[1] == "KASAN: use-after-free Read in tty_open"
+    assert rows[0]['stats'] == ['C', '12']
+    assert rows[0]['patch'] == "https://git.kernel.org/pub/scm/linux/kernel/git/torvalds/linux.git/commit/?id=1b7e2cf27bd8"
+    assert rows[1]['title'] == "WARNING in __alloc_pages"
+    assert rows[1]['stats'] == ['syz', ' ']
+    assert rows[1]['patch'] == None
+    assert parser.pop_rows() == []
+
+def test_list_table_matches_soup():
+    # Cases must come out exactly as they did from BeautifulSoup
+    assert parse(list_page).pop_rows() == soup_rows(list_page)
+
+def test_list_table_chunked():
+    for chunk in [1, 7, 64]:
+        assert parse(list_page, chunk).pop_rows() == soup_rows(list_page)
+
+def test_bug_page():
+    page = BugPage("https://syzkaller.appspot.com/bug?id=8d5c4f5b", bug_page, host_url="https://syzkaller.appspot.com")
+    assert page.title == "KASAN: use-after-free Read in tty_open"
+    assert page.patch == "https://git.kernel.org/pub/scm/linux/kernel/git/torvalds/linux.git/commit/?id=1b7e2cf27bd8"
+    assert page.has_tables
+    assert len(page.crashes) == 3
+    first, second, broken = page.crashes
+    assert page.manager == "ci-upstream-kasan-gce"
+    assert first['commit'] == "abc123"
+    assert first['syzkaller'] == "def456"
+    assert first['time'] == "2020/01/02 03:04"
+    assert first['config'] == "https://syzkaller.appspot.com/text?tag=KernelConfig&x=1"
+    assert first['log'] == "https://syzkaller.appspot.com/text?tag=CrashLog&x=2"
+    assert first['report'] == "https://syzkaller.appspot.com/text?tag=CrashReport&x=3"
+    assert first['syz_repro'] == "https://syzkaller.appspot.com/text?tag=ReproSyz&x=4"
+    assert first['c_repro'] == "https://syzkaller.appspot.com/text?tag=ReproC&x=5"
+    assert second['manager'] == "ci-qemu-upstream"
+    assert second['syz_repro'] == "https://syzkaller.appspot.com/text?tag=ReproSyz&x=9"
+    assert second['c_repro'] == None
+    assert broken == None
+
+def test_bug_page_without_tables():
+    page = BugPage("https://syzkaller.appspot.com/bug?id=0", "<html><body><b>gone</b></body></html>")
+    assert page.title == "gone"
+    assert page.patch == None
+    assert not page.has_tables
+    assert page.crashes == []
+    assert page.manager == None
+
+def list_row(hash_val, title, patch=None, count='1', last='10d'):
+    if patch != None:
+        patch = patch_base + patch
+    return {'title': title, 'href': '/bug?id=' + hash_val, 'stats': ['C', '', count, last, '20d'], 'patch': patch}
+
+def detail_of(hash_val):
+    return ['commit-' + hash_val, 'syzkaller', 'config', 'syz_repro', 'log', None, 'time', 'manager', 'report', 0, 0]
+
+def make_crawler(tmp_path, monkeypatch, rows, **kwargs):
+    # list_rows and request_detail stand in for the list page and bug pages
+    monkeypatch.chdir(str(tmp_path))
+    crawler = Crawler(url="http://syzbot.test/upstream/fixed", **kwargs)
+    crawler.list_rows = lambda url: iter(rows)
+    crawler.request_detail = lambda hash_val, index=1: detail_of(hash_val)
+    return crawler
+
+def test_deduplicate(tmp_path, monkeypatch):
+    rows = [
+        list_row('aaa', 'KASAN: use-after-free Read in tty_open', '1111'),
+        list_row('bbb', 'KASAN: use-after-free Write in tty_release', '2222'),
+        list_row('ccc', 'KASAN: use-after-free Read in tty_release', '2222'),
+        list_row('ddd', 'KASAN: use-after-free Read in sock_close'),
+        list_row('eee', 'WARNING in __alloc_pages', '3333'),
+    ]
+    crawler = make_crawler(tmp_path, monkeypatch, rows, keyword=['use-after-free'], deduplicate=['use-after-free'])
+    crawler.run()
+    # The first case of each patch, cases without a patch are all kept
+    assert list(crawler.cases) == ['aaa', 'bbb', 'ddd']
+    assert crawler.cases['bbb']['patch'] == patch_base + '2222'
+
+class FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+def test_request_detail_report_first(tmp_path, monkeypatch):
+    # The first crash has no repro and its report fails to load, the second
+    # crash is tried like before BugPage
+    rows = bug_page.split('<tr>')
+    no_repro = rows[1].replace('<td class="repro"><a href="/text?tag=ReproSyz&x=4">syz</a></td>', '')
+    no_repro = no_repro.replace('<td class="repro"><a href="/text?tag=ReproC&x=5">C</a></td>', '')
+    page = '<tr>'.join([rows[0], no_repro, rows[2]]) + "</tbody></table></body></html>"
+    def request_get(url):
+        if url.endswith("x=3"):
+            raise ConnectionError(url)
+        return FakeResponse("no KASAN report here")
+    monkeypatch.setattr(syzbotCrawler, 'request_get', request_get)
+    crawler = make_crawler(tmp_path, monkeypatch, [])
+    del crawler.request_detail
+    crawler.bug_pages['aaa'] = BugPage(None, page, crawler.host_url)
+    detail = crawler.request_detail('aaa')
+    assert detail[0] == "789abc"
+    assert detail[3].endswith("/text?tag=ReproSyz&x=9")
+    # Without the failing report the missing repro ends the search
+    monkeypatch.setattr(syzbotCrawler, 'request_get', lambda url: FakeResponse(""))
+    assert crawler.request_detail('aaa') == []
+
+def slow_rows(n):
+    return [list_row("{:03d}".format(i), "KASAN: use-after-free Read in f{}".format(i), "{:04d}".format(i)) for i in range(0, n)]
+
+def slow_detail(hash_val, index=1):
+    # Later cases come back first
+    time.sleep((20 - int(hash_val)) * 0.002)
+    if int(hash_val) % 7 == 3:
+        return []
+    return detail_of(hash_val)
+
+def test_concurrent_order(tmp_path, monkeypatch):
+    res = []
+    for concurrency in [1, 4]:
+        crawler = make_crawler(tmp_path, monkeypatch, slow_rows(20), max_retrieve=20, concurrency=concurrency)
+        crawler.request_detail = slow_detail
+        crawler.run()
+        res.append(list(crawler.cases.items()))
+    assert res[0] == res[1]
+    assert [hash_val for hash_val, _ in res[1]] == ["{:03d}".format(i) for i in range(0, 20) if i % 7 != 3]
+
+def test_sink_order(tmp_path, monkeypatch):
+    for concurrency in [1, 4]:
+        emitted = []
+        fetched = []
+        def request_detail(hash_val, index=1):
+            fetched.append(hash_val)
+            return slow_detail(hash_val)
+        def sink(hash_val):
+            # The record is in place when the sink gets the hash
+            emitted.append((hash_val, 'commit' in crawler.cases[hash_val], len(fetched)))
+        crawler = make_crawler(tmp_path, monkeypatch, slow_rows(20), max_retrieve=20, concurrency=concurrency, sink=sink)
+        crawler.request_detail = request_detail
+        crawler.run()
+        assert [each[0] for each in emitted] == list(crawler.cases)
+        assert all([each[1] for each in emitted])
+        # The first case goes out before the last bug page is in
+        assert emitted[0][2] < 20
+
+def test_incremental(tmp_path, monkeypatch):
+    rows = [
+        list_row('aaa', 'KASAN: use-after-free Read in f1', '1111', count='3'),
+        list_row('bbb', 'KASAN: use-after-free Read in f2', '2222', count='5'),
+        list_row('ddd', 'KASAN: use-after-free Read in f4', '4444', count='1'),
+    ]
+    crawler = make_crawler(tmp_path, monkeypatch, rows)
+    crawler.run()
+    previous = crawler.cases
+    assert list(previous) == ['aaa', 'bbb', 'ddd']
+
+    rows = [
+        list_row('aaa', 'KASAN: use-after-free Read in f1', '1111', count='3'),
+        list_row('bbb', 'KASAN: use-after-free Read in f2', '2222', count='6'),
+        list_row('ccc', 'KASAN: use-after-free Read in f3', '3333', count='1'),
+        list_row('ddd', 'KASAN: use-after-free Read in f4', '4444', count='2'),
+    ]
+    fetched = []
+    emitted = []
+    def request_detail(hash_val, index=1):
+        fetched.append(hash_val)
+        if hash_val == 'ddd':
+            return []
+        return detail_of(hash_val)
+    crawler = make_crawler(tmp_path, monkeypatch, rows, sink=emitted.append)
+    crawler.request_detail = request_detail
+    crawler.run(previous)
+    # Only new and changed cases are fetched again
+    assert fetched == ['bbb', 'ccc', 'ddd']
+    assert list(crawler.cases) == ['aaa', 'bbb', 'ccc', 'ddd']
+    assert crawler.cases['aaa'] is previous['aaa']
+    assert crawler.cases['bbb']['count'] == '6'
+    assert crawler.cases['ccc']['count'] == '1'
+    # ddd failed to refresh, its old record is kept
+    assert crawler.cases['ddd'] is previous['ddd']
+    assert sorted(emitted) == ['aaa', 'bbb', 'ccc', 'ddd']
+
+def test_row_changed(tmp_path, monkeypatch):
+    crawler = make_crawler(tmp_path, monkeypatch, [list_row('aaa', 'WARNING in f', '1111', last='10d')])
+    crawler.run()
+    case = crawler.cases['aaa']
+    changed = crawler._Crawler__row_changed
+    row = {'Count': '1', 'Patch': patch_base + '1111', 'Last': '10d'}
+    assert not changed(row, case)
+    # Ages are rounded to days, a day of drift is not a change
+    assert not changed(dict(row, Last='11d'), case)
+    assert changed(dict(row, Last='3d'), case)
+    assert changed(dict(row, Count='2'), case)
+    assert changed(dict(row, Patch=patch_base + '2222'), case)
+    assert changed(row, None)
+    assert changed(row, {'title': 'WARNING in f'})
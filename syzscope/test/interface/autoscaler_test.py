@@ -0,0 +1,35 @@
+import json
+import os
+
+from syzscope.interface.autoscaler import Autoscaler
+
+idle = {'load': 0.2, 'mem': 0.8, 'iowait': 0.0, 'vcpu': 0.1}
+
+def test_decide(tmp_path):
+    scaler = Autoscaler(1, 4, path=os.path.join(str(tmp_path), "autoscale.jsonl"))
+    assert scaler.decide(idle) == 'take'
+    # Any one resource over its limit sheds, even with the others idle
+    for key, value in [('load', 1.6), ('mem', 0.05), ('iowait', 0.4), ('vcpu', 0.96)]:
+        assert scaler.decide(dict(idle, **{key: value})) == 'shed'
+    # Any one resource between the limits holds
+    for key, value in [('load', 1.0), ('mem', 0.2), ('iowait', 0.2), ('vcpu', 0.8)]:
+        assert scaler.decide(dict(idle, **{key: value})) == 'hold'
+    # Right on a limit is not over it
+    assert scaler.decide(dict(idle, load=1.5)) == 'hold'
+    assert scaler.decide(dict(idle, load=0.7)) == 'hold'
+
+def test_step(tmp_path):
+    samples = [idle] * 5 + [dict(idle, mem=0.01)] * 5
+    scaler = Autoscaler(2, 4, path=os.path.join(str(tmp_path), "autoscale.jsonl"))
+    scaler.sample = lambda: samples.pop(0)
+    assert scaler.admits(1) and not scaler.admits(2)
+    limits = []
+    for _ in range(0, 10):
+        scaler.step()
+        limits.append(scaler.limit)
+    # Starts from low and stays between low and high
+    assert limits == [3, 4, 4, 4, 4, 3, 2, 2, 2, 2]
+    with open(scaler.path, 'r') as f:
+        log = [json.loads(line) for line in f]
+    assert [(each['decision'], each['limit']) for each in log[4:6]] == [('take', 4), ('shed', 3)]
+    assert log[5]['mem'] == 0.01
@@ -0,0 +1,68 @@
+import os
+
+from syzscope.interface.batchPlan import BatchPlan, linux_tree_disk
+from syzscope.interface.stageTimes import CostModel
+
+stages = ['build', 'fuzz']
+profiles = {
+    'build_kernel': {'cores': 8, 'disk': 100},
+    'read_crash': {'vcpu': 1, 'mem': 2048},
+    'fuzzing': {'vcpu': 2, 'mem': 2048},
+}
+h1 = '1111111aaaa'
+h2 = '2222222bbbb'
+h3 = '3333333cccc'
+
+class FakeStore:
+    def load(self, hash_val):
+        return {}
+
+    def summary(self, hash_val):
+        return {'title': 'KASAN: use-after-free Read in tty_open'}
+
+def make_plan(tmp_path, monkeypatch, **kwargs):
+    # h3 is built and fuzzed already, only deploy.sh runs for it again
+    monkeypatch.chdir(str(tmp_path))
+    os.makedirs(os.path.join(str(tmp_path), "work", "succeed", h3[:7], ".stamp"))
+    for stamp in ["BUILD_KERNEL", "REPRO_ORI_POC"]:
+        open(os.path.join(str(tmp_path), "work", "succeed", h3[:7], ".stamp", stamp), 'w').close()
+    cost = CostModel([], {'build': 100, 'fuzz': 1000})
+    return BatchPlan(FakeStore(), stages, cost, [], profiles, {}, 2, **kwargs)
+
+def test_plan_lords(tmp_path, monkeypatch):
+    res = make_plan(tmp_path, monkeypatch).plan([h1, h2, h3])
+    assert res['cases'] == 3
+    assert res['kernel'] == 1
+    assert res['done'] == 1
+    # h1 and h2 hold both kernel trees until 1100, then h3 builds
+    assert res['wall'] == 1200
+    assert res['serial'] == 2300
+    assert res['cores'] == 16
+    assert res['vcpu'] == 4
+    assert res['mem'] == 4096
+    assert res['trees'] == 2
+    assert res['disk'] == 200 + 2 * linux_tree_disk
+    assert res['cpu_hours'] == (3 * 100 * 8 + 2 * 1000 * 2) / 3600
+
+def test_plan_sjf(tmp_path, monkeypatch):
+    res = make_plan(tmp_path, monkeypatch, schedule='sjf').plan([h1, h2, h3])
+    # h3 frees its tree at 100 for h2, builds never overlap on disk
+    assert res['wall'] == 1200
+    assert res['cores'] == 16
+    assert res['disk'] == 100 + 2 * linux_tree_disk
+
+def test_plan_pipeline(tmp_path, monkeypatch):
+    os.makedirs(os.path.join(str(tmp_path), "tools", "linux-0"))
+    res = make_plan(tmp_path, monkeypatch, stage_workers={'build': 1, 'fuzz': 2}).plan([h1, h2, h3])
+    # One build worker, h2 builds after h1
+    assert res['wall'] == 1200
+    assert res['cores'] == 8
+    assert res['vcpu'] == 4
+    assert res['trees'] == 1
+    assert res['disk'] == 100 + linux_tree_disk
+
+def test_plan_empty(tmp_path, monkeypatch):
+    res = make_plan(tmp_path, monkeypatch).plan([])
+    assert res['wall'] == 0
+    assert res['serial'] == 0
+    assert res['cores'] == 0
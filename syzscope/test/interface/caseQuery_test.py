@@ -0,0 +1,80 @@
+import datetime
+
+from syzscope.interface.caseQuery import CaseQuery, CaseIndex, bug_class_of, parse_time
+
+patch_base = "https://git.kernel.org/pub/scm/linux/kernel/git/torvalds/linux.git/commit/?id="
+
+index = {
+    'aaa': {'title': 'KASAN: use-after-free Read in tty_open', 'patch': patch_base + '1111', 'time': '2020/01/02 03:04',
+        'manager': 'ci-upstream-kasan-gce', 'reported': '2020-01-01 00:00'},
+    'bbb': {'title': 'KASAN: use-after-free Write in tty_release', 'patch': patch_base + '1111', 'time': '2020/03/01 00:00',
+        'manager': 'ci-upstream-kasan-gce-386', 'reported': '2020-02-20 00:00'},
+    'ccc': {'title': 'KASAN: slab-out-of-bounds Read in ext4_fill_super', 'patch': patch_base + '2222', 'time': '2020/06/01 00:00',
+        'manager': 'ci-upstream-kasan-gce'},
+    'ddd': {'title': 'KASAN: slab-out-of-bounds Read in ext4_xattr_get', 'patch': patch_base + '2222', 'time': '2020/07/01 00:00',
+        'manager': 'ci-qemu-upstream'},
+    'eee': {'title': 'WARNING in __alloc_pages', 'time': '2021/01/01 00:00', 'manager': 'ci-qemu-upstream'},
+    'fff': {'title': 'general protection fault in sock_close', 'patch': patch_base + '3333', 'time': 'not a date'},
+}
+
+def select(now=None, **kwargs):
+    return CaseIndex(index).select(CaseQuery(**kwargs), now=now)
+
+def test_everything():
+    assert select() == ['aaa', 'bbb', 'ccc', 'ddd', 'eee', 'fff']
+    assert select(keyword=['']) == ['aaa', 'bbb', 'ccc', 'ddd', 'eee', 'fff']
+    assert select(limit=2) == ['aaa', 'bbb']
+
+def test_keyword():
+    assert select(keyword=['use-after-free']) == ['aaa', 'bbb']
+    # Words cut at either end still match, like a plain substring
+    assert select(keyword=['after-fr']) == ['aaa', 'bbb']
+    assert select(keyword=['e-after-free Wr']) == ['bbb']
+    assert select(keyword=['out-of-bounds Read in ext4_f']) == ['ccc']
+    # Too short to use the postings, still matched on the titles
+    assert select(keyword=['ext4']) == ['ccc', 'ddd']
+    assert select(keyword=['WARNING', 'sock']) == ['eee', 'fff']
+    assert select(keyword=['no such bug here']) == []
+    assert select(keyword=['KASAN'], exclude=['Write', 'xattr']) == ['aaa', 'ccc']
+
+def test_class_arch_manager():
+    assert bug_class_of(index['bbb']['title']) == 'uaf-write'
+    assert select(bug_class=['uaf']) == ['aaa']
+    assert select(bug_class=['uaf', 'uaf-write', 'gpf']) == ['aaa', 'bbb', 'fff']
+    assert select(arch='i386') == ['bbb']
+    assert select(arch='amd64', bug_class=['uaf', 'uaf-write']) == ['aaa']
+    assert select(manager=['qemu']) == ['ddd', 'eee']
+
+def test_dates():
+    assert select(since=parse_time('2020-05-01'), until=parse_time('2020/12/31 00:00')) == ['ccc', 'ddd']
+    # A case without a usable time is out once a range is given
+    assert select(since=parse_time('2000-01-01')) == ['aaa', 'bbb', 'ccc', 'ddd', 'eee']
+    now = datetime.datetime(2020, 3, 1)
+    assert select(reported_within=15, now=now) == ['bbb']
+    assert select(reported_within=90, now=now) == ['aaa', 'bbb']
+
+def test_deduplicate():
+    # -de keeps the first case of each patch among the titles it matches
+    assert select(deduplicate=['slab-out-of-bounds']) == ['aaa', 'bbb', 'ccc', 'eee', 'fff']
+    assert select(dedup_patch=True, include_high_risk=True) == ['aaa', 'ccc', 'eee', 'fff']
+    # Patch 1111 also fixed a use-after-free Write, its other cases are dropped
+    assert select(deduplicate=['use-after-free']) == ['bbb', 'ccc', 'ddd', 'eee', 'fff']
+    assert select(deduplicate=['use-after-free'], include_high_risk=True) == ['aaa', 'ccc', 'ddd', 'eee', 'fff']
+    assert select(deduplicate=['']) == ['bbb', 'ccc', 'eee', 'fff']
+
+def test_ignore():
+    assert select(ignore=['aaa', 'eee']) == ['bbb', 'ccc', 'ddd', 'fff']
+    # Every case sharing a patch with an ignored batch is dropped
+    assert select(ignore_patch_of=['ccc', 'eee']) == ['aaa', 'bbb', 'eee', 'fff']
+
+def test_hashes():
+    assert select(hashes=['ddd', 'aaa', 'zzz']) == ['aaa', 'ddd']
+    assert select(hashes=['ddd', 'aaa'], keyword=['ext4']) == ['ddd']
+    assert select(hashes=[]) == []
+
+def test_narrows():
+    assert not CaseQuery().narrows()
+    assert not CaseQuery(keyword=[''], ignore=['aaa'], ignore_patch_of=['bbb'], include_high_risk=True).narrows()
+    for kwargs in [{'keyword': ['WARNING']}, {'limit': 10}, {'deduplicate': ['']}, {'arch': 'i386'},
+            {'reported_within': 10}, {'since': parse_time('2020-01-01')}, {'hashes': []}]:
+        assert CaseQuery(**kwargs).narrows()
@@ -0,0 +1,88 @@
+import json
+import os
+
+from syzscope.interface.caseStore import CaseStore
+from syzscope.interface.caseQuery import CaseQuery, CaseIndex
+
+def record(title, patch=None):
+    case = {'title': title, 'commit': 'abc123', 'config': 'http://syzbot.test/text?tag=KernelConfig&x=1',
+        'syz_repro': 'http://syzbot.test/text?tag=ReproSyz&x=2', 'time': '2020/01/02 03:04', 'manager': 'ci-upstream-kasan-gce'}
+    if patch != None:
+        case['patch'] = patch
+    return case
+
+def test_put_and_load(tmp_path):
+    store = CaseStore(os.path.join(str(tmp_path), "cases"))
+    store.put('bbb', record('WARNING in f'))
+    store.put('aaa', record('KASAN: use-after-free Read in g', 'p1'))
+    assert list(store) == ['bbb', 'aaa']
+    assert store['aaa'] == record('KASAN: use-after-free Read in g', 'p1')
+    # The index only keeps the summary
+    assert store.summary('aaa') == {'title': 'KASAN: use-after-free Read in g', 'time': '2020/01/02 03:04',
+        'manager': 'ci-upstream-kasan-gce', 'patch': 'p1'}
+    assert 'ccc' not in store
+    assert store.load('ccc') == None
+    # Nothing is on disk until the index is saved
+    assert len(CaseStore(store.path)) == 0
+    store.save_index()
+    assert list(CaseStore(store.path)) == ['bbb', 'aaa']
+
+def test_missing_record(tmp_path):
+    store = CaseStore(os.path.join(str(tmp_path), "cases"))
+    store.put('aaa', record('WARNING in f'))
+    os.remove(store.record_path('aaa'))
+    assert store.load('aaa') == None
+    try:
+        store['aaa']
+        assert False
+    except KeyError:
+        pass
+
+def test_migrate(tmp_path):
+    legacy = {'aaa': record('WARNING in f'), 'bbb': record('KASAN: use-after-free Read in g', 'p1')}
+    with open(os.path.join(str(tmp_path), "cases.json"), 'w') as f:
+        json.dump(legacy, f)
+    store = CaseStore(os.path.join(str(tmp_path), "cases"))
+    assert list(store) == ['aaa', 'bbb']
+    assert store['bbb'] == legacy['bbb']
+    # The old cases.json was the last crawl
+    assert store.last == ['aaa', 'bbb']
+    assert store.batch == {}
+    assert os.path.isfile(store.index_path)
+    # Migrated once, the index is read from then on
+    os.remove(os.path.join(str(tmp_path), "cases.json"))
+    assert list(CaseStore(store.path)) == ['aaa', 'bbb']
+
+def test_save_index_merges(tmp_path):
+    path = os.path.join(str(tmp_path), "cases")
+    store = CaseStore(path)
+    store.put('aaa', record('WARNING in f'))
+    store.put('bbb', record('WARNING in g'))
+    store.save_index()
+    # Two runs that started from the same index, each stores its own cases
+    one = CaseStore(path)
+    two = CaseStore(path)
+    one.put('ccc', record('WARNING in h'))
+    two.put('ddd', record('WARNING in i'))
+    two.put('aaa', record('WARNING in f, again'))
+    one.save_index()
+    two.save_index()
+    store = CaseStore(path)
+    assert sorted(store) == ['aaa', 'bbb', 'ccc', 'ddd']
+    assert store.summary('aaa')['title'] == 'WARNING in f, again'
+    # The last batch is the last run's cases only
+    assert store.last == ['ddd', 'aaa']
+    # --use-cache without filters picks the last batch, in crawl order
+    query = CaseQuery(keyword=[''])
+    assert not query.narrows()
+    query.hashes = store.last
+    assert CaseIndex(store.index).select(query) == ['aaa', 'ddd']
+    assert CaseIndex(store.index).select(CaseQuery(keyword=['WARNING'])) == ['aaa', 'bbb', 'ccc', 'ddd']
+
+def test_last_of_old_index(tmp_path):
+    # An index written before the last batch was recorded
+    path = os.path.join(str(tmp_path), "cases")
+    os.makedirs(path)
+    with open(os.path.join(path, "index.json"), 'w') as f:
+        json.dump({'cases': {'aaa': {'title': 'WARNING in f'}, 'bbb': {'title': 'WARNING in g'}}}, f)
+    assert CaseStore(path).last == ['aaa', 'bbb']
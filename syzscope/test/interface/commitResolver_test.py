@@ -0,0 +1,81 @@
+import datetime
+import os
+import subprocess
+
+from syzscope.interface.commitResolver import CommitResolver, kernel_commit_url
+
+# The commit page of git.kernel.org, trimmed
+commit_page = """<html><body>
+<table summary='commit info' class='commit-info'>
+<tr><th>author</th><td>Jane Doe &lt;jane@example.com&gt;</td><td class='right'>2019-12-01 10:00:00 +0100</td></tr>
+<tr><th>committer</th><td>Linus Torvalds &lt;torvalds@linux-foundation.org&gt;</td><td class='right'>2019-12-20 18:30:00 -0800</td></tr>
+</table>
+<div class='commit-subject'>tty: fix use-after-free in tty_open</div>
+</body></html>"""
+
+class FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+def git(repo, *args, env=None):
+    return subprocess.run(["git"] + list(args), cwd=repo, env=env, check=True, stdout=subprocess.PIPE,
+        universal_newlines=True).stdout.strip()
+
+def make_repo(tmp_path):
+    repo = os.path.join(str(tmp_path), "linux")
+    os.makedirs(repo)
+    git(repo, "init", "-q")
+    commits = []
+    for subject, author_date, commit_date in [("mm: first", "2020-01-02T03:04:05+01:00", "2020-01-10T00:00:00+00:00"),
+            ("net: second", "2020-02-01T00:00:00-05:00", "2020-02-03T12:00:00+00:00")]:
+        env = dict(os.environ, GIT_AUTHOR_NAME="a", GIT_AUTHOR_EMAIL="a@example.com", GIT_COMMITTER_NAME="c",
+            GIT_COMMITTER_EMAIL="c@example.com", GIT_AUTHOR_DATE=author_date, GIT_COMMITTER_DATE=commit_date)
+        git(repo, "commit", "-q", "--allow-empty", "-m", subject, env=env)
+        commits.append(git(repo, "rev-parse", "HEAD"))
+    return repo, commits
+
+def test_resolve_local(tmp_path):
+    repo, commits = make_repo(tmp_path)
+    resolver = CommitResolver(repo)
+    res = resolver.resolve_all([commits[0][:12], commits[1], 'deadbeef', None, 'not a commit'])
+    assert sorted(res) == sorted([commits[0][:12], commits[1]])
+    first = res[commits[0][:12]]
+    assert first['subject'] == "mm: first"
+    assert first['author_date'] == datetime.datetime(2020, 1, 2, 3, 4, 5, tzinfo=datetime.timezone(datetime.timedelta(hours=1)))
+    assert first['commit_date'] == datetime.datetime(2020, 1, 10, tzinfo=datetime.timezone.utc)
+    assert first['source'] == 'local'
+    assert res[commits[1]]['subject'] == "net: second"
+    assert resolver.stats() == "2 commits resolved locally, 0 from git.kernel.org"
+    # Resolved commits are kept
+    assert resolver.resolve(commits[1]) == res[commits[1]]
+    assert resolver.local_hits == 2
+
+def test_resolve_remote(tmp_path):
+    repo, commits = make_repo(tmp_path)
+    fetched = []
+    def fetch(url):
+        fetched.append(url)
+        return FakeResponse(commit_page)
+    resolver = CommitResolver(repo, fetch=fetch)
+    res = resolver.resolve_all([commits[0], '1b7e2cf27bd8'])
+    # Only the commit missing from the tree is scraped
+    assert fetched == [kernel_commit_url + '1b7e2cf27bd8']
+    remote = res['1b7e2cf27bd8']
+    assert remote['subject'] == "tty: fix use-after-free in tty_open"
+    assert remote['author_date'] == datetime.datetime(2019, 12, 1, 10, tzinfo=datetime.timezone(datetime.timedelta(hours=1)))
+    assert remote['commit_date'] == datetime.datetime(2019, 12, 20, 18, 30, tzinfo=datetime.timezone(datetime.timedelta(hours=-8)))
+    assert remote['source'] == 'remote'
+    assert res[commits[0]]['source'] == 'local'
+    assert resolver.stats() == "1 commits resolved locally, 1 from git.kernel.org"
+
+def test_resolve_without_tree(tmp_path):
+    def fetch(url):
+        if url.endswith('deadbeef'):
+            raise ConnectionError(url)
+        return FakeResponse("<html><body><div class='commit-subject'>only a subject</div></body></html>")
+    resolver = CommitResolver(os.path.join(str(tmp_path), "missing"), fetch=fetch)
+    assert resolver.resolve('deadbeef') == None
+    info = resolver.resolve('1b7e2cf27bd8')
+    assert info['subject'] == "only a subject"
+    assert info['author_date'] == None
+    assert info['commit_date'] == None
@@ -0,0 +1,134 @@
+import os
+import time
+
+from syzscope.interface import httpCache
+from syzscope.interface.httpCache import HttpCache, NEVER_EXPIRE
+
+ttl_rules = [
+    (r'\/text\?', NEVER_EXPIRE),
+    (r'.*', 600),
+]
+
+class FakeResponse:
+    def __init__(self, content, status_code=200):
+        self.content = content
+        self.status_code = status_code
+        self.encoding = 'utf-8'
+
+class FakeServer:
+    def __init__(self):
+        self.pages = {}
+        self.fetched = []
+
+    def fetch(self, url):
+        self.fetched.append(url)
+        if url not in self.pages:
+            return FakeResponse(b'', 404)
+        return FakeResponse(self.pages[url])
+
+class Clock:
+    def __init__(self):
+        self.now = time.time()
+
+    def __call__(self):
+        return self.now
+
+def make_cache(tmp_path, monkeypatch, max_size=10000):
+    clock = Clock()
+    monkeypatch.setattr(httpCache.time, 'time', clock)
+    server = FakeServer()
+    cache = HttpCache(os.path.join(str(tmp_path), "http"), server.fetch, max_size=max_size, ttl_rules=ttl_rules)
+    return cache, server, clock
+
+def age_objects(cache, seconds):
+    for root, _, files in os.walk(cache.objects_path):
+        for name in files:
+            path = os.path.join(root, name)
+            st = os.stat(path)
+            os.utime(path, (st.st_atime - seconds, st.st_mtime - seconds))
+
+def test_hit_and_miss(tmp_path, monkeypatch):
+    cache, server, _ = make_cache(tmp_path, monkeypatch)
+    server.pages['http://syzbot.test/bug?id=aaa'] = b'bug page'
+    assert cache.get('http://syzbot.test/bug?id=aaa').content == b'bug page'
+    r = cache.get('http://syzbot.test/bug?id=aaa')
+    assert r.content == b'bug page'
+    assert r.headers['X-SyzScope-Cache'] == 'hit'
+    assert server.fetched == ['http://syzbot.test/bug?id=aaa']
+    # Failed fetches are not cached
+    assert cache.get('http://syzbot.test/bug?id=bbb').status_code == 404
+    assert cache.get('http://syzbot.test/bug?id=bbb').status_code == 404
+    assert cache.stats() == "1 hits, 3 misses (25.0% hit rate)"
+
+def test_ttl(tmp_path, monkeypatch):
+    cache, server, clock = make_cache(tmp_path, monkeypatch)
+    server.pages['http://syzbot.test/upstream/fixed'] = b'v1'
+    server.pages['http://syzbot.test/text?tag=ReproC&x=1'] = b'repro'
+    cache.get('http://syzbot.test/upstream/fixed')
+    cache.get('http://syzbot.test/text?tag=ReproC&x=1')
+    clock.now += 599
+    server.pages['http://syzbot.test/upstream/fixed'] = b'v2'
+    assert cache.get('http://syzbot.test/upstream/fixed').content == b'v1'
+    clock.now += 2
+    assert cache.get('http://syzbot.test/upstream/fixed').content == b'v2'
+    assert cache.local_path('http://syzbot.test/upstream/fixed') != None
+    clock.now += 10 * 365 * 24 * 60 * 60
+    assert cache.local_path('http://syzbot.test/upstream/fixed') == None
+    # Artifacts never expire
+    assert cache.get('http://syzbot.test/text?tag=ReproC&x=1').content == b'repro'
+    assert server.fetched.count('http://syzbot.test/text?tag=ReproC&x=1') == 1
+
+def test_evict_lru(tmp_path, monkeypatch):
+    cache, server, _ = make_cache(tmp_path, monkeypatch, max_size=2500)
+    for name in ['a', 'b', 'c']:
+        server.pages['http://syzbot.test/text?tag=ReproC&x=' + name] = name.encode() * 1000
+    cache.get('http://syzbot.test/text?tag=ReproC&x=a')
+    cache.get('http://syzbot.test/text?tag=ReproC&x=b')
+    for name in os.listdir(cache.index_path):
+        os.utime(os.path.join(cache.index_path, name), (1, 1))
+    # a is used again, b is the least recently used
+    cache.get('http://syzbot.test/text?tag=ReproC&x=a')
+    cache.get('http://syzbot.test/text?tag=ReproC&x=c')
+    assert cache.local_path('http://syzbot.test/text?tag=ReproC&x=b') == None
+    assert cache.local_path('http://syzbot.test/text?tag=ReproC&x=a') != None
+    assert cache.local_path('http://syzbot.test/text?tag=ReproC&x=c') != None
+    assert len(os.listdir(cache.index_path)) == 2
+
+def test_refresh_drops_old_object(tmp_path, monkeypatch):
+    cache, server, clock = make_cache(tmp_path, monkeypatch, max_size=10000)
+    server.pages['http://syzbot.test/text?tag=ReproC&x=keep'] = b'k' * 1000
+    cache.get('http://syzbot.test/text?tag=ReproC&x=keep')
+    for i in range(0, 30):
+        server.pages['http://syzbot.test/upstream/fixed'] = "{:04d}".format(i).encode() * 250
+        cache.get('http://syzbot.test/upstream/fixed')
+        age_objects(cache, 601)
+        clock.now += 601
+    # Only what the two index entries point to is left, nothing live was evicted
+    assert len(os.listdir(cache.index_path)) == 2
+    sizes = [os.path.getsize(os.path.join(root, name)) for root, _, files in os.walk(cache.objects_path) for name in files]
+    assert sum(sizes) <= 10000
+    assert cache.local_path('http://syzbot.test/text?tag=ReproC&x=keep') != None
+    assert server.fetched.count('http://syzbot.test/text?tag=ReproC&x=keep') == 1
+
+def test_shared_object(tmp_path, monkeypatch):
+    # Two URLs with the same content share one object, dropping one entry keeps it
+    cache, server, clock = make_cache(tmp_path, monkeypatch, max_size=2500)
+    server.pages['http://syzbot.test/text?tag=ReproC&x=a'] = b'x' * 1000
+    server.pages['http://syzbot.test/text?tag=ReproC&x=b'] = b'x' * 1000
+    cache.get('http://syzbot.test/text?tag=ReproC&x=a')
+    cache.get('http://syzbot.test/text?tag=ReproC&x=b')
+    age_objects(cache, 601)
+    cache.evict()
+    assert cache.local_path('http://syzbot.test/text?tag=ReproC&x=a') != None
+    assert cache.local_path('http://syzbot.test/text?tag=ReproC&x=b') != None
+
+def test_lock_after_fork(tmp_path, monkeypatch):
+    cache, _, _ = make_cache(tmp_path, monkeypatch)
+    cache.lock.acquire()
+    pid = os.fork()
+    if pid == 0:
+        # The child does not inherit the held lock
+        os._exit(0 if cache.lock.acquire(timeout=5) else 1)
+    _, status = os.waitpid(pid, 0)
+    cache.lock.release()
+    assert os.WEXITSTATUS(status) == 0
@@ -0,0 +1,30 @@
+import hashlib
+import os
+
+from syzscope.interface.kernelTrees import kernel_state, tree_state, tree_state_path
+
+config = "https://syzkaller.appspot.com/text?tag=KernelConfig&x=1234"
+
+def test_kernel_state():
+    assert kernel_state(None) == None
+    assert kernel_state({'commit': 'abcdef123456'}) == None
+    assert kernel_state({'config': config}) == None
+    state = kernel_state({'commit': 'abcdef123456', 'config': config, 'title': 'ignored'})
+    assert state == "abcdef123456-" + hashlib.sha1(config.encode('utf-8')).hexdigest()[:12]
+    # Another config for the same commit is another kernel
+    assert kernel_state({'commit': 'abcdef123456', 'config': config + '0'}) != state
+
+def test_tree_state(tmp_path, monkeypatch):
+    monkeypatch.chdir(str(tmp_path))
+    assert tree_state_path(0) == os.path.join(str(tmp_path), "tools/.stamp", "linux-0.state")
+    assert tree_state_path(2, 'linux-next') == os.path.join(str(tmp_path), "tools/.stamp", "linux-next-2.state")
+    # Never built, or removed by a script that touched the tree
+    assert tree_state(0) == None
+    os.makedirs(os.path.join("tools", ".stamp"))
+    with open(tree_state_path(0), 'w') as f:
+        f.write("abcdef123456-0123456789ab gcc-8.0.1\n")
+    assert tree_state(0) == "abcdef123456-0123456789ab"
+    assert tree_state(1) == None
+    # Cut short while being written
+    open(tree_state_path(1), 'w').close()
+    assert tree_state(1) == None
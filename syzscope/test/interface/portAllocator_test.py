@@ -0,0 +1,95 @@
+import os
+import random
+import socket
+import time
+
+from syzscope.interface.portAllocator import PortAllocator
+
+def bindable(port):
+    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    try:
+        s.bind(('', port))
+        return True
+    except OSError:
+        return False
+    finally:
+        s.close()
+
+def free_range(n=16):
+    for _ in range(0, 100):
+        low = random.randint(20000, 60000)
+        if all([bindable(port) for port in range(low, low + n)]):
+            return low, low + n - 1
+    assert False
+
+def make_allocator(tmp_path, low, high):
+    return PortAllocator(os.path.join(str(tmp_path), "ports"), low=low, high=high)
+
+def dead_pid():
+    pid = os.fork()
+    if pid == 0:
+        os._exit(0)
+    os.waitpid(pid, 0)
+    return pid
+
+def test_lease_and_release(tmp_path):
+    low, high = free_range()
+    one = make_allocator(tmp_path, low, high)
+    two = make_allocator(tmp_path, low, high)
+    assert one.lease(low + 2, count=3) == [low + 2, low + 3, low + 4]
+    assert one.owner(low + 2)[0] == os.getpid()
+    # Taken ports are skipped, the hint is only where the search starts
+    assert two.lease(low + 3) == [low + 5]
+    # Out of range hints start from low
+    assert two.lease(1) == [low]
+    one.release([low + 3])
+    assert one.leased == [low + 2, low + 4]
+    assert not os.path.exists(one.lease_path(low + 3))
+    assert two.lease(low + 3) == [low + 3]
+    one.release()
+    assert one.leased == []
+    assert sorted(os.listdir(one.path)) == sorted([str(port) for port in two.leased])
+
+def test_wraps_and_runs_out(tmp_path):
+    low, high = free_range(5)
+    allocator = make_allocator(tmp_path, low, high)
+    assert allocator.lease(high, count=2) == [high, low]
+    assert allocator.lease(low, count=2) == [low + 1, low + 2]
+    try:
+        allocator.lease(low, count=2)
+        assert False
+    except OSError:
+        pass
+    # The port leased before running out is given back
+    assert sorted(allocator.leased) == [low, low + 1, low + 2, high]
+    assert not os.path.exists(allocator.lease_path(low + 3))
+
+def test_bind_check(tmp_path):
+    low, high = free_range()
+    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    s.bind(('', low))
+    s.listen(1)
+    try:
+        allocator = make_allocator(tmp_path, low, high)
+        # Something outside SyzScope listens on low, no lease is left behind for it
+        assert allocator.lease(low) == [low + 1]
+        assert not os.path.exists(allocator.lease_path(low))
+    finally:
+        s.close()
+
+def test_stale_takeover(tmp_path):
+    low, high = free_range()
+    allocator = make_allocator(tmp_path, low, high)
+    os.makedirs(allocator.path)
+    with open(allocator.lease_path(low), 'w') as f:
+        f.write("{} 0".format(dead_pid()))
+    # Our own pid, but a process that started at another time
+    with open(allocator.lease_path(low + 1), 'w') as f:
+        f.write("{} 1".format(os.getpid()))
+    # Left empty long ago, and being written right now
+    open(allocator.lease_path(low + 2), 'w').close()
+    os.utime(allocator.lease_path(low + 2), (time.time() - 120, time.time() - 120))
+    open(allocator.lease_path(low + 3), 'w').close()
+    assert allocator.lease(low, count=4) == [low, low + 1, low + 2, low + 4]
+    assert allocator.owner(low)[0] == os.getpid()
+    assert allocator.owner(low + 3) == None
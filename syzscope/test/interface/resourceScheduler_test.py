@@ -0,0 +1,116 @@
+import json
+import os
+import threading
+import time
+
+from syzscope.interface import resourceScheduler
+from syzscope.interface.resourceScheduler import ResourceScheduler, process_start_time
+
+profiles = {
+    'build_kernel': {'cores': 2, 'mem': 2048},
+    'fuzzing': {'cores': 1, 'vcpu': 2, 'mem': 4096},
+}
+# 0 leaves vcpu and disk unlimited
+capacity = {'cores': 4, 'mem': 8192, 'vcpu': 0, 'disk': 0}
+
+def make_scheduler(tmp_path):
+    return ResourceScheduler(os.path.join(str(tmp_path), "work"), capacity=capacity, profiles=profiles, poll_interval=0.01)
+
+class Waiter(threading.Thread):
+    def __init__(self, scheduler, stage, order, **tokens):
+        threading.Thread.__init__(self, daemon=True)
+        self.scheduler = scheduler
+        self.stage = stage
+        self.order = order
+        self.tokens = tokens
+        self.grant = None
+
+    def run(self):
+        self.grant = self.scheduler.acquire(self.stage, self.stage, **self.tokens)
+        self.order.append(self.stage)
+
+def wait_for(cond):
+    deadline = time.time() + 5
+    while not cond():
+        assert time.time() < deadline
+        time.sleep(0.01)
+
+def test_tokens_of(tmp_path):
+    scheduler = make_scheduler(tmp_path)
+    assert scheduler.tokens_of('build_kernel') == {'cores': 2, 'mem': 2048, 'vcpu': 0, 'disk': 0}
+    assert scheduler.tokens_of('build_kernel', cores=3)['cores'] == 3
+    # Larger than the host, it runs alone
+    assert scheduler.tokens_of('build_kernel', cores=16, vcpu=64) == {'cores': 4, 'mem': 2048, 'vcpu': 64, 'disk': 0}
+    assert scheduler.tokens_of('unknown') == {'cores': 0, 'mem': 0, 'vcpu': 0, 'disk': 0}
+
+def test_fits(tmp_path):
+    scheduler = make_scheduler(tmp_path)
+    a = scheduler.acquire('build_kernel')
+    b = scheduler.acquire('fuzzing')
+    used, stages, waiting = scheduler.usage()
+    assert used == {'cores': 3, 'mem': 6144, 'vcpu': 2, 'disk': 0}
+    assert sorted(stages) == ['build_kernel', 'fuzzing']
+    # A second fuzzing would go over the memory
+    order = []
+    waiter = Waiter(scheduler, 'fuzzing', order)
+    waiter.start()
+    wait_for(lambda: scheduler.usage()[2] == 1)
+    time.sleep(0.05)
+    assert order == []
+    scheduler.release(b)
+    waiter.join(5)
+    assert order == ['fuzzing']
+    scheduler.release(a)
+    scheduler.release(waiter.grant)
+    assert scheduler.usage() == ({'cores': 0, 'mem': 0, 'vcpu': 0, 'disk': 0}, [], 0)
+
+def test_first_come_first_served(tmp_path):
+    scheduler = make_scheduler(tmp_path)
+    held = scheduler.acquire('build_kernel', cores=3)
+    order = []
+    big = Waiter(scheduler, 'big', order, cores=2)
+    big.start()
+    wait_for(lambda: scheduler.usage()[2] == 1)
+    # small fits right now, but big was first
+    small = Waiter(scheduler, 'small', order, cores=1)
+    small.start()
+    wait_for(lambda: scheduler.usage()[2] == 2)
+    time.sleep(0.05)
+    assert order == []
+    scheduler.release(held)
+    big.join(5)
+    small.join(5)
+    assert order == ['big', 'small']
+
+def test_reclaim_dead(tmp_path):
+    scheduler = make_scheduler(tmp_path)
+    pid = os.fork()
+    if pid == 0:
+        os._exit(0)
+    os.waitpid(pid, 0)
+    dead = {'id': 'dead', 'pid': pid, 'start': None, 'stage': 'build_kernel', 'tag': None,
+        'tokens': {'cores': 4, 'mem': 0, 'vcpu': 0, 'disk': 0}, 'since': time.time()}
+    # Our own pid, but a process that started at another time
+    recycled = dict(dead, id='recycled', pid=os.getpid(), start=process_start_time(os.getpid()) + 1)
+    waiting = dict(dead, id='waiting')
+    os.makedirs(scheduler.path, exist_ok=True)
+    with open(scheduler.ledger_path, 'w') as f:
+        json.dump({'grants': {'dead': dead, 'recycled': recycled}, 'waiting': [waiting]}, f)
+    assert scheduler.usage() == ({'cores': 0, 'mem': 0, 'vcpu': 0, 'disk': 0}, [], 0)
+    grant = scheduler.acquire('build_kernel', cores=4)
+    scheduler.release(grant)
+
+def test_interrupted_wait(tmp_path, monkeypatch):
+    scheduler = make_scheduler(tmp_path)
+    held = scheduler.acquire('build_kernel', cores=4)
+    def sleep(seconds):
+        raise KeyboardInterrupt()
+    monkeypatch.setattr(resourceScheduler.time, 'sleep', sleep)
+    try:
+        scheduler.acquire('fuzzing')
+        assert False
+    except KeyboardInterrupt:
+        pass
+    # The ticket of a waiter that gave up does not block the queue
+    assert scheduler.usage()[2] == 0
+    scheduler.release(held)
@@ -0,0 +1,70 @@
+import os
+
+from syzscope.interface.runJournal import RunJournal, JournalState
+
+stages = ['build', 'fuzz', 'static', 'symbolic']
+
+def test_state():
+    state = JournalState()
+    events = [
+        {'e': 'run', 'argv': ['-i', 'cases.json'], 'stages': stages},
+        {'e': 'queued', 'hash': 'aaa'},
+        {'e': 'queued', 'hash': 'bbb'},
+        {'e': 'queued', 'hash': 'ccc'},
+        {'e': 'queued', 'hash': 'ddd'},
+        {'e': 'start', 'hash': 'aaa', 'stage': 'build', 'slot': 0},
+        {'e': 'stage', 'hash': 'aaa', 'stage': 'build', 'slot': 0},
+        {'e': 'start', 'hash': 'aaa', 'stage': 'fuzz', 'slot': 0},
+        {'e': 'start', 'hash': 'bbb', 'stage': 'build', 'slot': 1},
+        {'e': 'stage', 'hash': 'bbb', 'stage': 'build', 'slot': 1},
+        {'e': 'start', 'hash': 'ccc', 'stage': 'case', 'slot': 2},
+        {'e': 'finished', 'hash': 'ccc', 'ok': True},
+        {'e': 'crawled'},
+    ]
+    for event in events:
+        state.apply(event)
+    assert state.argv == ['-i', 'cases.json']
+    assert state.stages == stages
+    assert state.crawled
+    assert state.remaining() == ['aaa', 'bbb', 'ddd']
+    assert state.finished() == set(['ccc'])
+    # aaa died in the middle of fuzz, bbb between build and fuzz
+    assert state.started() == [('aaa', 'fuzz', 0), ('bbb', 'fuzz', 1)]
+    assert not state.cases['bbb']['running']
+
+def test_last_stage():
+    state = JournalState()
+    state.apply({'e': 'run', 'stages': ['build', 'fuzz']})
+    state.apply({'e': 'start', 'hash': 'aaa', 'stage': 'fuzz', 'slot': 0})
+    state.apply({'e': 'stage', 'hash': 'aaa', 'stage': 'fuzz', 'slot': 0})
+    # Died before finished was written, it goes on with its last stage
+    assert state.started() == [('aaa', 'fuzz', 0)]
+
+def test_replay(tmp_path):
+    path = os.path.join(str(tmp_path), "work", "journal.jsonl")
+    journal = RunJournal(path)
+    journal.start(['-i', 'cases.json'], stages)
+    journal.append('queued', hash='aaa')
+    journal.append('queued', hash='bbb')
+    journal.append('start', hash='aaa', stage='build', slot=0)
+    journal.close()
+    # A run that died in the middle of writing an event
+    with open(path, 'a') as f:
+        f.write('{"e": "finished", "ha')
+
+    journal = RunJournal(path)
+    state = journal.resume()
+    assert state.remaining() == ['aaa', 'bbb']
+    assert state.started() == [('aaa', 'build', 0)]
+    journal.append('finished', hash='aaa', ok=True)
+    journal.close()
+    state = RunJournal(path).replay()
+    assert state.remaining() == ['bbb']
+    assert state.finished() == set(['aaa'])
+
+    # A new batch puts the old journal aside
+    journal = RunJournal(path)
+    journal.start([], stages)
+    journal.close()
+    assert RunJournal(path).replay().remaining() == []
+    assert RunJournal(path + ".prev").replay().finished() == set(['aaa'])
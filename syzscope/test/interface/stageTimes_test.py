@@ -0,0 +1,87 @@
+import os
+import queue
+import threading
+
+from syzscope.interface.stageTimes import StageTimes, CostModel, CaseQueue, default_stage_costs, features_of
+
+def records(stage, bug_class, cached, walls):
+    return [{'stage': stage, 'bug_class': bug_class, 'cached': cached, 'wall': wall, 'cpu': wall * 2} for wall in walls]
+
+def test_stage_times(tmp_path):
+    times = StageTimes(os.path.join(str(tmp_path), "stage-times.jsonl"))
+    assert times.load() == []
+    times.record('aaa', 'build', 12.34567, 40, {'bug_class': 'uaf', 'cached': False})
+    times.record('aaa', 'fuzz', 100, 300, {'bug_class': 'uaf', 'cached': False}, ok=False)
+    # A line cut short by a crash is skipped
+    with open(times.path, 'a') as f:
+        f.write('{"hash": "bbb", "sta')
+    res = times.load()
+    assert [(each['hash'], each['stage'], each['wall'], each['ok']) for each in res] == [('aaa', 'build', 12.346, True), ('aaa', 'fuzz', 100, False)]
+    assert res[0]['bug_class'] == 'uaf'
+
+def test_cost_model():
+    history = records('build', 'uaf', True, [10, 20, 30]) + records('build', 'uaf', False, [100, 200]) + \
+        records('build', 'warning', False, [1000, 2000, 3000]) + records('fuzz', 'uaf', False, [5, 6])
+    cost = CostModel(history)
+    # The narrowest group with enough samples
+    assert cost.stage_cost('build', {'bug_class': 'uaf', 'cached': True}) == 20
+    # Two uncached uaf builds are too few, all five uaf builds are used
+    assert cost.stage_cost('build', {'bug_class': 'uaf', 'cached': False}) == 30
+    # Then the stage alone, then the default
+    assert cost.stage_cost('build', {'bug_class': 'gpf', 'cached': False}) == 150
+    assert cost.stage_cost('fuzz', {'bug_class': 'uaf', 'cached': False}) == default_stage_costs['fuzz']
+    assert cost.estimate({'bug_class': 'uaf', 'cached': True}, ['build', 'fuzz']) == 20 + default_stage_costs['fuzz']
+    assert CostModel(history, field='cpu').stage_cost('build', {'bug_class': 'uaf', 'cached': True}) == 40
+    assert CostModel([], {'fuzz': 60}).stage_cost('fuzz', {}) == 60
+
+def test_features(tmp_path, monkeypatch):
+    monkeypatch.chdir(str(tmp_path))
+    assert features_of('aaaaaaa123', {'title': 'KASAN: use-after-free Write in f'}) == {'bug_class': 'uaf-write', 'cached': False}
+    os.makedirs(os.path.join("work", "succeed", "aaaaaaa", ".stamp"))
+    open(os.path.join("work", "succeed", "aaaaaaa", ".stamp", "BUILD_KERNEL"), 'w').close()
+    assert features_of('aaaaaaa123', None, 'succeed') == {'bug_class': 'other', 'cached': True}
+
+def drain(q):
+    res = []
+    while not q.empty():
+        res.append(q.get())
+    return res
+
+costs = {'aaa': 30, 'bbb': 10, 'ccc': 20, 'ddd': 10}
+
+def test_case_queue_order():
+    for policy, order in [('fifo', ['aaa', 'bbb', 'ccc', 'ddd']), ('sjf', ['bbb', 'ddd', 'ccc', 'aaa']), ('lpt', ['aaa', 'ccc', 'bbb', 'ddd'])]:
+        q = CaseQueue(policy, costs.get)
+        for hash_val in costs:
+            q.put(hash_val)
+        # Ties keep the queued order
+        assert drain(q) == order
+
+def test_get_matching():
+    q = CaseQueue('sjf', costs.get)
+    for hash_val in costs:
+        q.put(hash_val)
+    # The first case in sjf order that matches, not the first queued one
+    assert q.get_matching(lambda hash_val: hash_val in ['aaa', 'ccc']) == 'ccc'
+    # Nothing matches, the next case in order
+    assert q.get_matching(lambda hash_val: False) == 'bbb'
+    assert drain(q) == ['ddd', 'aaa']
+    try:
+        q.get_matching(lambda hash_val: True, block=False)
+        assert False
+    except queue.Empty:
+        pass
+    try:
+        q.get_matching(lambda hash_val: True, timeout=0.01)
+        assert False
+    except queue.Empty:
+        pass
+
+def test_get_matching_waits():
+    q = CaseQueue()
+    res = []
+    waiter = threading.Thread(target=lambda: res.append(q.get_matching(lambda hash_val: False, timeout=5)))
+    waiter.start()
+    q.put('aaa')
+    waiter.join(5)
+    assert res == ['aaa']
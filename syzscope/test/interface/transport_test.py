@@ -0,0 +1,150 @@
+import os
+import requests
+
+from syzscope.interface import transport
+from syzscope.interface.transport import Transport, AdaptiveLimit, TokenBucket
+
+class FakeResponse:
+    def __init__(self, status_code, headers=None, content=b'page'):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.content = content
+
+class FakeSession:
+    # Answers with the scripted responses in turn, exceptions are raised
+    def __init__(self, answers):
+        self.answers = list(answers)
+        self.urls = []
+
+    def get(self, url, timeout=None):
+        self.urls.append(url)
+        answer = self.answers.pop(0)
+        if isinstance(answer, Exception):
+            raise answer
+        return answer
+
+def make_transport(monkeypatch, answers, **kwargs):
+    sleeps = []
+    monkeypatch.setattr(transport.time, 'sleep', sleeps.append)
+    t = Transport(rate=0, **kwargs)
+    t.session = FakeSession(answers)
+    return t, sleeps
+
+def test_retry(monkeypatch):
+    t, sleeps = make_transport(monkeypatch, [FakeResponse(503), requests.exceptions.ConnectionError(), FakeResponse(200)],
+        backoff_base=1, backoff_max=60)
+    r = t.get("http://syzbot.test/bug?id=aaa")
+    assert r.status_code == 200
+    assert len(t.session.urls) == 3
+    assert t.metrics['retries'] == 2
+    assert t.metrics['errors'] == 2
+    assert t.metrics['requests'] == 1
+    assert t.metrics['bytes'] == 4
+    # Jittered backoff, at most base * 2 ** attempt
+    assert 0 <= sleeps[0] <= 2
+    assert 0 <= sleeps[1] <= 4
+
+def test_retry_after(monkeypatch):
+    t, sleeps = make_transport(monkeypatch, [FakeResponse(429, {'Retry-After': '7'}), FakeResponse(429, {'Retry-After': '3600'}),
+        FakeResponse(429, {'Retry-After': 'Wed, 21 Oct 2015 07:28:00 GMT'}), FakeResponse(200)], backoff_base=1, backoff_max=60)
+    assert t.get("http://syzbot.test/upstream/fixed").status_code == 200
+    assert sleeps[0] == 7
+    # Capped by backoff_max, a date falls back to the backoff
+    assert sleeps[1] == 60
+    assert 0 <= sleeps[2] <= 8
+    assert t.metrics['throttled'] == 3
+
+def test_give_up(monkeypatch):
+    t, sleeps = make_transport(monkeypatch, [FakeResponse(500)] * 3, max_retries=2)
+    # The last response is returned once the retries are used up
+    assert t.get("http://syzbot.test/bug?id=aaa").status_code == 500
+    assert t.metrics['failed'] == 1
+    assert len(sleeps) == 2
+    t, _ = make_transport(monkeypatch, [requests.exceptions.Timeout()] * 3, max_retries=2)
+    try:
+        t.get("http://syzbot.test/bug?id=aaa")
+        assert False
+    except requests.exceptions.Timeout:
+        pass
+    assert t.metrics['failed'] == 1
+
+def test_not_retried(monkeypatch):
+    t, sleeps = make_transport(monkeypatch, [FakeResponse(404)])
+    assert t.get("http://syzbot.test/bug?id=aaa").status_code == 404
+    assert sleeps == []
+
+def test_adaptive_limit_grows():
+    limit = AdaptiveLimit(2, maximum=4)
+    # About one more slot per window of healthy requests
+    for _ in range(0, 3):
+        limit.on_success(1.0)
+    assert int(limit.limit) == 3
+    for _ in range(0, 100):
+        limit.on_success(1.0)
+    assert limit.limit == 4
+
+def test_adaptive_limit_halves():
+    limit = AdaptiveLimit(8, maximum=8)
+    for _ in range(0, 8):
+        limit.on_error()
+    assert limit.limit == 4
+    # Requests that were already in flight fail together, halved once per window
+    limit.on_error()
+    assert limit.limit == 4
+    for _ in range(0, 3):
+        limit.on_error()
+    assert limit.limit == 2
+    for _ in range(0, 10):
+        limit.on_error()
+    assert limit.limit == 1
+
+def test_adaptive_limit_latency():
+    limit = AdaptiveLimit(4, maximum=8)
+    for _ in range(0, 4):
+        limit.on_success(0.1)
+    grown = limit.limit
+    assert grown > 4
+    # Far slower than the best latency counts as congestion
+    limit.on_success(10)
+    assert limit.limit == grown / 2
+    limit.on_success(0.2)
+    assert limit.limit > grown / 2
+
+def test_adaptive_limit_maximum():
+    limit = AdaptiveLimit(8, maximum=8)
+    limit.set_maximum(2)
+    assert limit.limit == 2
+    limit.acquire()
+    limit.acquire()
+    assert limit.in_flight == 2
+    limit.release()
+    assert limit.in_flight == 1
+
+def test_token_bucket(monkeypatch):
+    sleeps = []
+    now = [100.0]
+    monkeypatch.setattr(transport.time, 'monotonic', lambda: now[0])
+    def sleep(seconds):
+        sleeps.append(seconds)
+        now[0] += seconds
+    monkeypatch.setattr(transport.time, 'sleep', sleep)
+    bucket = TokenBucket(2, burst=2)
+    for _ in range(0, 4):
+        bucket.acquire()
+    # The burst goes out at once, then one request every 1 / rate seconds
+    assert sleeps == [0.5, 0.5]
+
+def test_after_fork(monkeypatch):
+    t, _ = make_transport(monkeypatch, [FakeResponse(200)])
+    t.get("http://syzbot.test/bug?id=aaa")
+    t.lock.acquire()
+    pid = os.fork()
+    if pid == 0:
+        # A deploy process starts with its own lock, session and host state
+        ok = t.lock.acquire(timeout=5) and t.metrics['requests'] == 0 and t.buckets == {} and \
+            t.limits == {} and isinstance(t.session, transport.requests.Session)
+        os._exit(0 if ok else 1)
+    _, status = os.waitpid(pid, 0)
+    t.lock.release()
+    assert os.WEXITSTATUS(status) == 0
+    assert t.metrics['requests'] == 1
@@ -0,0 +1,49 @@
+from syzscope.interface.caseDataset import CaseDataset
+from syzscope.interface.utilities import get_median_average
+
+cases = [
+    {'Title': 'KASAN: use-after-free Read in tty_open', 'Patch': 'p1', 'days_patch_commit': 3},
+    {'Title': 'KASAN: use-after-free Read in tty_release', 'Patch': 'p1', 'days_patch_commit': 40},
+    {'Title': 'WARNING in __alloc_pages', 'Patch': 'p2', 'days_patch_commit': 10},
+    {'Title': 'KASAN: out-of-bounds Write in ext4_fill_super', 'Patch': 'p3', 'days_patch_commit': 7},
+    {'Title': 'general protection fault in sock_close', 'Patch': 'p4', 'days_patch_commit': 21},
+    {'Title': 'KASAN: use-after-free Write in sock_close', 'Patch': 'p4', 'days_patch_commit': 1},
+    {'Title': 'KASAN: use-after-free Write in bpf_prog_free', 'Patch': 'p5', 'days_patch_commit': 30},
+]
+
+def loop_median_average(sorted_cases, keyword, bug_name=None):
+    # The loop get_median_average() replaced
+    p = {}
+    unduplicated = []
+    keys = [] if bug_name == None else bug_name.split(' && ')
+    for case in sorted_cases:
+        if case['Patch'] in p:
+            continue
+        if len(keys) > 0 and not any([key in case['Title'] for key in keys]):
+            continue
+        p[case['Patch']] = 1
+        unduplicated.append(case)
+    values = [case[keyword] for case in unduplicated]
+    return values[len(values) // 2], sum(values) / len(values), unduplicated
+
+def test_median_average_all():
+    median, average, unduplicated = get_median_average(cases, 'days_patch_commit')
+    assert [case['Patch'] for case in unduplicated] == ['p1', 'p2', 'p3', 'p4', 'p5']
+    assert median == 7
+    assert average == (3 + 10 + 7 + 21 + 30) / 5
+
+def test_median_average_bug_name():
+    for bug_name in ['use-after-free', 'use-after-free Write && out-of-bounds', 'WARNING']:
+        assert get_median_average(cases, 'days_patch_commit', bug_name) == loop_median_average(cases, 'days_patch_commit', bug_name)
+
+def test_median_average_dataset():
+    dataset = CaseDataset.from_cases(cases)
+    median, average, unduplicated = get_median_average(dataset, 'days_patch_commit', 'use-after-free')
+    assert (median, average) == loop_median_average(cases, 'days_patch_commit', 'use-after-free')[:2]
+    assert isinstance(unduplicated, CaseDataset)
+    assert [case['Patch'] for case in unduplicated.to_cases()] == ['p1', 'p4', 'p5']
+
+def test_titles_missing():
+    dataset = CaseDataset.from_cases([{'Title': 'WARNING in f', 'Patch': 'p1'}, {'Patch': 'p2'}])
+    assert list(dataset.titles()) == ['WARNING in f', '']
+    assert list(dataset.title_contains(['WARNING'])) == [True, False]
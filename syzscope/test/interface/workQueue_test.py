@@ -0,0 +1,48 @@
+import os
+
+from syzscope.interface.workQueue import WorkQueue
+
+def test_lease_order(tmp_path):
+    q = WorkQueue(os.path.join(str(tmp_path), "queue.db"))
+    q.push('aaa', {'title': 'a'})
+    q.push('bbb', {'title': 'b'}, priority=-1)
+    q.push('ccc', {'title': 'c'})
+    # Pushing again refreshes the record but keeps the place in the queue
+    q.push('aaa', {'title': 'a2'})
+    assert q.lease('n1', 60) == ('bbb', {'title': 'b'})
+    assert q.lease('n1', 60) == ('aaa', {'title': 'a2'})
+    assert q.lease('n2', 60) == ('ccc', {'title': 'c'})
+    assert q.lease('n2', 60) == None
+
+def test_complete_and_drain(tmp_path):
+    q = WorkQueue(os.path.join(str(tmp_path), "queue.db"))
+    q.push('aaa', {})
+    q.push('bbb', {})
+    q.close()
+    assert not q.drained()
+    q.lease('n1', 60)
+    q.lease('n1', 60)
+    # Only the node holding the lease can complete a case
+    assert not q.complete('aaa', 'n2', True)
+    assert q.complete('aaa', 'n1', True)
+    assert not q.complete('aaa', 'n1', True)
+    assert not q.drained()
+    assert q.complete('bbb', 'n1', False, "error")
+    assert q.drained()
+    assert q.stats().startswith("0 queued, 0 leased, 1 done, 1 failed")
+    q.reopen()
+    assert not q.drained()
+
+def test_requeue_expired(tmp_path):
+    q = WorkQueue(os.path.join(str(tmp_path), "queue.db"), max_attempts=2)
+    q.push('aaa', {})
+    assert q.lease('n1', -1)[0] == 'aaa'
+    assert q.requeue_expired() == 1
+    # The node that lost the lease can't complete the case any more
+    assert not q.complete('aaa', 'n1', True)
+    assert q.lease('n2', 60)[0] == 'aaa'
+    q.heartbeat('n2', ['aaa'], -1)
+    # Out of attempts, the case fails instead of going back to the queue
+    assert q.requeue_expired() == 0
+    assert q.lease('n3', 60) == None
+    assert q.stats().startswith("0 queued, 0 leased, 0 done, 1 failed")
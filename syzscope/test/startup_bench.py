@@ -0,0 +1,59 @@
+import os
+import subprocess
+import sys
+import time
+
+from syzscope.modules.workerPool import heavy_modules
+
+# Usage: python3 -m syzscope.test.startup_bench [rounds]
+# Run it from the SyzScope folder, the one with syzscope/, tools/ and work/
+
+commands = [
+    ['--help'],
+    ['--get-hash', 'work/completed'],
+    ['--query', '-m', '1'],
+]
+
+# Importing these must not pull in heavy_modules, their stages do
+light_imports = ['syzscope.modules', 'syzscope.modules.deploy.deploy', 'syzscope.modules.crash']
+
+def measure(argv, rounds):
+    best = None
+    for _ in range(0, rounds):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, 'syzscope'] + argv, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        elapsed = time.perf_counter() - start
+        if best == None or elapsed < best:
+            best = elapsed
+    return best
+
+def heavy_imports_of(module):
+    code = "import sys, {}; print(' '.join([m for m in {} if m in sys.modules]))".format(module, heavy_modules)
+    p = subprocess.run([sys.executable, '-c', code], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    if p.returncode != 0:
+        return None
+    return p.stdout.decode('utf-8').split()
+
+if __name__ == '__main__':
+    rounds = 5
+    if len(sys.argv) > 1:
+        rounds = int(sys.argv[1])
+    if not os.path.isdir('syzscope'):
+        print("Run it from the SyzScope folder")
+        sys.exit(1)
+    failed = False
+    for argv in commands:
+        t = measure(argv, rounds)
+        print("syzscope {}: {:.3f}s".format(' '.join(argv), t))
+        if t >= 1:
+            failed = True
+    for module in light_imports:
+        heavy = heavy_imports_of(module)
+        if heavy == None:
+            print("Error: fail to import {}".format(module))
+            failed = True
+        elif heavy != []:
+            print("Error: importing {} loads {}".format(module, ' '.join(heavy)))
+            failed = True
+    if failed:
+        sys.exit(1)